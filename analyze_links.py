@@ -0,0 +1,211 @@
+import os
+import pickle
+import time
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from utils import get_logger, set_log_level
+from utils.config import Config
+from utils.link_graph import (
+    ANALYTICS, CHUNK_HEAD, CHUNK_MAGIC, NODE_KEYS, NODE_URLS, RANK_KEYS, RANK_VALUES, chunk_paths)
+from utils.stats import CrawlStats
+from crawler.shard import ShardedCrawler, shard_path
+import scraper
+
+DAMPING = 0.85
+ITERATIONS = 100
+TOLERANCE = 1e-6    # stop once the ranks move less than this in total (L1)
+TOP_URLS = 20
+
+
+def read_chunk(path):
+    ''' (offsets, sources, targets) of a chunk file, as arrays over a
+    read-only memory map of it. '''
+    data = np.memmap(path, dtype=np.uint8, mode="r")
+    magic, sources, edges = CHUNK_HEAD.unpack(data[:CHUNK_HEAD.size].tobytes())
+    if magic != CHUNK_MAGIC:
+        raise ValueError(f"{path} is not a link graph chunk.")
+    start = CHUNK_HEAD.size
+    offsets = np.frombuffer(data, np.uint64, sources + 1, start)
+    start += offsets.nbytes
+    source_ids = np.frombuffer(data, np.uint32, sources, start)
+    start += source_ids.nbytes
+    return offsets, source_ids, np.frombuffer(data, np.uint32, edges, start)
+
+
+class LinkGraph(object):
+    ''' The link graphs of one or more directories, e.g. the shards of a
+    crawl, as one graph. Node ids are renumbered in the order of the node
+    keys; the edges stay on disk and are read chunk by chunk. '''
+    def __init__(self, paths):
+        self.paths = paths
+        keys = list()
+        self.urls = list()
+        for path in paths:
+            # A writer cuts torn nodes off on open; here they are just skipped.
+            with open(os.path.join(path, NODE_URLS), "rb") as f:
+                urls = f.read().decode("utf-8").split("\n")[:-1]
+            path_keys = np.fromfile(os.path.join(path, NODE_KEYS), dtype=np.uint64)
+            count = min(len(urls), len(path_keys))
+            keys.append(path_keys[:count])
+            self.urls.extend(urls[:count])
+        self.keys, first, inverse = np.unique(
+            np.concatenate(keys), return_index=True, return_inverse=True)
+        self.urls = [self.urls[i] for i in first]
+        self.node_ids = np.split(inverse.astype(np.uint32), np.cumsum([len(k) for k in keys])[:-1])
+        self.chunks = [(i, chunk) for i, path in enumerate(paths) for chunk in chunk_paths(path)]
+
+    def __len__(self):
+        return len(self.keys)
+
+    def edges(self):
+        ''' Yield the (sources, targets) of each chunk, one pair per edge,
+        in the node ids of the whole graph. '''
+        for i, chunk in self.chunks:
+            offsets, sources, targets = read_chunk(chunk)
+            node_ids = self.node_ids[i]
+            yield (node_ids[np.repeat(sources, np.diff(offsets).astype(np.int64))],
+                   node_ids[targets])
+
+    def sources(self):
+        ''' Ids of the nodes whose page was crawled. '''
+        crawled = [self.node_ids[i][read_chunk(chunk)[1]] for i, chunk in self.chunks]
+        return np.unique(np.concatenate(crawled)) if crawled else np.zeros(0, np.uint32)
+
+
+def degrees(graph):
+    ''' (in-degree, out-degree, edge count) of every node. '''
+    in_degree = np.zeros(len(graph), np.int64)
+    out_degree = np.zeros(len(graph), np.int64)
+    edges = 0
+    for sources, targets in graph.edges():
+        in_degree += np.bincount(targets, minlength=len(graph))
+        out_degree += np.bincount(sources, minlength=len(graph))
+        edges += len(targets)
+    return in_degree, out_degree, edges
+
+
+def pagerank(graph, out_degree, damping=DAMPING, iterations=ITERATIONS, tolerance=TOLERANCE):
+    ''' PageRank of every node by power iteration, summing to 1. The rank of
+    nodes without links, which includes every url not crawled, is spread
+    over all the nodes. '''
+    count = len(graph)
+    ranks = np.full(count, 1 / count)
+    dangling = out_degree == 0
+    share = np.where(dangling, 0, 1 / np.maximum(out_degree, 1))
+    for iteration in range(iterations):
+        weights = ranks * share
+        next_ranks = np.zeros(count)
+        for sources, targets in graph.edges():
+            next_ranks += np.bincount(targets, weights=weights[sources], minlength=count)
+        next_ranks = (1 - damping) / count + damping * (next_ranks + ranks[dangling].sum() / count)
+        change = np.abs(next_ranks - ranks).sum()
+        ranks = next_ranks
+        if change < tolerance:
+            break
+    return ranks, iteration + 1
+
+
+def subdomain_links(graph):
+    ''' key: ics.uci.edu subdomain, val: (links out to other hosts, links in
+    from other hosts, links within the host). '''
+    hosts, host_ids = np.unique(
+        [urlsplit(url).hostname or "" for url in graph.urls], return_inverse=True)
+    out_links = np.zeros(len(hosts), np.int64)
+    in_links = np.zeros(len(hosts), np.int64)
+    internal = np.zeros(len(hosts), np.int64)
+    for sources, targets in graph.edges():
+        source_hosts = host_ids[sources]
+        target_hosts = host_ids[targets]
+        same = source_hosts == target_hosts
+        out_links += np.bincount(source_hosts[~same], minlength=len(hosts))
+        in_links += np.bincount(target_hosts[~same], minlength=len(hosts))
+        internal += np.bincount(source_hosts[same], minlength=len(hosts))
+    return {
+        str(host): (int(out_links[i]), int(in_links[i]), int(internal[i]))
+        for i, host in enumerate(hosts)
+        if host.endswith(".ics.uci.edu") and host != "www.ics.uci.edu"}
+
+
+def write(path, data):
+    tmp_file = f"{path}.tmp"
+    with open(tmp_file, "wb") as f:
+        f.write(data)
+    os.replace(tmp_file, path)
+
+
+def main(config_file, link_graphs=None, report_file="report.txt", top=TOP_URLS,
+         damping=DAMPING, iterations=ITERATIONS):
+    ''' Analyze the link graph of a crawl: in-degrees, PageRank and links per
+    ics.uci.edu subdomain. The PageRank is saved in each graph directory for
+    the pagerank PRIORITY scorer and the rest for report.txt, which is
+    written again from the crawl's STATS_FILE. '''
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    set_log_level(config.log_level)
+    logger = get_logger("ANALYZE")
+    if not link_graphs:
+        assert config.link_graph, "Set LINK_GRAPH in the config or give --link_graph"
+        link_graphs = [config.link_graph]
+        if config.shards > 1:
+            link_graphs = [shard_path(config.link_graph, shard_id) for shard_id in range(config.shards)]
+
+    started = time.monotonic()
+    graph = LinkGraph(link_graphs)
+    assert len(graph), f"No link graph in {', '.join(link_graphs)}"
+    in_degree, out_degree, edges = degrees(graph)
+    pages = len(graph.sources())
+    logger.info(
+        f"Loaded {len(graph)} urls, {pages} pages and {edges} links of "
+        f"{len(graph.chunks)} chunks in {time.monotonic() - started:.2f}s.")
+
+    started = time.monotonic()
+    ranks, rounds = pagerank(graph, out_degree, damping, iterations)
+    logger.info(f"Ranked {len(graph)} urls in {rounds} iterations, {time.monotonic() - started:.2f}s.")
+
+    # Relative to the mean, so a rank reads the same whatever the graph size.
+    relative = (ranks * len(graph)).astype(np.float32)
+    top_indegree = np.argsort(-in_degree, kind="stable")[:top]
+    top_pagerank = np.argsort(-ranks, kind="stable")[:top]
+    analytics = {
+        "nodes": len(graph),
+        "pages": pages,
+        "edges": edges,
+        "top_indegree": [(graph.urls[i], int(in_degree[i])) for i in top_indegree],
+        "top_pagerank": [(graph.urls[i], float(relative[i])) for i in top_pagerank],
+        "subdomain_links": subdomain_links(graph),
+    }
+    for path in link_graphs:
+        write(os.path.join(path, RANK_KEYS), graph.keys.astype(np.uint64).tobytes())
+        write(os.path.join(path, RANK_VALUES), relative.tobytes())
+        write(os.path.join(path, ANALYTICS), pickle.dumps(analytics))
+
+    scraper.report_file = report_file
+    if config.shards > 1:
+        ShardedCrawler(config, False).merge(config.shards)
+    elif os.path.exists(config.stats_file):
+        scraper.stats = CrawlStats.from_config(config, False)
+        scraper.link_analytics = analytics
+        scraper.report()
+    else:
+        logger.warning(f"No {config.stats_file} to report; saved the analytics only.")
+        return
+    logger.info(f"Wrote the link analytics into {report_file}.")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--link_graph", type=str, nargs="+", default=None,
+                        help="link graph directories, defaults to LINK_GRAPH of the config and its shards")
+    parser.add_argument("--report_file", type=str, default="report.txt")
+    parser.add_argument("--top", type=int, default=TOP_URLS, help="urls listed by in-degree and by PageRank")
+    parser.add_argument("--damping", type=float, default=DAMPING)
+    parser.add_argument("--iterations", type=int, default=ITERATIONS, help="at most this many PageRank iterations")
+    args = parser.parse_args()
+    main(args.config_file, args.link_graph, args.report_file, args.top, args.damping, args.iterations)
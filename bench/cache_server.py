@@ -0,0 +1,300 @@
+import gzip
+import math
+import pickle
+import random
+import sys
+import time
+import zlib
+
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock
+from urllib.parse import parse_qs, urlencode, urlparse
+
+import cbor
+
+# Pronounceable pseudo words, so page text passes the tokenizer and the stop
+# word list without favouring any real word.
+SYLLABLES = ["ba", "ko", "ri", "ne", "tu", "sa", "mi", "lo", "de", "pa", "gu", "fe"]
+VOCABULARY = [a + b + c for a in SYLLABLES for b in SYLLABLES for c in SYLLABLES]
+
+LATENCY_DISTRIBUTIONS = ("fixed", "exponential", "lognormal", "pareto")
+SITEMAP_CHUNK = 1000    # page ids of a host covered by one of its sitemaps
+
+
+class RawResponse(object):
+    ''' Stands in for the requests.Response pickled by the real cache server. '''
+    def __init__(self, url, content, headers=None):
+        self.url = url
+        self.content = content
+        self.headers = headers or dict()
+
+
+class StubWeb(object):
+    ''' A synthetic web: page n lives on host n % hosts and links to its
+    fanout children n * fanout + 1 onwards, until page_count pages exist.
+
+    Each page is drawn, from a generator seeded by its id, to be:
+    - a duplicate (share duplicates): the text of page n - 1 with its own links;
+    - a trap start (share traps): also links to a calendar of trap_depth
+      days, each linking to the next trap_fanout days. The days have
+      distinct text, or with trap_duplicates the same text, like an empty
+      calendar;
+    - redirected (share redirects): its parent links to it through a chain
+      of 1 to redirect_hops redirects;
+    - changing (share changes): its text is new in every epoch, which a
+      recrawl bumps.
+    With etags every page is served with an ETag of its content. With
+    sitemaps every host's robots.txt names a sitemap index of its sitemaps,
+    gzipped every other one, which list that share of the host's pages. '''
+    def __init__(self, hosts=8, fanout=5, page_count=1000, domain="ics.uci.edu",
+                 words=300, duplicates=0.0, traps=0.0, trap_depth=100, trap_fanout=1,
+                 trap_duplicates=False, redirects=0.0, redirect_hops=3, changes=0.0,
+                 etags=False, sitemaps=0.0, seed=0):
+        self.hosts = hosts
+        self.fanout = fanout
+        self.page_count = page_count
+        self.domain = domain
+        self.words = words
+        self.duplicates = duplicates
+        self.traps = traps
+        self.trap_depth = trap_depth
+        self.trap_fanout = trap_fanout
+        self.trap_duplicates = trap_duplicates
+        self.redirects = redirects
+        self.redirect_hops = redirect_hops
+        self.changes = changes
+        self.etags = etags
+        self.sitemaps = sitemaps
+        self.epoch = 0
+        self.seed = seed
+
+    def host(self, page_id):
+        return f"h{page_id % self.hosts}.{self.domain}"
+
+    def url(self, page_id):
+        return f"https://{self.host(page_id)}/pages/n{page_id}"
+
+    def _rng(self, *key):
+        return random.Random("/".join(map(str, (self.seed,) + key)))
+
+    def _roles(self, page_id):
+        ''' (duplicate, trap, redirect hops) of a page. '''
+        rng = self._rng(page_id)
+        duplicate = rng.random() < self.duplicates and page_id > 0
+        trap = rng.random() < self.traps
+        hops = rng.randint(1, self.redirect_hops) if rng.random() < self.redirects else 0
+        return duplicate, trap, hops
+
+    def _changing(self, page_id):
+        return self._rng("change", page_id).random() < self.changes
+
+    def link(self, page_id):
+        ''' The url a parent page links to page_id with. '''
+        hops = self._roles(page_id)[2]
+        if hops:
+            return f"https://{self.host(page_id)}/go/n{page_id}?hops={hops}"
+        return self.url(page_id)
+
+    def _sitemap(self, path, host_id):
+        ''' (kind, body) of robots.txt, the sitemap index or a sitemap of a
+        host, or None. '''
+        host = self.host(host_id)
+        page_ids = range(host_id, self.page_count, self.hosts)
+        chunks = math.ceil(len(page_ids) / SITEMAP_CHUNK)
+        if path == "/robots.txt":
+            return "robots", f"User-agent: *\nAllow: /\nSitemap: https://{host}/sitemap_index.xml\n".encode()
+        namespace = 'xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"'
+        if path == "/sitemap_index.xml":
+            entries = "".join(
+                f"<sitemap><loc>https://{host}/sitemaps/{chunk}.xml{'.gz' if chunk % 2 else ''}</loc></sitemap>\n"
+                for chunk in range(chunks))
+            return "sitemap", f"<?xml version='1.0'?>\n<sitemapindex {namespace}>\n{entries}</sitemapindex>".encode()
+        if not path.startswith("/sitemaps/"):
+            return None
+        name = path[10:]
+        try:
+            chunk = int(name.split(".")[0])
+        except ValueError:
+            return None
+        if not 0 <= chunk < chunks or name != f"{chunk}.xml{'.gz' if chunk % 2 else ''}":
+            return None
+        entries = list()
+        for page_id in page_ids[chunk * SITEMAP_CHUNK:(chunk + 1) * SITEMAP_CHUNK]:
+            rng = self._rng("sitemap", page_id)
+            if rng.random() < self.sitemaps:
+                entries.append(
+                    f"<url><loc>{self.url(page_id)}</loc><lastmod>2024-01-01</lastmod>"
+                    f"<priority>{rng.random():.1f}</priority></url>\n")
+        body = f"<?xml version='1.0'?>\n<urlset {namespace}>\n{''.join(entries)}</urlset>".encode()
+        return "sitemap", gzip.compress(body) if chunk % 2 else body
+
+    def _text(self, *key):
+        rng = self._rng("text", *key)
+        words = rng.choices(VOCABULARY, k=self.words)
+        return "\n".join(
+            "<p>" + " ".join(words[i:i + 50]) + "</p>"
+            for i in range(0, len(words), 50))
+
+    def _html(self, title, text, links):
+        anchors = "".join(f'<a href="{link}">next</a>\n' for link in links)
+        return (
+            f"<html><head><title>{title}</title></head><body>\n"
+            f"{text}\n{anchors}</body></html>").encode("utf-8")
+
+    def page(self, url):
+        ''' (kind, body) for the url or None if there is no such page. kind
+        is page, duplicate or trap with the html as body, redirect with the
+        url redirected to as body, or robots or sitemap. '''
+        parsed = urlparse(url)
+        path = parsed.path
+        if self.sitemaps and (path == "/robots.txt" or path.startswith("/sitemap")):
+            try:
+                host_id = int(parsed.hostname.split(".")[0][1:])
+            except (AttributeError, ValueError):
+                return None
+            if not 0 <= host_id < self.hosts or parsed.hostname != self.host(host_id):
+                return None
+            return self._sitemap(path, host_id)
+        try:
+            if path.startswith("/pages/n"):
+                page_id = int(path[8:])
+                kind = "page"
+            elif path.startswith("/go/n"):
+                page_id = int(path[5:])
+                kind = "redirect"
+            elif path.startswith("/calendar/n"):
+                page_id = int(path[11:])
+                kind = "trap"
+            else:
+                return None
+        except ValueError:
+            return None
+        if not 0 <= page_id < self.page_count or parsed.hostname != self.host(page_id):
+            return None
+        duplicate, trap, hops = self._roles(page_id)
+
+        if kind == "redirect":
+            left = int(parse_qs(parsed.query).get("hops", ["0"])[0])
+            if not 0 < left <= hops:
+                return None
+            if left == 1:
+                return "redirect", self.url(page_id)
+            return "redirect", f"https://{parsed.hostname}/go/n{page_id}?hops={left - 1}"
+
+        if kind == "trap":
+            day = int(parse_qs(parsed.query).get("day", ["-1"])[0])
+            if not trap or not 0 <= day < self.trap_depth:
+                return None
+            links = [
+                f"https://{parsed.hostname}/calendar/n{page_id}?day={next_day}"
+                for next_day in range(day + 1, min(day + 1 + self.trap_fanout, self.trap_depth))]
+            text = self._text(page_id, "calendar" if self.trap_duplicates else day)
+            return "trap", self._html(f"Calendar {page_id}", text, links)
+
+        first = page_id * self.fanout + 1
+        links = [self.link(i) for i in range(first, min(first + self.fanout, self.page_count))]
+        if trap:
+            links.append(f"https://{parsed.hostname}/calendar/n{page_id}?day=0")
+        text_id = page_id - 1 if duplicate else page_id
+        text = self._text(text_id, self.epoch) if self._changing(text_id) else self._text(text_id)
+        return ("duplicate" if duplicate else "page"), self._html(f"Page {page_id}", text, links)
+
+    def headers(self, body):
+        if not self.etags:
+            return None
+        return {"ETag": f'"{zlib.crc32(body):08x}"'}
+
+
+class CacheServer(ThreadingHTTPServer):
+    ''' Speaks the cache server protocol: GET /?q=<url>&u=<useragent> answered
+    with a cbor dict of url, status and the pickled raw response. Redirects
+    of the stub web are answered with a 302 to the cache url of their target.
+
+    Every answer waits a latency drawn from latency_dist with mean latency
+    seconds first. Responses per kind, their order and their latencies are
+    recorded. '''
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, web, latency=0.0, latency_dist="exponential", address=("127.0.0.1", 0)):
+        assert latency_dist in LATENCY_DISTRIBUTIONS, f"latency_dist should be one of {LATENCY_DISTRIBUTIONS}"
+        self.web = web
+        self.latency = latency
+        self.latency_dist = latency_dist
+        self.lock = Lock()
+        self.kinds = Counter()      # key: kind of response, val: responses sent
+        self.latencies = list()     # seconds taken by each response
+        self.order = list()     # kind of each response, in the order sent
+        super().__init__(address, CacheRequestHandler)
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True).start()
+        return self.server_address
+
+    def delay(self):
+        mean = self.latency
+        if not mean:
+            return 0.0
+        if self.latency_dist == "fixed":
+            return mean
+        if self.latency_dist == "exponential":
+            return random.expovariate(1 / mean)
+        if self.latency_dist == "lognormal":
+            # A heavy tail with the same mean: sigma 1, mu shifted by -sigma^2 / 2.
+            return random.lognormvariate(math.log(mean) - 0.5, 1.0)
+        # Pareto with shape 2.5, scaled to the mean; the heaviest tail here.
+        return mean * 0.6 * random.paretovariate(2.5)
+
+    def handle_error(self, request, client_address):
+        # A client hanging up, e.g. on a reply too large, is not an error here.
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+    def record(self, kind, seconds):
+        with self.lock:
+            self.kinds[kind] += 1
+            self.latencies.append(seconds)
+            self.order.append(kind)
+
+
+class CacheRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Replies on a keep-alive connection would otherwise wait out Nagle's
+    # algorithm and the client's delayed ACK, tens of ms each.
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        started = time.monotonic()
+        params = parse_qs(urlparse(self.path).query)
+        url = params.get("q", [""])[0]
+        delay = self.server.delay()
+        if delay:
+            time.sleep(delay)
+        found = self.server.web.page(url)
+        if found is not None and found[0] == "redirect":
+            location = "/?" + urlencode([("q", found[1]), ("u", params.get("u", [""])[0])])
+            self.send_response(302)
+            self.send_header("Location", location)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            self.server.record("redirect", time.monotonic() - started)
+            return
+        if found is None:
+            kind = "missing"
+            resp = {"url": url, "status": 404,
+                    "response": pickle.dumps(RawResponse(url, b""))}
+        else:
+            kind = found[0]
+            headers = self.server.web.headers(found[1])
+            resp = {"url": url, "status": 200,
+                    "response": pickle.dumps(RawResponse(url, found[1], headers))}
+        body = cbor.dumps(resp)
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.record(kind, time.monotonic() - started)
+
+    def log_message(self, format, *args):
+        pass
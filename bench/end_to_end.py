@@ -0,0 +1,205 @@
+''' Crawl a synthetic web through the local stub cache server with launch.py
+and report pages/sec, server and download latency, CPU and peak RSS.
+
+    python -m bench.end_to_end --pages 2000 --hosts 16 --duplicates 0.05 \
+        --traps 0.01 --redirects 0.05 --latency 0.02 --latency-dist lognormal \
+        --set "CRAWLER:POLITENESS=0" --set "LOCAL PROPERTIES:THREADCOUNT=8"
+
+The crawler runs as its own process with the settings of --config_file, so
+CPU and RSS are its own; --set overrides single options. The seed, domains
+and save files are pointed at the stub web and a scratch directory, which
+--workdir keeps (with the logs and report.txt) instead of a temporary one.
+Server latencies are measured by the stub server, from reading a request to
+writing its answer; download latencies by the crawler, around each request
+to the stub, from the metrics summary it logs last. --budget also reports
+the kinds of the first so many responses, which shows how soon the crawl
+order reaches the real pages.
+
+With --recrawl every run sets RECRAWL on, which keeps the page records, and
+RECRAWL_MIN_SECONDS to 0, and the crawl is resumed a second time after the
+pages of share --changes got new text; that run is reported too. --resume
+resumes the crawl once more, which with a short --timeout shows how fast a
+stopped crawl restarts; --timeout interrupts the crawl like Ctrl-C. With
+--sitemaps the robots.txt of every host names sitemaps listing that share of
+its pages. '''
+import os
+import re
+import resource
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from collections import Counter
+from configparser import ConfigParser
+
+from bench.cache_server import CacheServer, StubWeb, LATENCY_DISTRIBUTIONS
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PAGE_KINDS = ("page", "duplicate", "trap")
+# Log lines on how long the crawler took to start, printed with the results.
+STARTUP_LINES = re.compile(r"Started in |Handed out the first url|urls to be downloaded from")
+# The download stage of the metrics summary the crawler logs as it stops,
+# one per shard.
+DOWNLOAD_SUMMARY = re.compile(
+    r"Metrics of the crawl: .*\| download (\d+) x ([\d.]+)ms "
+    r"\(p50 <= ([\d.]+)ms, p99 <= ([\d.]+)ms\)")
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def write_config(config_file, path, web, overrides):
+    cparser = ConfigParser()
+    cparser.optionxform = str
+    cparser.read(config_file)
+    cparser["CRAWLER"]["SEEDURL"] = web.url(0)
+    cparser["CRAWLER"]["DOMAINS"] = web.domain
+    cparser["CRAWLER"]["SITEMAPS"] = ""
+    cparser["LOCAL PROPERTIES"]["SAVE"] = "frontier.journal"
+    cparser["LOCAL PROPERTIES"]["STATS_FILE"] = "stats.pickle"
+    for override in overrides:
+        option, value = override.split("=", 1)
+        section, key = option.split(":", 1)
+        cparser[section][key] = value
+    with open(path, "w") as f:
+        cparser.write(f)
+
+
+def run(web, latency, latency_dist, config_file, overrides, workdir, timeout,
+        profile=None, budget=0, restart=True):
+    server = CacheServer(web, latency=latency, latency_dist=latency_dist)
+    host, port = server.start()
+    crawl_config = os.path.join(workdir, "config.ini")
+    write_config(config_file, crawl_config, web, overrides)
+
+    command = [sys.executable, os.path.join(ROOT, "launch.py"),
+               "--config_file", crawl_config, "--cache_server", f"{host}:{port}"]
+    if restart:
+        command.append("--restart")
+    if profile:
+        command += ["--profile", profile]
+
+    # Children add up over runs, so only this run's share is reported.
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    with open(os.path.join(workdir, "crawl.log"), "w") as log:
+        started = time.monotonic()
+        crawl = subprocess.Popen(command, cwd=workdir, stdout=log, stderr=subprocess.STDOUT)
+        try:
+            crawl.wait(timeout)
+        except subprocess.TimeoutExpired:
+            print(f"crawl did not finish in {timeout}s, interrupting it")
+            # Like Ctrl-C: the crawler saves its frontier before it exits.
+            crawl.send_signal(signal.SIGINT)
+            try:
+                crawl.wait(60)
+            except subprocess.TimeoutExpired:
+                crawl.terminate()
+                crawl.wait()
+        elapsed = time.monotonic() - started
+    server.shutdown()
+    # Only the crawl, and the parse processes it waited for, are children.
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+
+    with server.lock:
+        kinds = dict(server.kinds)
+        latencies = list(server.latencies)
+        order = list(server.order)
+    pages = sum(kinds.get(kind, 0) for kind in PAGE_KINDS)
+    cpu = usage.ru_utime + usage.ru_stime - before.ru_utime - before.ru_stime
+    print(f"hosts={web.hosts} pages={web.page_count} fanout={web.fanout} "
+          f"latency={latency}s ({latency_dist}) exit code {crawl.returncode}")
+    print(f"  responses: {kinds}")
+    print(f"  crawled {pages} pages in {elapsed:.2f}s -> {pages / elapsed:.1f} pages/sec")
+    if budget:
+        print(f"  first {budget} responses: {dict(Counter(order[:budget]))}")
+    print(f"  server latency: p50 {percentile(latencies, 0.5) * 1000:.1f} ms, "
+          f"p99 {percentile(latencies, 0.99) * 1000:.1f} ms")
+    print(f"  cpu: {cpu:.2f}s ({cpu / elapsed:.0%} of one core)")
+    # ru_maxrss is in KiB on Linux.
+    print(f"  peak rss: {usage.ru_maxrss / 1024:.1f} MiB")
+    with open(os.path.join(workdir, "crawl.log")) as log:
+        lines = log.readlines()
+    for match in filter(None, map(DOWNLOAD_SUMMARY.search, lines)):
+        count, mean, p50, p99 = match.groups()
+        print(f"  download latency: {count} downloads, mean {mean} ms, "
+              f"p50 <= {p50} ms, p99 <= {p99} ms")
+    for line in lines:
+        if STARTUP_LINES.search(line):
+            print("  " + line.split(" - INFO - ", 1)[-1].rstrip())
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", default=os.path.join(ROOT, "config.ini"))
+    parser.add_argument("--set", action="append", default=list(), dest="overrides",
+                        metavar="SECTION:KEY=VALUE", help="override a config option")
+    parser.add_argument("--workdir", help="keep the crawl files here")
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--hosts", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=500)
+    parser.add_argument("--fanout", type=int, default=5)
+    parser.add_argument("--words", type=int, default=300, help="words of text per page")
+    parser.add_argument("--duplicates", type=float, default=0.0)
+    parser.add_argument("--traps", type=float, default=0.0)
+    parser.add_argument("--trap-depth", type=int, default=100)
+    parser.add_argument("--trap-fanout", type=int, default=1, help="days each trap day links to")
+    parser.add_argument("--trap-duplicates", action="store_true",
+                        help="give the days of a trap the same text")
+    parser.add_argument("--redirects", type=float, default=0.0)
+    parser.add_argument("--redirect-hops", type=int, default=3)
+    parser.add_argument("--changes", type=float, default=0.0,
+                        help="share of pages whose text changes before a recrawl")
+    parser.add_argument("--etags", action="store_true", help="serve pages with an ETag")
+    parser.add_argument("--sitemaps", type=float, default=0.0,
+                        help="share of pages listed in the sitemaps named by robots.txt")
+    parser.add_argument("--resume", action="store_true",
+                        help="then resume the crawl, e.g. one stopped by --timeout, and report that run too")
+    parser.add_argument("--recrawl", action="store_true",
+                        help="then recrawl every page and report that run too")
+    parser.add_argument("--latency", type=float, default=0.02, help="mean seconds per fetch")
+    parser.add_argument("--latency-dist", default="exponential", choices=LATENCY_DISTRIBUTIONS)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profile", choices=["cprofile", "sample"],
+                        help="profile the crawl; the profile is written to --workdir")
+    parser.add_argument("--budget", type=int, default=0,
+                        help="also report the kinds of the first so many responses")
+    args = parser.parse_args()
+
+    web = StubWeb(
+        hosts=args.hosts, fanout=args.fanout, page_count=args.pages, words=args.words,
+        duplicates=args.duplicates, traps=args.traps, trap_depth=args.trap_depth,
+        trap_fanout=args.trap_fanout, trap_duplicates=args.trap_duplicates,
+        redirects=args.redirects, redirect_hops=args.redirect_hops,
+        changes=args.changes, etags=args.etags, sitemaps=args.sitemaps, seed=args.seed)
+    overrides = args.overrides
+    if args.recrawl:
+        # Pages are recorded from the first run and due for a revisit right away.
+        overrides = overrides + ["CRAWLER:RECRAWL=true", "CRAWLER:RECRAWL_MIN_SECONDS=0"]
+
+    def crawl(workdir, profile=None):
+        run(web, args.latency, args.latency_dist, args.config_file,
+            overrides, workdir, args.timeout, profile, args.budget)
+        if args.resume:
+            print("resume:")
+            run(web, args.latency, args.latency_dist, args.config_file,
+                overrides, workdir, args.timeout, profile, args.budget, restart=False)
+        if args.recrawl:
+            web.epoch += 1
+            print("recrawl:")
+            run(web, args.latency, args.latency_dist, args.config_file,
+                overrides, workdir, args.timeout, profile, args.budget, restart=False)
+
+    if args.workdir:
+        os.makedirs(args.workdir, exist_ok=True)
+        crawl(args.workdir, args.profile)
+        print(f"  logs and report.txt in {args.workdir}")
+    else:
+        with tempfile.TemporaryDirectory() as workdir:
+            crawl(workdir)
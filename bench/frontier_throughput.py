@@ -0,0 +1,101 @@
+''' Crawl a stub cache server with the frontier and report throughput.
+
+    python -m bench.frontier_throughput --threads 8 --hosts 8 --politeness 0.5
+
+Workers here only download and enqueue the links of each stub page, so the
+numbers measure the frontier, its per-host politeness and the download path
+rather than the scraper rules. '''
+import os
+import re
+import tempfile
+import time
+
+from argparse import ArgumentParser
+from collections import defaultdict
+from configparser import ConfigParser
+from threading import Thread, Lock
+from urllib.parse import urlparse
+
+from bench.cache_server import CacheServer, StubWeb
+from crawler.frontier import Frontier
+from utils import get_logger
+from utils.config import Config
+from utils.download import download
+
+LINK_PATTERN = re.compile(rb'href="([^"]+)"')
+
+
+def make_config(save_file, threads, politeness, web):
+    cparser = ConfigParser()
+    cparser.read_dict({
+        "IDENTIFICATION": {"USERAGENT": "IR bench"},
+        "CONNECTION": {"HOST": "127.0.0.1", "PORT": "0"},
+        "CRAWLER": {"SEEDURL": web.url(0), "POLITENESS": str(politeness)},
+        "LOCAL PROPERTIES": {"SAVE": save_file, "THREADCOUNT": str(threads)}})
+    return Config(cparser)
+
+
+def run(threads, hosts, pages, fanout, politeness, latency):
+    web = StubWeb(hosts=hosts, fanout=fanout, page_count=pages)
+    server = CacheServer(web, latency=latency)
+    logger = get_logger("BENCH")
+    with tempfile.TemporaryDirectory() as tmp:
+        config = make_config(
+            os.path.join(tmp, "frontier.journal"), threads, politeness, web)
+        config.cache_server = server.start()
+        frontier = Frontier(config, restart=True)
+
+        fetches = defaultdict(list)     # key: host, val: (start, end) of each fetch
+        fetches_lock = Lock()
+
+        def work():
+            while True:
+                url = frontier.get_tbd_url()
+                if not url:
+                    return
+                start = time.monotonic()
+                resp = download(url, config, logger)
+                end = time.monotonic()
+                with fetches_lock:
+                    fetches[urlparse(url).netloc].append((start, end))
+                if resp.status == 200:
+                    for link in LINK_PATTERN.findall(resp.raw_response.content):
+                        frontier.add_url(link.decode("utf-8"))
+                frontier.mark_url_complete(url)
+
+        started = time.monotonic()
+        workers = [Thread(target=work, daemon=True) for _ in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.monotonic() - started
+        server.shutdown()
+        frontier.close()
+
+    fetched = sum(len(times) for times in fetches.values())
+    # Smallest gap between the end of one fetch and the start of the next on
+    # the same host; must not be below the politeness interval.
+    min_gap = min(
+        (later[0] - earlier[1]
+         for times in fetches.values()
+         for earlier, later in zip(sorted(times), sorted(times)[1:])),
+        default=float("inf"))
+    print(f"threads={threads} hosts={hosts} politeness={politeness}s "
+          f"latency={latency}s")
+    print(f"  fetched {fetched} pages in {elapsed:.2f}s "
+          f"-> {fetched / elapsed:.1f} pages/sec")
+    print(f"  smallest same-host gap: {min_gap:.3f}s")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--hosts", type=int, default=8)
+    parser.add_argument("--pages", type=int, default=200)
+    parser.add_argument("--fanout", type=int, default=5)
+    parser.add_argument("--politeness", type=float, default=0.5)
+    parser.add_argument("--latency", type=float, default=0.05)
+    args = parser.parse_args()
+    run(args.threads, args.hosts, args.pages, args.fanout,
+        args.politeness, args.latency)
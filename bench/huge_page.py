@@ -0,0 +1,40 @@
+''' Time and peak memory of parsing one huge page with each parser backend.
+
+    python -m bench.huge_page --words 184164
+
+The default size matches the Informatics brochure, the longest page in
+report.txt. '''
+import gc
+import time
+import tracemalloc
+
+from argparse import ArgumentParser
+
+from bench.parse_throughput import synthetic_page
+from scraper import parse_page
+
+
+def measure(url, content, parser):
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    page = parse_page(url, content, parser)
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"  {parser:12} {elapsed:6.2f}s  peak {peak / 2 ** 20:7.1f} MiB  "
+          f"{page.token_count} tokens, {len(page.links)} links")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--words", type=int, default=184164)
+    parser.add_argument("--links", type=int, default=2000)
+    parser.add_argument("--parsers", default="stream,html.parser")
+    args = parser.parse_args()
+
+    url = "http://www.informatics.uci.edu/files/pdf/InformaticsBrochure-March2018"
+    content = synthetic_page(0, args.words, args.links)
+    print(f"page of {args.words} words, {len(content) / 2 ** 20:.1f} MiB")
+    for backend in args.parsers.split(","):
+        measure(url, content, backend)
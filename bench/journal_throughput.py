@@ -0,0 +1,72 @@
+''' Compare adds/sec of the frontier journal with the old shelve save file.
+
+    python -m bench.journal_throughput --urls 20000
+
+The shelve backend is driven the way the frontier used to drive it: one
+assignment and one sync() per added url. The journal is then replayed to
+show how long a resume of that many urls takes. '''
+import os
+import shelve
+import tempfile
+import time
+
+from argparse import ArgumentParser
+
+from crawler.journal import FrontierJournal
+from utils import get_urlhash
+
+
+def synthetic_urls(count):
+    return [
+        f"https://h{i % 64}.ics.uci.edu/people/{i}/index.html"
+        for i in range(count)]
+
+
+def bench_shelve(path, urls):
+    save = shelve.open(path)
+    started = time.perf_counter()
+    for url in urls:
+        save[get_urlhash(url)] = (url, False)
+        save.sync()
+    elapsed = time.perf_counter() - started
+    save.close()
+    return elapsed
+
+
+def bench_journal(path, urls, commit_records, commit_ms):
+    journal = FrontierJournal(
+        path, commit_records=commit_records, commit_interval=commit_ms / 1000)
+    journal.open()
+    started = time.perf_counter()
+    for url in urls:
+        journal.append(bytes.fromhex(get_urlhash(url)), url, False)
+    journal.close()
+    elapsed = time.perf_counter() - started
+
+    started = time.perf_counter()
+    replayed = sum(1 for _ in FrontierJournal(path).replay())
+    return elapsed, replayed, time.perf_counter() - started
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=20000)
+    parser.add_argument("--shelve-urls", type=int, default=2000,
+                        help="shelve is slow, so it gets a smaller sample")
+    parser.add_argument("--commit-records", type=int, default=1000)
+    parser.add_argument("--commit-ms", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        urls = synthetic_urls(args.urls)
+        shelve_count = min(args.shelve_urls, args.urls)
+        elapsed = bench_shelve(os.path.join(tmp, "frontier.shelve"), urls[:shelve_count])
+        print(f"shelve:  {shelve_count} adds in {elapsed:.2f}s "
+              f"-> {shelve_count / elapsed:,.0f} adds/sec")
+        elapsed, replayed, replay_time = bench_journal(
+            os.path.join(tmp, "frontier.journal"), urls,
+            args.commit_records, args.commit_ms)
+        print(f"journal: {args.urls} adds in {elapsed:.2f}s "
+              f"-> {args.urls / elapsed:,.0f} adds/sec")
+        print(f"replay:  {replayed} records in {replay_time:.2f}s "
+              f"-> {replayed / replay_time:,.0f} records/sec")
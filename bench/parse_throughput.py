@@ -0,0 +1,68 @@
+''' Measure pages/sec of scraper.parse_page inline and in a process pool.
+
+    python -m bench.parse_throughput --pages 400 --processes 4 --parser lxml
+'''
+import random
+import time
+
+from argparse import ArgumentParser
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from scraper import parse_page
+
+WORDS = (
+    "research students faculty computer science informatics data systems "
+    "learning software graduate undergraduate course lecture project school "
+    "the and of to in for with on at from by about as an or").split()
+
+
+def synthetic_page(page_id, words, links):
+    rng = random.Random(page_id)
+    paragraphs = "\n".join(
+        "<p>" + " ".join(rng.choice(WORDS) for _ in range(50)) + "</p>"
+        for _ in range(words // 50))
+    anchors = "\n".join(
+        f'<li><a href="/people/{rng.randrange(10 ** 6)}#top">link {i}</a></li>'
+        for i in range(links))
+    return (
+        f"<html><head><title>Page {page_id}</title>"
+        f"<script>var page = {page_id};</script></head><body>"
+        f"<nav><ul>{anchors}</ul></nav>{paragraphs}</body></html>").encode("utf-8")
+
+
+def run(pages, processes, parser, words, links):
+    corpus = [
+        (f"https://www.ics.uci.edu/page/{i}", synthetic_page(i, words, links))
+        for i in range(pages)]
+    size = sum(len(content) for _, content in corpus)
+    print(f"{pages} pages, {size / pages / 1024:.0f} KiB each, parser={parser}")
+
+    started = time.perf_counter()
+    for url, content in corpus:
+        parse_page(url, content, parser)
+    inline = pages / (time.perf_counter() - started)
+    print(f"  inline:        {inline:8.1f} pages/sec on 1 core")
+
+    with ProcessPoolExecutor(processes, mp_context=get_context("spawn")) as pool:
+        # Start the processes before timing.
+        list(pool.map(parse_page, [corpus[0][0]] * processes,
+                      [corpus[0][1]] * processes, [parser] * processes))
+        started = time.perf_counter()
+        futures = [pool.submit(parse_page, url, content, parser) for url, content in corpus]
+        for future in futures:
+            future.result()
+        pooled = pages / (time.perf_counter() - started)
+    print(f"  {processes} processes:  {pooled:8.1f} pages/sec, "
+          f"{pooled / processes:.1f} pages/sec per core")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=400)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--parser", default="stream")
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--links", type=int, default=100)
+    args = parser.parse_args()
+    run(args.pages, args.processes, args.parser, args.words, args.links)
@@ -0,0 +1,99 @@
+''' Peak memory of downloading one large page through the cache server
+protocol, per way of decoding the reply.
+
+    python -m bench.response_memory --words 1000000 --max-bytes 0
+
+- eager: the decoding before lazy responses; the reply, the pickled
+  response decoded from it and the page unpickled from that are all alive
+  at once;
+- lazy: utils.download.download, then the page is read from the Response;
+- stream: the same with STREAM, decoding the reply while it is read.
+The stub cache server runs in another process so only the downloading side
+is traced. With --max-bytes below the page size the page is dropped, which
+shows how much of it was read first. '''
+import gc
+import pickle
+import tracemalloc
+
+from argparse import ArgumentParser
+from configparser import ConfigParser
+from multiprocessing import get_context
+
+import cbor
+
+from bench.cache_server import CacheServer, StubWeb
+from utils import get_logger
+from utils.config import Config
+from utils.download import download, _session
+
+MODES = ("eager", "lazy", "stream")
+
+
+def serve(words, addresses):
+    server = CacheServer(StubWeb(hosts=1, page_count=1, words=words))
+    addresses.put(server.start())
+    server.serve_forever()
+
+
+def make_config(address, max_bytes, stream):
+    cparser = ConfigParser()
+    cparser.read_dict({
+        "IDENTIFICATION": {"USERAGENT": "IR bench"},
+        "CONNECTION": {"HOST": "127.0.0.1", "PORT": "0", "STREAM": str(stream)},
+        "CRAWLER": {"SEEDURL": "https://h0.ics.uci.edu/pages/n0", "POLITENESS": "0",
+                    "MAX_PAGE_BYTES": str(max_bytes)},
+        "LOCAL PROPERTIES": {"SAVE": "unused", "THREADCOUNT": "1"}})
+    config = Config(cparser)
+    config.cache_server = address
+    return config
+
+
+def fetch(mode, url, config, logger):
+    ''' The page downloaded in mode, or None if it was dropped. '''
+    if mode == "eager":
+        host, port = config.cache_server
+        resp = _session().get(f"http://{host}:{port}/", params=[("q", url), ("u", config.user_agent)])
+        resp_dict = cbor.loads(resp.content)
+        raw_response = pickle.loads(resp_dict["response"])
+        return raw_response.content
+    return download(url, config, logger).content
+
+
+def measure(mode, url, config, logger):
+    fetch(mode, url, config, logger)    # warm up the connection
+    gc.collect()
+    tracemalloc.start()
+    content = fetch(mode, url, config, logger)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak, len(content) if content else 0
+
+
+def run(words, max_bytes):
+    context = get_context("spawn")
+    addresses = context.Queue()
+    server = context.Process(target=serve, args=(words, addresses), daemon=True)
+    server.start()
+    address = addresses.get()
+    logger = get_logger("BENCH")
+    url = StubWeb(hosts=1, page_count=1).url(0)
+    try:
+        for mode in MODES:
+            config = make_config(address, max_bytes, mode == "stream")
+            peak, size = measure(mode, url, config, logger)
+            if size:
+                print(f"  {mode:7} page {size / 2 ** 20:6.1f} MiB  peak {peak / 2 ** 20:6.1f} MiB "
+                      f"({peak / size:.2f}x the page)")
+            else:
+                print(f"  {mode:7} page dropped          peak {peak / 2 ** 20:6.1f} MiB")
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--words", type=int, default=1000000, help="words of text on the page")
+    parser.add_argument("--max-bytes", type=int, default=0,
+                        help="MAX_PAGE_BYTES; 0 keeps every page")
+    args = parser.parse_args()
+    run(args.words, args.max_bytes)
@@ -0,0 +1,53 @@
+''' Report memory per url and lookup speed of the frontier seen sets.
+
+    python -m bench.seen_set_memory --urls 10000000 --mode compact --bloom
+'''
+import time
+
+from argparse import ArgumentParser
+
+from crawler.seen import BloomFilter, CompactSeenSet, HashSeenSet, SeenSet
+from utils import get_urldigest
+
+
+def digests(count, offset=0):
+    for i in range(offset, offset + count):
+        yield get_urldigest(f"https://h{i % 64}.ics.uci.edu/people/{i}")
+
+
+def run(count, mode, bloom, lookups):
+    exact = CompactSeenSet() if mode == "compact" else HashSeenSet()
+    seen = SeenSet(exact, BloomFilter(count) if bloom else None)
+
+    started = time.perf_counter()
+    seen.load(digests(count))
+    load_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for digest in digests(lookups // 2):
+        assert digest in seen
+    for digest in digests(lookups // 2, offset=count):
+        digest in seen
+    lookup_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for digest in digests(lookups, offset=2 * count):
+        seen.add(digest)
+    add_time = time.perf_counter() - started
+
+    usage = seen.memory_usage()
+    print(f"mode={mode} bloom={bloom} urls={len(seen)}")
+    print(f"  memory: {usage / 2 ** 20:.1f} MiB, {usage / len(seen):.1f} bytes per url")
+    print(f"  load:   {count / load_time:,.0f} urls/sec")
+    print(f"  lookup: {lookups / lookup_time:,.0f} lookups/sec (half hits, half misses)")
+    print(f"  add:    {lookups / add_time:,.0f} adds/sec")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--urls", type=int, default=1000000)
+    parser.add_argument("--mode", choices=["hash", "compact"], default="compact")
+    parser.add_argument("--bloom", action="store_true", default=False)
+    parser.add_argument("--lookups", type=int, default=200000)
+    args = parser.parse_args()
+    run(args.urls, args.mode, args.bloom, args.lookups)
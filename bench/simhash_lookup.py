@@ -0,0 +1,59 @@
+''' Lookup latency of the SimHash near-duplicate index.
+
+    python -m bench.simhash_lookup --pages 1000000 --distance 3
+'''
+import random
+import time
+
+from argparse import ArgumentParser
+from collections import Counter
+
+from bench.parse_throughput import synthetic_page
+from scraper import parse_page, tokenize
+from utils.simhash import SimHashIndex, simhash
+
+
+def flip_bits(fingerprint, count, rng):
+    for bit in rng.sample(range(64), count):
+        fingerprint ^= 1 << bit
+    return fingerprint
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=1000000)
+    parser.add_argument("--distance", type=int, default=3)
+    parser.add_argument("--lookups", type=int, default=100000)
+    args = parser.parse_args()
+    rng = random.Random(0)
+
+    index = SimHashIndex(args.distance)
+    fingerprints = [rng.getrandbits(64) for _ in range(args.pages)]
+    started = time.perf_counter()
+    for i, fingerprint in enumerate(fingerprints):
+        index.add_if_new(fingerprint, i)
+    print(f"indexed {len(index)} pages in {time.perf_counter() - started:.1f}s")
+
+    near = [flip_bits(rng.choice(fingerprints), args.distance, rng) for _ in range(args.lookups)]
+    started = time.perf_counter()
+    found = sum(index.find(fingerprint) is not None for fingerprint in near)
+    elapsed = time.perf_counter() - started
+    print(f"near duplicates: {elapsed / args.lookups * 1e6:.1f} us per lookup, "
+          f"{found}/{args.lookups} found")
+
+    fresh = [rng.getrandbits(64) for _ in range(args.lookups)]
+    started = time.perf_counter()
+    found = sum(index.find(fingerprint) is not None for fingerprint in fresh)
+    elapsed = time.perf_counter() - started
+    print(f"new pages:       {elapsed / args.lookups * 1e6:.1f} us per lookup, "
+          f"{found}/{args.lookups} false matches")
+
+    # A page and the same page with a changed timestamp should be near duplicates.
+    page = parse_page("https://www.ics.uci.edu/calendar", synthetic_page(1, 2000, 50))
+    changed = Counter(page.token_counts)
+    changed.update(tokenize("updated monday october"))
+    started = time.perf_counter()
+    other = simhash(changed)
+    elapsed = time.perf_counter() - started
+    print(f"simhash of a {page.token_count} token page: {elapsed * 1e3:.2f} ms, "
+          f"distance to its edited copy: {bin(page.fingerprint ^ other).count('1')} bits")
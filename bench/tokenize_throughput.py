@@ -0,0 +1,86 @@
+''' Measure tokens/sec of the tokenizer over the text of sample pages.
+
+    python -m bench.tokenize_throughput --pages 200 --words 2000
+    python -m bench.tokenize_throughput --page_store pages
+
+The pages are those of bench/parse_throughput.py, or the pages of a page
+store. Their visible text is extracted once; only tokenizing is timed. The
+list scan is the tokenizer scraper.py had before utils/tokenizer.py. '''
+import re
+import time
+
+from argparse import ArgumentParser
+from collections import Counter
+
+from bench.parse_throughput import synthetic_page
+from crawler.page_store import PageStore
+from utils import tokenizer
+from utils.extract import extract, TEXT
+
+STOP_WORD_LIST = sorted(tokenizer.STOP_WORDS)
+
+
+def list_scan_tokenize(html_text):
+    eng_tokens = re.findall(r'\b[a-zA-Z][a-zA-Z\']*[a-zA-Z]\b', html_text)
+    filtered_tokens = []
+    for token in eng_tokens:
+        if token and token.lower() not in STOP_WORD_LIST:
+            filtered_tokens.append(token.lower())
+    return filtered_tokens
+
+
+def load_texts(pages, words, page_store):
+    if page_store:
+        store = PageStore(page_store)
+        store.load()
+        corpus = [(page.url, page.content) for page in store.scan()][:pages or None]
+        store.close()
+    else:
+        corpus = [(f"https://www.ics.uci.edu/page/{i}", synthetic_page(i, words, 100))
+                  for i in range(pages)]
+    texts = ["".join(value for kind, value in extract(url, content) if kind == TEXT)
+             for url, content in corpus]
+    return texts
+
+
+def measure(name, tokenize, inputs, expected):
+    started = time.perf_counter()
+    counts = Counter()
+    for value in inputs:
+        counts.update(tokenize(value))
+    elapsed = time.perf_counter() - started
+    tokens = sum(counts.values())
+    same = "" if expected is None or counts == expected else "  (counts differ)"
+    print(f"  {name:<22} {tokens / elapsed / 1e6:6.2f} M tokens/sec{same}")
+    return counts
+
+
+def run(pages, words, page_store):
+    texts = load_texts(pages, words, page_store)
+    print(f"{len(texts)} pages, {sum(map(len, texts)) / 2 ** 20:.1f} MiB of text")
+    expected = measure("list scan (old)", list_scan_tokenize, texts, None)
+    measure("tokenize", tokenizer.tokenize, texts, expected)
+    measure("iter_tokens", tokenizer.iter_tokens, texts, expected)
+    counts = Counter()
+    started = time.perf_counter()
+    for text in texts:
+        tokenizer.count_tokens(text, counts)
+    elapsed = time.perf_counter() - started
+    same = "" if counts == expected else "  (counts differ)"
+    print(f"  {'count_tokens':<22} {sum(counts.values()) / elapsed / 1e6:6.2f} M tokens/sec{same}")
+    for name in ("plural", "porter"):
+        try:
+            stem = tokenizer.get_stemmer(name)
+        except ImportError as e:
+            print(f"  {name + ' stemmer':<22} skipped: {e}")
+            continue
+        measure(f"{name} stemmer", lambda text: tokenizer.tokenize(text, stem), texts, None)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--pages", type=int, default=200, help="0 takes every page of --page_store")
+    parser.add_argument("--words", type=int, default=2000)
+    parser.add_argument("--page_store", help="tokenize the pages of this page store instead")
+    args = parser.parse_args()
+    run(args.pages, args.words, args.page_store)
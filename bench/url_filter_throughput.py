@@ -0,0 +1,138 @@
+''' Links/sec of the old per-call is_valid against UrlFilter.
+
+    python -m bench.url_filter_throughput --links crawled_links.txt
+
+--links takes one url per line, e.g. grepped from the worker logs of a
+crawl. Without it a corpus is generated from the subdomains in
+report.txt. '''
+import contextlib
+import os
+import random
+import re
+import time
+
+from argparse import ArgumentParser
+from urllib.parse import urlparse, parse_qs
+
+from utils.url_filter import UrlFilter
+
+
+# The is_valid of scraper.py before UrlFilter, debug prints included. The
+# date rule is called here (it used to test the function object, which is
+# always true) so both versions run every rule.
+def legacy_is_valid(url):
+    print(url)
+    try:
+        parsed = urlparse(url)
+        if parsed.scheme not in set(["http", "https"]):
+            return False
+        print("pass scheme")
+        if not legacy_is_within_domain(parsed):
+            return False
+        print("pass domain")
+        if re.search(r'(/page\d+)|(/\d+)|(/[a-z]$)', parsed.path):
+            return False
+        print("pass path")
+        if legacy_contains_date_pattern(parsed):
+            return False
+        print("pass date")
+        query_params = parse_qs(parsed.query, keep_blank_values=True)
+        if len(query_params) > 3:
+            return False
+        print("pass query")
+        return not re.match(
+            r".*\.(css|js|bmp|gif|jpe?g|ico"
+            + r"|png|tiff?|mid|mp2|mp3|mp4|mpg"
+            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+            + r"|epub|dll|cnf|tgz|sha1"
+            + r"|thmx|mso|arff|rtf|jar|csv"
+            + r"|rm|smil|wmv|swf|wma|zip|rar|gz"
+            + r"|json|xml|sql|yaml|ini|flv|3gp|aab|apk|webp|heic|bat|cmd|sh|txt)$", parsed.path.lower())
+    except Exception as e:
+        print(f"Unexpected Error: {e} on {parsed}")
+
+
+def legacy_is_within_domain(parsed_url):
+    allowed_domains = [
+        r'.*\.ics\.uci\.edu',
+        r'.*\.cs\.uci\.edu',
+        r'.*\.informatics\.uci\.edu',
+        r'.*\.stat\.uci\.edu'
+    ]
+    netloc = parsed_url.netloc
+    for domain in allowed_domains:
+        if re.match(domain, netloc):
+            return True
+    return False
+
+
+def legacy_contains_date_pattern(parsed_url):
+    date_patterns = [
+        r'\d{4}-\d{2}-\d{2}',
+        r'\d{4}/\d{2}/\d{2}',
+        r'\d{4}\d{2}\d{2}',
+        r'/\d{2}-\d{2}-\d{4}/',
+        r'/\d{2}/\d{2}/\d{4}/'
+    ]
+    for pattern in date_patterns:
+        if re.search(pattern, parsed_url.path):
+            return True
+    return False
+
+
+def report_corpus(count, report_file="report.txt"):
+    hosts = ["www.ics.uci.edu"]
+    if os.path.exists(report_file):
+        with open(report_file) as f:
+            hosts += re.findall(r"^\t\d+\. ([\w.-]+), \d+$", f.read(), re.M)
+    rng = random.Random(0)
+    paths = [
+        "/about/people", "/~eppstein/pubs/", "/research/areas/index.php",
+        "/events/2019-10-04/", "/files/report.pdf", "/wiki/doku.php?id=start&rev=3",
+        "/ugrad/courses/listing.php?year=2019&level=ALL&department=CS&program=ALL",
+        "/page/12", "/static/style.css", "/people/faculty", "/news/article"]
+    others = ["https://www.google.com/search?q=uci", "mailto:someone@uci.edu",
+              "https://www.uci.edu/", "javascript:void(0)"]
+    return [
+        rng.choice(others) if rng.random() < 0.1
+        else f"https://{rng.choice(hosts)}{rng.choice(paths)}"
+        for _ in range(count)]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--links", help="file with one url per line")
+    parser.add_argument("--count", type=int, default=200000)
+    parser.add_argument("--page-size", type=int, default=100,
+                        help="links per filter() call")
+    args = parser.parse_args()
+
+    if args.links:
+        with open(args.links) as f:
+            corpus = [line.strip() for line in f if line.strip()]
+    else:
+        corpus = report_corpus(args.count)
+    print(f"{len(corpus)} links")
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        started = time.perf_counter()
+        legacy = sum(1 for url in corpus if legacy_is_valid(url))
+        legacy_time = time.perf_counter() - started
+    print(f"  legacy is_valid:   {len(corpus) / legacy_time:12,.0f} links/sec ({legacy} kept)")
+
+    url_filter = UrlFilter()
+    started = time.perf_counter()
+    kept = sum(1 for url in corpus if url_filter.is_valid(url))
+    single_time = time.perf_counter() - started
+    print(f"  UrlFilter.is_valid:{len(corpus) / single_time:12,.0f} links/sec ({kept} kept)")
+
+    url_filter = UrlFilter()
+    started = time.perf_counter()
+    kept = 0
+    for start in range(0, len(corpus), args.page_size):
+        kept += len(url_filter.filter(corpus[start:start + args.page_size]))
+    batch_time = time.perf_counter() - started
+    print(f"  UrlFilter.filter:  {len(corpus) / batch_time:12,.0f} links/sec ({kept} kept)")
+    print(f"  rejections per rule: {url_filter.counts()}")
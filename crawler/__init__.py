@@ -1,26 +1,112 @@
-from utils import get_logger
+import time
+
+from threading import Thread
+
+from utils import get_logger, set_log_level
+from utils.metrics import metrics, MetricsReporter, MetricsServer
 from crawler.frontier import Frontier
+from crawler.page_store import PageStore
+from crawler.sitemaps import SitemapReader
 from crawler.worker import Worker
+import scraper
 
 class Crawler(object):
-    def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker):
+    def __init__(self, config, restart, frontier_factory=Frontier, worker_factory=Worker, started=None):
         self.config = config
+        set_log_level(config.log_level)
         self.logger = get_logger("CRAWLER")
+        # Seconds of each phase of the startup, from started (e.g. the start
+        # of launch.py) if given, until the workers run.
+        self.startup = list()
+        self.phase_started = time.monotonic() if started is None else started
+        if started is not None:
+            self._phase("launch")
+        scraper.configure(config, restart)
+        self._phase("statistics")
         self.frontier = frontier_factory(config, restart)
+        self._phase("frontier")
+        self.page_store = PageStore.from_config(config)   # None unless PAGE_STORE is set
+        self._phase("page store")
         self.workers = list()
         self.worker_factory = worker_factory
+        self.metrics_reporter = None
+        self.metrics_server = None
+        self.sitemap_reader = None
+
+    def _phase(self, phase):
+        now = time.monotonic()
+        self.startup.append((phase, now - self.phase_started))
+        self.phase_started = now
 
     def start_async(self):
-        self.workers = [
-            self.worker_factory(worker_id, self.config, self.frontier)
-            for worker_id in range(self.config.threads_count)]
+        if self.config.metrics_interval > 0:
+            self.metrics_reporter = MetricsReporter(metrics, self.logger, self.config.metrics_interval)
+            self.metrics_reporter.start()
+        if self.config.metrics_port:
+            self.metrics_server = MetricsServer(metrics, self.config.metrics_port)
+            host, port = self.metrics_server.start()
+            self.logger.info(f"Serving metrics on http://{host}:{port}/metrics")
+        if self.frontier.from_seeds:
+            # Once per crawl, alongside the workers, which do not find the
+            # frontier drained before it is done; a resumed crawl saved what
+            # the sitemaps listed.
+            self.frontier.add_feeder()
+            self.sitemap_reader = Thread(target=self._read_sitemaps, daemon=True, name="SitemapReader")
+            self.sitemap_reader.start()
+        if self.config.worker_mode == "async":
+            # One event loop thread keeps many downloads in flight. Imported
+            # here so aiohttp is only needed in this mode.
+            from crawler.async_worker import AsyncWorker
+            self.workers = [AsyncWorker(0, self.config, self.frontier, self.page_store)]
+        else:
+            self.workers = [
+                self.worker_factory(worker_id, self.config, self.frontier, self.page_store)
+                for worker_id in range(self.config.threads_count)]
         for worker in self.workers:
             worker.start()
+        self._phase("workers")
+        self.logger.info(
+            f"Started in {sum(seconds for _, seconds in self.startup):.2f}s: "
+            + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in self.startup)
+            + ("" if self.frontier.loaded.is_set() else "; the save file is still loading") + ".")
+
+    def _read_sitemaps(self):
+        try:
+            SitemapReader(self.config, self.frontier).run()
+        finally:
+            self.frontier.remove_feeder()
 
     def start(self):
         self.start_async()
         self.join()
 
     def join(self):
-        for worker in self.workers:
-            worker.join()
+        try:
+            for worker in self.workers:
+                worker.join()
+        except KeyboardInterrupt:
+            # Stop cleanly, so the journal is committed and the pending urls
+            # are saved for a fast resume.
+            self.logger.info("Interrupted. Stopping once the urls in flight complete.")
+            self.frontier.stop()
+            for worker in self.workers:
+                worker.join()
+        if self.sitemap_reader is not None:
+            self.sitemap_reader.join()
+        self.frontier.close()
+        if self.page_store is not None:
+            self.page_store.close()
+            self.logger.info(f"Page store {self.config.page_store} holds {len(self.page_store)} pages.")
+        scraper.close()
+        scraper.stats.checkpoint()
+        scraper.pages.checkpoint()
+        self.logger.info(f"Urls rejected per filter rule: {scraper.url_filter.counts()}")
+        self.logger.info(
+            f"Urls rejected by the trap detector: {scraper.traps.counts()}, "
+            f"trap templates: {scraper.traps.trap_templates()}")
+        self.logger.info(f"Pages fetched by change since their last fetch: {scraper.pages.counts()}")
+        if self.metrics_reporter is not None:
+            self.metrics_reporter.stop()
+        if self.metrics_server is not None:
+            self.metrics_server.shutdown()
+        self.logger.info(f"Metrics of the crawl: {metrics.summary()}")
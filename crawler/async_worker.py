@@ -0,0 +1,83 @@
+import asyncio
+import time
+
+from threading import Thread
+from urllib.parse import urlparse
+
+from utils import get_logger
+from utils.async_download import AsyncDownloader
+from utils.metrics import metrics
+import scraper
+
+
+class AsyncWorker(Thread):
+    ''' Runs an event loop that keeps up to config.async_concurrency urls in
+    flight at once, instead of one url per thread. '''
+    def __init__(self, worker_id, config, frontier, page_store=None):
+        self.logger = get_logger(f"AsyncWorker-{worker_id}", "Worker")
+        self.config = config
+        self.frontier = frontier
+        self.page_store = page_store
+        super().__init__(daemon=True, name=f"AsyncWorker-{worker_id}")
+
+    def run(self):
+        asyncio.run(self._crawl())
+        # create report.txt and record statistic
+        scraper.report()
+
+    async def _crawl(self):
+        loop = asyncio.get_running_loop()
+        slots = asyncio.Semaphore(self.config.async_concurrency)
+        tasks = set()
+        async with AsyncDownloader(self.config, self.logger) as downloader:
+            while True:
+                await slots.acquire()
+                # The frontier blocks until a host is ready, so wait for it on
+                # an executor thread rather than on the loop.
+                tbd_url = await loop.run_in_executor(None, self._next_url)
+                if not tbd_url:
+                    self.logger.info("Frontier is empty. Stopping Crawler.")
+                    slots.release()
+                    break
+                task = asyncio.create_task(self._fetch(downloader, tbd_url, slots))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+
+    async def _fetch(self, downloader, tbd_url, slots):
+        loop = asyncio.get_running_loop()
+        try:
+            # Downloads overlap on the loop thread, so they are timed here
+            # rather than with metrics.stage, which tracks one stage per thread.
+            started = time.perf_counter()
+            resp = await downloader.download(tbd_url)
+            seconds = time.perf_counter() - started
+            metrics.record_stage("download", seconds, self.name)
+            metrics.record_host_fetch(urlparse(tbd_url).hostname, resp.status, seconds)
+            self.logger.debug(
+                "Downloaded %s, status <%s>, using cache %s.",
+                tbd_url, resp.status, self.config.cache_server)
+            if resp.status == 200:
+                # Parsing and queueing are blocking, keep them off the loop.
+                await loop.run_in_executor(None, self._add_scraped, tbd_url, resp)
+        except Exception as e:
+            self.logger.error(f"Failed to crawl {tbd_url}: {e!r}")
+        finally:
+            self.frontier.mark_url_complete(tbd_url)
+            slots.release()
+
+    def _next_url(self):
+        with metrics.stage("sleep", self.name):
+            return self.frontier.get_tbd_url()
+
+    def _add_scraped(self, tbd_url, resp):
+        if self.page_store is not None and resp.raw_response:
+            with metrics.stage("store"):
+                self.page_store.append(tbd_url, resp.status, resp.raw_response.content)
+        scraped_urls = scraper.scraper(tbd_url, resp)
+        queued = 0
+        depth = self.frontier.depth_of(tbd_url) + 1
+        with metrics.stage("frontier_add"):
+            for scraped_url in scraped_urls:
+                queued += bool(self.frontier.add_url(scraped_url, depth))
+        scraper.record_links(tbd_url, queued)
@@ -1,72 +1,527 @@
+import dbm
 import os
+import time
+import heapq
 import shelve
 
-from threading import Thread, RLock
+from itertools import islice
+from threading import Thread, RLock, Condition, Event
 from queue import Queue, Empty
+from urllib.parse import urlsplit
 
-from utils import get_logger, get_urlhash, normalize
-from scraper import is_valid
+from utils import get_logger, get_urldigest, normalize
+from scraper import is_valid, admit, revisit_due
+from crawler.journal import FrontierJournal
+from crawler.seen import SeenSet
+from crawler.robots import RobotsCache
+from crawler.priority import UrlScorer, HostQueue
+
+LOAD_BATCH = 1000   # saved urls queued per hold of the lock while loading
+
+# Files of a shelve save file by dbm module, as suffixes of its path.
+SHELVE_SUFFIXES = {
+    "dbm.gnu": ("",),
+    "dbm.ndbm": (".db", ".pag", ".dir"),
+    "dbm.dumb": (".dat", ".dir", ".bak"),
+}
 
 class Frontier(object):
     def __init__(self, config, restart):
         self.logger = get_logger("FRONTIER")
         self.config = config
-        self.to_be_downloaded = list()
-        
-        if not os.path.exists(self.config.save_file) and not restart:
+
+        # Politeness is enforced per host: every host has its own queue of
+        # urls and a time at which it may be fetched from again. Hosts that
+        # have urls waiting sit in a heap keyed on that time until it comes,
+        # then in a heap keyed on the bucket of their best url, so the best
+        # url of any host that may be fetched from goes first.
+        self.lock = RLock()
+        self.has_ready = Condition(self.lock)
+        self.host_released = Condition(self.lock)   # a fetch from a host finished, see reserve_host
+        self.parked_changed = Condition(self.lock)  # a url was parked, see _retry_parked
+        self.scorer = UrlScorer.from_config(self.config)
+        self.host_queues = dict()   # key: host, val: HostQueue of urls
+        self.host_next_fetch = dict()   # key: host, val: earliest time of the next fetch
+        self.ready_heap = list()    # (next fetch time, host) for hosts with queued urls
+        self.best_hosts = list()    # (bucket, next fetch time, host) for hosts past that time
+        self.best_buckets = dict()  # key: host in best_hosts, val: its current bucket there
+        self.queued = dict()    # key: url, val: (bucket, depth); queued but not handed out
+        self.in_flight = dict()     # key: url, val: (host, depth); handed out but not completed
+        self.busy_hosts = set()     # hosts of the urls in flight, and hosts reserved
+        # A robots.txt fetch reserves its host unless the host is busy: the
+        # caller may be adding the links of a page of that very host.
+        self.robots = RobotsCache(
+            self.config, lambda host: self.reserve_host(host, wait_busy=False), self.release_host)
+        self.parked = dict()    # key: url, val: (retry time, depth, sitemap); its robots.txt failed
+        self.retrier = None     # thread checking parked urls again, a feeder while there are any
+
+        self.seen = SeenSet.from_config(self.config)  # digest of every url ever added
+        self.journal = FrontierJournal.from_config(self.config, key_size=16)
+        if not restart:
+            self._import_shelve()
+        self.unchecked = set()  # queued urls of the save file, checked by is_valid once handed out
+        self.loaded = Event()   # set once the save file is loaded; add_url waits for it
+        self.loader = None
+        self.stopping = False
+        self.feeders = 0    # threads still queueing urls, e.g. the sitemap reader
+        self.created = time.monotonic()
+        self.first_url_at = None    # seconds from creation to the first url handed out
+        if not self.journal.exists() and not restart:
             # Save file does not exist, but request to load save.
             self.logger.info(
                 f"Did not find save file {self.config.save_file}, "
                 f"starting from seed.")
-        elif os.path.exists(self.config.save_file) and restart:
+        elif self.journal.exists() and restart:
             # Save file does exists, but request to start from seed.
             self.logger.info(
                 f"Found save file {self.config.save_file}, deleting it.")
-            os.remove(self.config.save_file)
-        # Load existing save file, or create one if it does not exist.
-        self.save = shelve.open(self.config.save_file)
-        if restart:
+            self.journal.remove()
+        # A crawl starting from its seeds also reads the sitemaps; see
+        # SitemapReader.
+        self.from_seeds = not self.journal.exists()
+        if self.from_seeds:
+            # Create the save file and start appending to it.
+            self.journal.open()
+            self.loaded.set()
             for url in self.config.seed_urls:
                 self.add_url(url)
         else:
-            # Set the frontier state with contents of save file.
-            self._parse_save_file()
-            if not self.save:
-                for url in self.config.seed_urls:
-                    self.add_url(url)
+            # Workers start on the saved urls while the save file loads.
+            self.journal.check()
+            self.loader = Thread(target=self._parse_save_file, daemon=True, name="FrontierLoader")
+            self.loader.start()
+
+    def _import_shelve(self):
+        # SAVE may still name the shelve of a crawl from before the journal.
+        # Its urls are written into a new journal once, and the shelve is
+        # kept under SAVE.imported.
+        path = self.config.save_file
+        kind = dbm.whichdb(path)
+        if not kind:
+            return  # no save file, or a journal
+        shelve_paths = [path + suffix for suffix in SHELVE_SUFFIXES.get(kind, ("",))
+                        if os.path.exists(path + suffix)]
+        if any(os.path.exists(journal_path) for journal_path in self.journal.paths()
+               if journal_path not in shelve_paths):
+            raise ValueError(
+                f"Found both a shelve save file and a frontier journal at {path}; "
+                f"move one of them away.")
+        with shelve.open(path, flag="r") as save:
+            records = [(get_urldigest(url), url, completed) for url, completed in save.values()]
+        # The journal may take the shelve's own path, so move the shelve first.
+        for shelve_path in shelve_paths:
+            os.replace(shelve_path, f"{path}.imported" + shelve_path[len(path):])
+        self.journal.create(records)
+        self.logger.info(
+            f"Imported {len(records)} urls of the shelve save file {path} into "
+            f"a frontier journal; the shelve is kept as {path}.imported.")
 
     def _parse_save_file(self):
-        ''' This function can be overridden for alternate saving techniques. '''
-        total_count = len(self.save)
-        tbd_count = 0
-        for url, completed in self.save.values():
-            if not completed and is_valid(url):
-                self.to_be_downloaded.append(url)
-                tbd_count += 1
+        ''' This function can be overridden for alternate saving techniques.
+
+        Runs in the loader thread. The pending urls saved on close are
+        queued first if the journal did not change since; the journal is
+        then replayed into the seen set, yielding the pending urls itself
+        otherwise. Saved urls are checked by is_valid when handed out. '''
+        started = time.monotonic()
+        phases = list()     # (phase, seconds)
+        saved = self.journal.load_pending()
+        if saved is not None:
+            self._schedule_saved(saved)
+            phases.append(("pending file", time.monotonic() - started))
+        pending = dict()    # key: url digest, val: url not completed yet
+        completed_urls = dict()     # key: url digest, val: url completed, kept for RECRAWL only
+
+        def digests():
+            for urldigest, url, completed in self.journal.replay():
+                if completed:
+                    pending.pop(urldigest, None)
+                    if self.config.recrawl:
+                        completed_urls[urldigest] = url
+                else:
+                    if saved is None:
+                        pending[urldigest] = url
+                    completed_urls.pop(urldigest, None)
+                yield urldigest
+
+        phase_started = time.monotonic()
+        self.seen.load(digests())
+        phases.append(("journal replay", time.monotonic() - phase_started))
+        if saved is None:
+            phase_started = time.monotonic()
+            # The depth of a url is not in the journal; it counts as a seed.
+            saved = [(url, 0) for url in pending.values()]
+            self._schedule_saved(saved)
+            phases.append(("queueing", time.monotonic() - phase_started))
+        revisits = [(urldigest, url) for urldigest, url in completed_urls.items() if revisit_due(urldigest)]
+        # Append to the existing save file; records of urls completed
+        # meanwhile were held until now.
+        self.journal.open()
+        for urldigest, url in revisits:
+            # Pending again, so an interrupted recrawl resumes with them.
+            self.journal.append(urldigest, url, False)
+        self._schedule_saved((url, 0) for _, url in revisits)
+        if revisits:
+            self.logger.info(f"Revisiting {len(revisits)} pages that are due.")
+        with self.lock:
+            self.loaded.set()
+            self.has_ready.notify_all()
+        if not self.seen:
+            for url in self.config.seed_urls:
+                self.add_url(url)
+        self.logger.info(
+            f"Found {len(saved)} urls to be downloaded from {len(self.seen)} "
+            f"total urls discovered in {time.monotonic() - started:.2f}s ("
+            + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in phases) + ").")
+        self._log_seen_memory()
+
+    def _schedule_saved(self, entries):
+        # Queue (url, depth) of the save file in batches, so workers can
+        # take urls in between.
+        entries = iter(entries)
+        while True:
+            batch = list(islice(entries, LOAD_BATCH))
+            if not batch:
+                return
+            with self.lock:
+                for url, depth in batch:
+                    self.unchecked.add(url)
+                    self._schedule(url, depth)
+
+    def _log_seen_memory(self):
+        usage = self.seen.memory_usage()
+        per_url = usage / len(self.seen) if len(self.seen) else 0
         self.logger.info(
-            f"Found {tbd_count} urls to be downloaded from {total_count} "
-            f"total urls discovered.")
+            f"Seen set holds {len(self.seen)} urls in {usage / 2 ** 20:.1f} MiB "
+            f"({per_url:.1f} bytes per url).")
+
+    def _schedule(self, url, depth=0, sitemap=None):
+        # Queue the url under its host; the host enters the heap if it was idle.
+        host = urlsplit(url).netloc
+        with self.lock:
+            self.scorer.queued(url, host)
+            bucket = self.scorer.bucket(url, host, depth, sitemap)
+            self.queued[url] = (bucket, depth)
+            self._push(host, bucket, url)
+
+    def _push(self, host, bucket, url):
+        # Called with the lock held.
+        queue = self.host_queues.get(host)
+        if queue is None:
+            queue = self.host_queues[host] = HostQueue()
+            queue.push(bucket, url)
+            if host not in self.busy_hosts:
+                heapq.heappush(
+                    self.ready_heap, (self.host_next_fetch.get(host, 0), host))
+                self.has_ready.notify()
+            return
+        queue.push(bucket, url)
+        if bucket < self.best_buckets.get(host, bucket):
+            # The host is waiting to be served and now has a better url; its
+            # old entry in best_hosts is skipped once popped.
+            self.best_buckets[host] = bucket
+            heapq.heappush(self.best_hosts, (bucket, self.host_next_fetch.get(host, 0), host))
+
+    def _rescore(self, url, sitemap=None):
+        # Called with the lock held for a url seen before. A url still queued
+        # moves to a better bucket if it has one now, e.g. from more links
+        # to it; its copy in the old bucket is skipped once popped.
+        entry = self.queued.get(url)
+        if entry is None or not (self.scorer.rescores or sitemap):
+            return
+        old_bucket, depth = entry
+        host = urlsplit(url).netloc
+        bucket = self.scorer.bucket(url, host, depth, sitemap)
+        if bucket < old_bucket:
+            self.queued[url] = (bucket, depth)
+            self._push(host, bucket, url)
+
+    def _pop_best(self):
+        # Called with the lock held. Hand out the best url of the hosts that
+        # may be fetched from now, or return None if there is none.
+        now = time.monotonic()
+        while self.ready_heap and self.ready_heap[0][0] <= now:
+            next_fetch, host = heapq.heappop(self.ready_heap)
+            if host in self.busy_hosts or next_fetch != self.host_next_fetch.get(host, 0):
+                continue    # reserved, or released with a later time pushed anew
+            bucket = self.host_queues[host].best()
+            self.best_buckets[host] = bucket
+            heapq.heappush(self.best_hosts, (bucket, next_fetch, host))
+        while self.best_hosts:
+            bucket, _, host = heapq.heappop(self.best_hosts)
+            if self.best_buckets.get(host) != bucket:
+                continue    # a stale entry of a host that got a better url
+            del self.best_buckets[host]
+            if host in self.busy_hosts:
+                continue    # reserved; pushed again once released
+            queue = self.host_queues[host]
+            entry = None
+            while queue and entry is None:
+                url = queue.pop()
+                # Urls moved to a better bucket left a copy behind.
+                entry = self.queued.pop(url, None)
+            if not queue:
+                del self.host_queues[host]
+            if entry is None:
+                continue
+            self.scorer.dequeued(url)
+            if url in self.unchecked:
+                self.unchecked.discard(url)
+                if not is_valid(url):
+                    # Saved under other rules; it is done with, not fetched.
+                    self.journal.append(get_urldigest(url), url, True)
+                    if host in self.host_queues:
+                        heapq.heappush(self.ready_heap, (self.host_next_fetch.get(host, 0), host))
+                    continue
+            if self.first_url_at is None:
+                self.first_url_at = time.monotonic() - self.created
+                self.logger.info(f"Handed out the first url {self.first_url_at:.2f}s after starting.")
+            # The host stays out of the heaps until this url completes.
+            self.in_flight[url] = (host, entry[1])
+            self.busy_hosts.add(host)
+            return url
+        return None
 
-    def get_tbd_url(self):
-        try:
-            return self.to_be_downloaded.pop()
-        except IndexError:
-            return None
+    def get_tbd_url(self, timeout=None):
+        ''' Get one url whose host may be fetched from now.
 
-    def add_url(self, url):
+        Blocks until such a url is available. Returns None when the frontier
+        is drained (loaded, nothing queued and nothing in flight), stopped or
+        when timeout seconds pass without a url becoming ready. '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self.lock:
+            while True:
+                if self.stopping:
+                    return None
+                url = self._pop_best()
+                if url is not None:
+                    return url
+                if self.is_drained():
+                    self.has_ready.notify_all()
+                    return None
+                now = time.monotonic()
+                wait = None
+                if self.ready_heap:
+                    wait = self.ready_heap[0][0] - now
+                if deadline is not None:
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.has_ready.wait(wait)
+
+    def is_drained(self):
+        with self.lock:
+            return (self.loaded.is_set() and not self.feeders
+                    and not self.queued and not self.in_flight)
+
+    def add_feeder(self):
+        ''' A thread will queue urls: the frontier is not drained, and the
+        workers wait for urls, until it calls remove_feeder. '''
+        with self.lock:
+            self.feeders += 1
+
+    def remove_feeder(self):
+        with self.lock:
+            self.feeders -= 1
+            self.has_ready.notify_all()
+
+    def reserve_host(self, host, wait_busy=True):
+        ''' Wait until the host may be fetched from and keep the workers off
+        it until release_host, for a fetch of a url the frontier does not
+        hand out, such as a sitemap. Returns False, reserving nothing, if
+        the frontier stops meanwhile, or if the host is busy and wait_busy
+        is not set. '''
+        with self.lock:
+            while not self.stopping:
+                if host in self.busy_hosts and not wait_busy:
+                    return False
+                wait = self.host_next_fetch.get(host, 0) - time.monotonic()
+                if host not in self.busy_hosts and wait <= 0:
+                    self.busy_hosts.add(host)
+                    return True
+                self.host_released.wait(wait if wait > 0 else None)
+            return False
+
+    def release_host(self, host):
+        with self.lock:
+            self.busy_hosts.discard(host)
+            # Its entries in the heaps, if any, were skipped or are now stale.
+            self.best_buckets.pop(host, None)
+            self._host_done(host)
+
+    def stop(self):
+        ''' Hand out no more urls; workers stop once their urls complete. '''
+        with self.lock:
+            self.stopping = True
+            self.has_ready.notify_all()
+            self.host_released.notify_all()
+            self.parked_changed.notify_all()
+
+    def depth_of(self, url):
+        ''' Links followed from a seed to the url in flight, 0 if unknown. '''
+        with self.lock:
+            entry = self.in_flight.get(url)
+            return entry[1] if entry is not None else 0
+
+    def add_url(self, url, depth=0, sitemap=None):
+        ''' Queue the url unless it was seen before, robots.txt disallows it
+        or the trap detector rejects it. Returns whether it was queued. A
+        url whose robots.txt could not be fetched is parked and checked
+        again once that answer expires, see _park.
+
+        depth is the number of links followed from a seed to the url and
+        sitemap the SitemapEntry of a url listed in a sitemap; both feed the
+        scorers that order the queue. '''
         url = normalize(url)
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            self.save[urlhash] = (url, False)
-            self.save.sync()
-            self.to_be_downloaded.append(url)
-    
+        urldigest = get_urldigest(url)
+        self.loaded.wait()
+        with self.lock:
+            self.scorer.linked(url)
+            if urldigest in self.seen:
+                self._rescore(url, sitemap)
+                return False
+        # Check robots.txt before queueing, outside the lock since it may
+        # have to fetch the rules of a new host.
+        allowed, retry_at = self.robots.check(url)
+        if not allowed and retry_at is None:
+            return False
+        with self.lock:
+            if urldigest in self.seen or not admit(url):
+                return False
+            self.seen.add(urldigest)
+            self.journal.append(urldigest, url, False)
+            if allowed:
+                self._schedule(url, depth, sitemap)
+            else:
+                self._park(url, retry_at, depth, sitemap)
+            return True
+
+    def add_urls(self, entries):
+        ''' add_url for many (url, depth, sitemap entry) at once, such as the
+        urls of a sitemap. The seen set is checked and the new urls are
+        queued under one hold of the lock each, and their journal records
+        are committed together. Returns how many urls were queued. '''
+        candidates = dict()     # key: url, val: (digest, depth, sitemap entry)
+        self.loaded.wait()
+        with self.lock:
+            for url, depth, sitemap in entries:
+                url = normalize(url)
+                urldigest = get_urldigest(url)
+                self.scorer.linked(url)
+                if urldigest in self.seen:
+                    self._rescore(url, sitemap)
+                elif url not in candidates:
+                    candidates[url] = (urldigest, depth, sitemap)
+        # robots.txt may have to be fetched, so outside the lock.
+        checked = [(url, entry, self.robots.check(url)) for url, entry in candidates.items()]
+        with self.lock:
+            records = list()
+            for url, (urldigest, depth, sitemap), (allowed, retry_at) in checked:
+                if not allowed and retry_at is None:
+                    continue
+                if urldigest in self.seen or not admit(url):
+                    continue
+                self.seen.add(urldigest)
+                records.append((urldigest, url, False))
+                if allowed:
+                    self._schedule(url, depth, sitemap)
+                else:
+                    self._park(url, retry_at, depth, sitemap)
+            # Still under the lock: a url handed out from here on must not
+            # complete in the journal before it was recorded as pending.
+            self.journal.extend(records)
+        # The batch is written and synced outside the lock.
+        self.journal.commit()
+        return len(records)
+
+    def _park(self, url, retry_at, depth, sitemap):
+        # Called with the lock held for a new url whose robots.txt could not
+        # be fetched, e.g. a 5xx at startup. It is seen and pending in the
+        # journal, but queued only once the robots retry thread finds it
+        # allowed after retry_at. That thread is a feeder, so the frontier
+        # is not drained while urls are parked.
+        self.parked[url] = (retry_at, depth, sitemap)
+        if self.retrier is None:
+            self.feeders += 1
+            self.retrier = Thread(target=self._retry_parked, daemon=True, name="RobotsRetry")
+            self.retrier.start()
+        self.parked_changed.notify()
+
+    def _retry_parked(self):
+        # Runs in the robots retry thread until no url is parked.
+        while True:
+            with self.lock:
+                if self.stopping or not self.parked:
+                    self.retrier = None
+                    self.feeders -= 1
+                    self.has_ready.notify_all()
+                    return
+                now = time.monotonic()
+                due = [(url, depth, sitemap) for url, (retry_at, depth, sitemap) in self.parked.items()
+                       if retry_at <= now]
+                if not due:
+                    self.parked_changed.wait(min(retry_at for retry_at, _, _ in self.parked.values()) - now)
+                    continue
+                for url, _, _ in due:
+                    del self.parked[url]
+            for url, depth, sitemap in due:
+                allowed, retry_at = self.robots.check(url)
+                with self.lock:
+                    if allowed:
+                        self._schedule(url, depth, sitemap)
+                    elif retry_at is not None:
+                        self.parked[url] = (retry_at, depth, sitemap)
+                    else:
+                        # Disallowed after all; it is done with, not fetched.
+                        self.journal.append(get_urldigest(url), url, True)
+
+    def owns(self, url):
+        ''' Whether the url's host is crawled by this frontier. '''
+        return True
+
     def mark_url_complete(self, url):
-        urlhash = get_urlhash(url)
-        if urlhash not in self.save:
-            # This should not happen.
-            self.logger.error(
-                f"Completed url {url}, but have not seen it before.")
-
-        self.save[urlhash] = (url, True)
-        self.save.sync()
+        urldigest = get_urldigest(url)
+        with self.lock:
+            if self.loaded.is_set() and urldigest not in self.seen:
+                # This should not happen.
+                self.logger.error(
+                    f"Completed url {url}, but have not seen it before.")
+
+            self.journal.append(urldigest, url, True)
+
+            entry = self.in_flight.pop(url, None)
+            if entry is None:
+                return
+            host = entry[0]
+            self.busy_hosts.discard(host)
+            self._host_done(host)
+
+    def _host_done(self, host):
+        # Called with the lock held once a fetch from the host finished. The
+        # next fetch may start one politeness interval later, or later still
+        # if robots.txt asks for it.
+        delay = self.config.time_delay
+        crawl_delay = self.robots.crawl_delay(host)
+        if crawl_delay is not None:
+            delay = max(delay, crawl_delay)
+        next_fetch = time.monotonic() + delay
+        self.host_next_fetch[host] = next_fetch
+        if host in self.host_queues:
+            heapq.heappush(self.ready_heap, (next_fetch, host))
+        self.has_ready.notify_all()
+        self.host_released.notify_all()
+
+    def close(self):
+        if self.loader is not None:
+            self.loader.join()
+        # Commit whatever the journal still buffers.
+        self.journal.close()
+        with self.lock:
+            pending = [(url, depth) for url, (_, depth) in self.queued.items()]
+            pending += [(url, depth) for url, (_, depth) in self.in_flight.items()]
+            pending += [(url, depth) for url, (_, depth, _) in self.parked.items()]
+        # Lets a resume queue them before it has replayed the journal.
+        self.journal.save_pending(pending)
+        self.logger.info(f"Saved {len(pending)} pending urls to {self.journal.pending_path}.")
+        self._log_seen_memory()
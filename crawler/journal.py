@@ -0,0 +1,303 @@
+import mmap
+import os
+import struct
+import time
+
+from threading import Thread, Lock, Event
+
+from utils import get_logger
+from utils.metrics import metrics
+
+# Every file starts with MAGIC and the key size in bytes. Records follow:
+# one state byte, the fixed width url key, the url length, then the url.
+MAGIC = b"FJRN\x01"
+PENDING = 0
+COMPLETED = 1
+
+# The pending file starts with PENDING_MAGIC and PENDING_STATE: the size and
+# mtime of the live log, the rotated log and the snapshot when it was saved.
+# Records follow: depth, url length, then the url.
+PENDING_MAGIC = b"FPND\x01"
+PENDING_STATE = struct.Struct("<6Q")
+PENDING_RECORD = struct.Struct("<HI")
+
+
+class FrontierJournal(object):
+    ''' Append-only log of (urlhash, url, state) records for the frontier.
+
+    Appends are buffered and group committed (written and fsynced) by a
+    flusher thread once commit_records records are waiting or
+    commit_interval seconds have passed, so appending never waits on the
+    disk. When the log holds compact_records records it is folded into the
+    snapshot in a background thread. Replay reads the snapshot, a log
+    left over from an interrupted compaction, then the live log.
+
+    On close the frontier can save the urls still pending, with their depth,
+    to a pending file. It is read back only while the journal is exactly as
+    it was then, so a resume can queue them before replaying the journal.
+    Records appended before open() are held until it is called. '''
+    def __init__(self, path, key_size=32, commit_records=1000,
+                 commit_interval=0.2, compact_records=1000000):
+        self.logger = get_logger("JOURNAL", "FRONTIER")
+        self.path = path
+        self.snapshot_path = f"{path}.snapshot"
+        self.rotated_path = f"{path}.old"
+        self.pending_path = f"{path}.pending"
+        self.key_size = key_size
+        self.header = MAGIC + bytes([key_size])
+        self.record_head = struct.Struct(f"<B{key_size}sI")
+        self.commit_records = commit_records
+        self.commit_interval = commit_interval
+        self.compact_records = compact_records
+
+        self.lock = Lock()  # guards the buffer; held only to append to it or take it
+        self.commit_lock = Lock()   # one commit writes the log at a time, in buffer order
+        self.buffer = list()
+        self.log = None
+        self.log_records = 0
+        self.compaction = None
+        self.closed = Event()
+        self.commit_due = Event()   # wakes the flusher before commit_interval passes
+        self.flusher = Thread(target=self._flush_periodically, daemon=True, name="JournalFlusher")
+
+    @classmethod
+    def from_config(cls, config, key_size=32):
+        return cls(
+            config.save_file, key_size=key_size,
+            commit_records=config.journal_commit_records,
+            commit_interval=config.journal_commit_interval,
+            compact_records=config.journal_compact_records)
+
+    def paths(self):
+        return [self.path, self.rotated_path, self.snapshot_path]
+
+    def exists(self):
+        return any(os.path.exists(path) for path in self.paths())
+
+    def remove(self):
+        for path in self.paths() + [self.pending_path]:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def check(self):
+        ''' Raise ValueError if a file of the journal on disk is not one, so
+        a resume fails at startup rather than in the loader thread. '''
+        for path in self.paths():
+            if os.path.exists(path) and os.path.getsize(path) >= len(self.header):
+                with open(path, "rb") as f:
+                    if f.read(len(self.header)) != self.header:
+                        raise ValueError(self._not_journal(path))
+
+    def _not_journal(self, path):
+        return f"{path} is not a frontier journal with {self.key_size} byte keys."
+
+    def create(self, records):
+        ''' Write a new journal holding the (key, url, completed) records.
+        Call before open(). '''
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(self.header)
+            f.write(b"".join(self._encode(key, url, completed) for key, url, completed in records))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def replay(self):
+        ''' Yield (key, url, completed) for every record on disk, in order.
+        A torn record at the end of the live log is cut off. '''
+        for path in (self.snapshot_path, self.rotated_path):
+            if os.path.exists(path):
+                yield from self._read(path)
+        if os.path.exists(self.path):
+            yield from self._read(self.path)
+            if self.read_offset < os.path.getsize(self.path):
+                self.logger.warning(
+                    f"Dropping a torn record at the end of {self.path}.")
+                with open(self.path, "r+b") as f:
+                    f.truncate(self.read_offset)
+
+    def _read(self, path):
+        ''' Yield the records of path. Afterwards self.read_offset is the end
+        of the last whole record. '''
+        self.read_offset = 0
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size < len(self.header):
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if data[:len(self.header)] != self.header:
+                    raise ValueError(self._not_journal(path))
+                head_size = self.record_head.size
+                unpack_head = self.record_head.unpack_from
+                offset = len(self.header)
+                end = len(data)
+                while offset + head_size <= end:
+                    state, key, length = unpack_head(data, offset)
+                    start = offset + head_size
+                    if start + length > end:
+                        break
+                    url = data[start:start + length].decode("utf-8")
+                    yield key, url, state == COMPLETED
+                    offset = start + length
+                self.read_offset = offset
+
+    def open(self):
+        ''' Start appending. Call after replay(). '''
+        if os.path.exists(self.rotated_path):
+            # A compaction was interrupted; finish it before a new rotation
+            # could overwrite the rotated log.
+            self._compact()
+        new_file = not os.path.exists(self.path)
+        with self.commit_lock:
+            self.log = open(self.path, "ab")
+            if new_file:
+                self.log.write(self.header)
+                self._sync()
+        self.flusher.start()
+
+    def append(self, key, url, completed):
+        record = self._encode(key, url, completed)
+        with self.lock:
+            self.buffer.append(record)
+            if len(self.buffer) >= self.commit_records:
+                self.commit_due.set()
+
+    def extend(self, records):
+        ''' Append (key, url, completed) records, to be written together.
+        Call commit() to wait until they are on disk. '''
+        encoded = [self._encode(key, url, completed) for key, url, completed in records]
+        with self.lock:
+            self.buffer.extend(encoded)
+
+    def commit(self):
+        ''' Write and fsync the records appended so far. '''
+        with self.commit_lock:
+            self._commit()
+
+    def _commit(self):
+        # Called with the commit lock held. The buffer is taken under the
+        # lock and written outside it, so appends go on meanwhile.
+        if self.log is None:
+            return
+        with self.lock:
+            records, self.buffer = self.buffer, list()
+        if not records:
+            return
+        with metrics.stage("frontier_sync"):
+            self.log.write(b"".join(records))
+            self.log_records += len(records)
+            self._sync()
+        with self.lock:
+            rotate = self.log_records >= self.compact_records and self.compaction is None
+        if rotate:
+            self._rotate()
+
+    def _sync(self):
+        self.log.flush()
+        os.fsync(self.log.fileno())
+
+    def _flush_periodically(self):
+        while not self.closed.is_set():
+            self.commit_due.wait(self.commit_interval)
+            self.commit_due.clear()
+            self.commit()
+
+    def _rotate(self):
+        # Called with the commit lock held. Appends continue in a fresh log
+        # while the full one is folded into the snapshot.
+        self.log.close()
+        os.replace(self.path, self.rotated_path)
+        self.log = open(self.path, "ab")
+        self.log.write(self.header)
+        self._sync()
+        self.log_records = 0
+        self.compaction = Thread(target=self._compact, daemon=True)
+        self.compaction.start()
+
+    def _compact(self):
+        started = time.time()
+        # The rotated log is bounded by compact_records, so only its records
+        # are held in memory; the snapshot is streamed through.
+        changes = dict()
+        for key, url, completed in self._read(self.rotated_path):
+            changes[key] = (url, completed)
+        tmp_path = f"{self.snapshot_path}.tmp"
+        count = 0
+        with open(tmp_path, "wb") as out:
+            out.write(self.header)
+            if os.path.exists(self.snapshot_path):
+                for key, url, completed in self._read(self.snapshot_path):
+                    url, completed = changes.pop(key, (url, completed))
+                    out.write(self._encode(key, url, completed))
+                    count += 1
+            for key, (url, completed) in changes.items():
+                out.write(self._encode(key, url, completed))
+                count += 1
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+        os.remove(self.rotated_path)
+        self.logger.info(
+            f"Compacted the frontier journal into {count} records in "
+            f"{time.time() - started:.2f}s.")
+        with self.lock:
+            self.compaction = None
+
+    def _encode(self, key, url, completed):
+        encoded = url.encode("utf-8")
+        return self.record_head.pack(
+            COMPLETED if completed else PENDING, key, len(encoded)) + encoded
+
+    def _state(self):
+        state = list()
+        for path in self.paths():
+            try:
+                stat = os.stat(path)
+                state += [stat.st_size, stat.st_mtime_ns]
+            except FileNotFoundError:
+                state += [0, 0]
+        return state
+
+    def save_pending(self, entries):
+        ''' Save (url, depth) of the urls pending now. Call after close(). '''
+        tmp_path = f"{self.pending_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(PENDING_MAGIC + PENDING_STATE.pack(*self._state()))
+            for url, depth in entries:
+                encoded = url.encode("utf-8")
+                f.write(PENDING_RECORD.pack(min(depth, 0xFFFF), len(encoded)) + encoded)
+        os.replace(tmp_path, self.pending_path)
+
+    def load_pending(self):
+        ''' The (url, depth) list saved by save_pending, or None if there is
+        none or the journal changed since. Call before replay(). '''
+        if not os.path.exists(self.pending_path):
+            return None
+        with open(self.pending_path, "rb") as f:
+            data = f.read()
+        head_size = len(PENDING_MAGIC) + PENDING_STATE.size
+        if (data[:len(PENDING_MAGIC)] != PENDING_MAGIC
+                or list(PENDING_STATE.unpack_from(data, len(PENDING_MAGIC))) != self._state()):
+            return None
+        entries = list()
+        offset = head_size
+        while offset + PENDING_RECORD.size <= len(data):
+            depth, length = PENDING_RECORD.unpack_from(data, offset)
+            start = offset + PENDING_RECORD.size
+            entries.append((data[start:start + length].decode("utf-8"), depth))
+            offset = start + length
+        return entries
+
+    def close(self):
+        self.closed.set()
+        self.commit_due.set()
+        if self.flusher.is_alive():
+            self.flusher.join()
+        with self.commit_lock:
+            if self.log is not None:
+                self._commit()
+                self.log.close()
+                self.log = None
+        with self.lock:
+            compaction = self.compaction
+        if compaction is not None:
+            compaction.join()
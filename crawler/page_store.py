@@ -0,0 +1,273 @@
+import mmap
+import os
+import struct
+import zlib
+
+from collections import namedtuple
+from threading import Lock, local
+
+from utils import get_logger, get_urlhash
+
+# A segment file starts with SEGMENT_MAGIC. Records follow: RECORD_HEAD (url
+# hash, codec, status, url length, stored length, raw length), the url, then
+# the page as stored. Each segment has an index file next to it: INDEX_HEAD
+# (magic and the segment size it covers) then an INDEX_ENTRY (url hash,
+# offset) per record.
+SEGMENT_MAGIC = b"PSEG\x01"
+INDEX_MAGIC = b"PIDX\x01"
+RECORD_HEAD = struct.Struct("<32sBHIII")
+INDEX_HEAD = struct.Struct("<5sQ")
+INDEX_ENTRY = struct.Struct("<32sQ")
+
+RAW, ZLIB, ZSTD = range(3)
+CODECS = {"none": RAW, "zlib": ZLIB, "zstd": ZSTD}
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# A page read back from the store.
+StoredPage = namedtuple("StoredPage", ["url", "status", "content"])
+
+
+def url_key(url):
+    return bytes.fromhex(get_urlhash(url))
+
+
+class PageStore(object):
+    ''' Raw pages appended to numbered segment files in a directory, each
+    compressed on its own with zlib or zstd (needs zstandard installed), so
+    any page can be read back without the ones around it.
+
+    Pages are found by the get_urlhash of their url through an in-memory
+    index, loaded from the index file of each segment. The index of the
+    segment being written is saved when it is sealed and on close; records
+    after the last saved index, e.g. after a crash, are found by scanning,
+    and a torn record at the end is cut off. Reads go through a read-only
+    mmap of each segment. A url stored twice is read back as its latest
+    page. '''
+    def __init__(self, path, codec="zlib", segment_bytes=256 * 2 ** 20):
+        assert codec in CODECS, f"codec should be one of {sorted(CODECS)}"
+        self.logger = get_logger("PAGE_STORE", "FRONTIER")
+        self.path = path
+        self.codec = CODECS[codec]
+        self.segment_bytes = segment_bytes
+        self.lock = Lock()
+        self.index = dict()     # key: url hash, val: (segment, offset)
+        self.segments = list()  # segment numbers, in order
+        self.maps = dict()  # key: segment, val: its mmap for reading
+        self.live = None    # segment file being appended to
+        self.live_entries = list()  # (url hash, offset) of the live segment
+        self.compressors = local()  # zstd contexts are per thread
+        if self.codec == ZSTD:
+            # Fail at startup rather than at the first page.
+            import zstandard    # noqa: F401
+
+    @classmethod
+    def from_config(cls, config):
+        ''' The store of config.page_store, open for appending, or None if
+        pages are not stored. '''
+        if not config.page_store:
+            return None
+        store = cls(config.page_store, config.page_store_codec,
+                    config.page_store_segment_mb * 2 ** 20)
+        store.open()
+        return store
+
+    def _segment_path(self, segment):
+        return os.path.join(self.path, f"{segment:06d}.seg")
+
+    def _index_path(self, segment):
+        return os.path.join(self.path, f"{segment:06d}.idx")
+
+    def load(self):
+        ''' Read the index of every segment, for reading only. '''
+        if not os.path.isdir(self.path):
+            return
+        self.segments = sorted(
+            int(name[:-4]) for name in os.listdir(self.path) if name.endswith(".seg"))
+        for segment in self.segments:
+            for key, offset in self._segment_entries(segment):
+                self.index[key] = (segment, offset)
+
+    def _segment_entries(self, segment):
+        ''' (url hash, offset) of every whole record of the segment. '''
+        entries = list()
+        covered = len(SEGMENT_MAGIC)
+        index_path = self._index_path(segment)
+        if os.path.exists(index_path):
+            with open(index_path, "rb") as f:
+                data = f.read()
+            magic, covered = INDEX_HEAD.unpack_from(data)
+            if magic != INDEX_MAGIC:
+                raise ValueError(f"{index_path} is not a page store index.")
+            entries.extend(INDEX_ENTRY.iter_unpack(data[INDEX_HEAD.size:]))
+        if os.path.getsize(self._segment_path(segment)) > covered:
+            # Written after its index was saved.
+            for offset, head in self._scan(segment, covered):
+                entries.append((head[0], offset))
+        if segment == (self.segments[-1] if self.segments else None):
+            self.live_entries = list(entries)
+        return entries
+
+    def _open_map(self, segment):
+        with open(self._segment_path(segment), "rb") as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _map(self, segment, end=0):
+        # Called with the lock held, which every read of self.maps holds
+        # too. A map taken before later appends is taken again to cover
+        # them, and the old one closed.
+        data = self.maps.get(segment)
+        if data is None or len(data) < end:
+            if data is not None:
+                data.close()
+            data = self.maps[segment] = self._open_map(segment)
+        return data
+
+    def _scan(self, segment, offset=None):
+        ''' Yield (offset, record head) of the whole records of the segment
+        from offset on. Afterwards self.scan_offset is the end of the last.
+        The scan reads a map of its own, closed when it ends. '''
+        self.scan_offset = len(SEGMENT_MAGIC)
+        if os.path.getsize(self._segment_path(segment)) <= len(SEGMENT_MAGIC):
+            return
+        data = self._open_map(segment)
+        try:
+            if data[:len(SEGMENT_MAGIC)] != SEGMENT_MAGIC:
+                raise ValueError(f"{self._segment_path(segment)} is not a page store segment.")
+            offset = offset or len(SEGMENT_MAGIC)
+            end = len(data)
+            while offset + RECORD_HEAD.size <= end:
+                head = RECORD_HEAD.unpack_from(data, offset)
+                record_end = offset + RECORD_HEAD.size + head[3] + head[4]
+                if record_end > end:
+                    break
+                yield offset, head
+                offset = record_end
+            self.scan_offset = offset
+        finally:
+            data.close()
+
+    def open(self):
+        ''' Load the index and start appending to the last segment. '''
+        os.makedirs(self.path, exist_ok=True)
+        self.load()
+        if not self.segments:
+            self._start_segment(0)
+            return
+        segment = self.segments[-1]
+        if os.path.getsize(self._segment_path(segment)) < len(SEGMENT_MAGIC):
+            # Cut off while it was being created.
+            os.remove(self._segment_path(segment))
+            self.segments.pop()
+            self._start_segment(segment)
+            return
+        for _ in self._scan(segment, self.live_entries[-1][1] if self.live_entries else None):
+            pass
+        if self.scan_offset < os.path.getsize(self._segment_path(segment)):
+            self.logger.warning(
+                f"Dropping a torn record at the end of {self._segment_path(segment)}.")
+            with open(self._segment_path(segment), "r+b") as f:
+                f.truncate(self.scan_offset)
+        self.live = open(self._segment_path(segment), "ab")
+
+    def _start_segment(self, segment):
+        self.segments.append(segment)
+        self.live_entries = list()
+        self.live = open(self._segment_path(segment), "ab")
+        self.live.write(SEGMENT_MAGIC)
+        self.live.flush()
+
+    def _save_index(self):
+        # Called with the lock held, for the live segment.
+        segment = self.segments[-1]
+        index_path = self._index_path(segment)
+        tmp_path = f"{index_path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(INDEX_HEAD.pack(INDEX_MAGIC, self.live.tell()))
+            f.write(b"".join(INDEX_ENTRY.pack(key, offset) for key, offset in self.live_entries))
+        os.replace(tmp_path, index_path)
+
+    def _compress(self, content):
+        if self.codec == ZLIB:
+            return zlib.compress(content, ZLIB_LEVEL)
+        if self.codec == ZSTD:
+            compressor = getattr(self.compressors, "zstd", None)
+            if compressor is None:
+                import zstandard
+                compressor = self.compressors.zstd = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+            return compressor.compress(content)
+        return content
+
+    def _decompress(self, codec, data, raw_length):
+        if codec == ZLIB:
+            return zlib.decompress(data)
+        if codec == ZSTD:
+            import zstandard
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=raw_length)
+        return bytes(data)
+
+    def append(self, url, status, content):
+        ''' Store the page of the url. '''
+        content = content or b""
+        # Compress outside the lock; zlib lets other threads run meanwhile.
+        stored = self._compress(content)
+        encoded = url.encode("utf-8")
+        key = url_key(url)
+        head = RECORD_HEAD.pack(key, self.codec, status, len(encoded), len(stored), len(content))
+        with self.lock:
+            if self.live.tell() + len(head) + len(encoded) + len(stored) > self.segment_bytes \
+                    and self.live_entries:
+                self._save_index()
+                self.live.close()
+                self._start_segment(self.segments[-1] + 1)
+            offset = self.live.tell()
+            self.live.write(head + encoded + stored)
+            self.live.flush()
+            self.live_entries.append((key, offset))
+            self.index[key] = (self.segments[-1], offset)
+
+    def _read(self, segment, offset):
+        with self.lock:
+            data = self._map(segment, offset + RECORD_HEAD.size)
+            key, codec, status, url_length, stored_length, raw_length = RECORD_HEAD.unpack_from(data, offset)
+            start = offset + RECORD_HEAD.size
+            data = self._map(segment, start + url_length + stored_length)
+            url = data[start:start + url_length].decode("utf-8")
+            start += url_length
+            # Copied out, as the map may be closed once the lock is let go.
+            stored = data[start:start + stored_length]
+        # Decompress outside the lock; zlib lets other threads run meanwhile.
+        content = self._decompress(codec, stored, raw_length)
+        return StoredPage(url, status, content)
+
+    def get(self, url):
+        ''' The StoredPage of the url, or None if it is not stored. '''
+        with self.lock:
+            location = self.index.get(url_key(url))
+        if location is None:
+            return None
+        return self._read(*location)
+
+    def __contains__(self, url):
+        return url_key(url) in self.index
+
+    def __len__(self):
+        return len(self.index)
+
+    def scan(self):
+        ''' Yield the latest StoredPage of every url in the order they were
+        stored, reading every segment front to back. '''
+        for segment in list(self.segments):
+            for offset, head in self._scan(segment):
+                if self.index.get(head[0]) == (segment, offset):
+                    yield self._read(segment, offset)
+
+    def close(self):
+        with self.lock:
+            if self.live is not None:
+                self._save_index()
+                self.live.close()
+                self.live = None
+            for data in self.maps.values():
+                data.close()
+            self.maps.clear()
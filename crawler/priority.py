@@ -0,0 +1,208 @@
+import heapq
+import math
+import time
+
+from bisect import bisect_left
+from collections import Counter, deque, namedtuple
+from datetime import datetime, timezone
+
+from utils.link_graph import load_ranks, node_key
+
+BUCKET_WIDTH = 0.25     # urls whose costs differ by less than this share a bucket
+LASTMOD_HALF_LIFE = 180 * 86400     # seconds after which a sitemap lastmod counts half
+
+# What a sitemap says about a url: its priority in [0, 1] and the unix time
+# of its lastmod, each None if not given.
+SitemapEntry = namedtuple("SitemapEntry", ["priority", "lastmod"])
+
+
+def parse_sitemap_entry(priority, lastmod):
+    ''' SitemapEntry of the text of a <priority> and a <lastmod>, either of
+    which may be None or malformed. '''
+    try:
+        priority = min(max(float(priority), 0.0), 1.0)
+    except (TypeError, ValueError):
+        priority = None
+    try:
+        modified = datetime.fromisoformat(lastmod.strip())
+        if modified.tzinfo is None:
+            modified = modified.replace(tzinfo=timezone.utc)
+        lastmod = modified.timestamp()
+    except (AttributeError, ValueError):
+        lastmod = None
+    return SitemapEntry(priority, lastmod)
+
+
+class Scorer(object):
+    ''' Part of the cost of a url; the frontier serves cheaper urls first.
+    Scorers see every link found and every url queued through the hooks,
+    which the frontier calls with its lock held. '''
+    @classmethod
+    def from_config(cls, config):
+        return cls()
+
+    def score(self, url, host, depth, sitemap):
+        raise NotImplementedError
+
+    def linked(self, url):
+        pass
+
+    def queued(self, url, host):
+        pass
+
+    def dequeued(self, url):
+        pass
+
+
+class DepthScorer(Scorer):
+    ''' Links followed from a seed, which makes the crawl breadth first. '''
+    def score(self, url, host, depth, sitemap):
+        return depth
+
+
+class SitemapScorer(Scorer):
+    ''' Urls listed in a sitemap go first, more so with a high priority or a
+    recent lastmod: from 0 for urls in no sitemap down to -2. '''
+    def score(self, url, host, depth, sitemap):
+        if sitemap is None:
+            return 0.0
+        cost = -(0.5 if sitemap.priority is None else sitemap.priority)
+        if sitemap.lastmod is not None:
+            age = max(time.time() - sitemap.lastmod, 0.0)
+            cost -= 0.5 ** (age / LASTMOD_HALF_LIFE)
+        return cost
+
+
+class HostScorer(Scorer):
+    ''' Spreads the crawl over hosts: log2 of 1 + the urls queued for the
+    url's host so far. '''
+    def __init__(self):
+        self.host_urls = Counter()  # key: host, val: urls queued
+
+    def score(self, url, host, depth, sitemap):
+        return math.log2(1 + self.host_urls[host])
+
+    def queued(self, url, host):
+        self.host_urls[host] += 1
+
+
+class InDegreeScorer(Scorer):
+    ''' Urls many pages link to go first: -log2 of 1 + the links to the url
+    found so far. Queued urls move up as more links to them are found.
+
+    Links are counted exactly, for the queued urls only: a url counts the
+    link it was queued from, and its count is dropped once it is handed
+    out, since it is not scored again. '''
+    def __init__(self):
+        self.links = dict()     # key: queued url, val: links found to it
+
+    def score(self, url, host, depth, sitemap):
+        return -math.log2(1 + self.links.get(url, 0))
+
+    def linked(self, url):
+        if url in self.links:
+            self.links[url] += 1
+
+    def queued(self, url, host):
+        self.links.setdefault(url, 1)
+
+    def dequeued(self, url):
+        self.links.pop(url, None)
+
+
+class PageRankScorer(Scorer):
+    ''' Urls with a high PageRank in the link graph of an earlier crawl go
+    first: -log2 of 1 + the rank relative to the mean, as analyze_links.py
+    last saved it in LINK_GRAPH. Urls not in that graph cost 0. '''
+    def __init__(self, ranks=None):
+        self.keys, self.ranks = ranks or ((), ())   # sorted node keys, their ranks
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(load_ranks(config.link_graph))
+
+    def score(self, url, host, depth, sitemap):
+        if not self.keys:
+            return 0.0
+        key = node_key(url)
+        i = bisect_left(self.keys, key)
+        if i == len(self.keys) or self.keys[i] != key:
+            return 0.0
+        return -math.log2(1 + self.ranks[i])
+
+
+SCORERS = {
+    "depth": DepthScorer,
+    "sitemap": SitemapScorer,
+    "hosts": HostScorer,
+    "indegree": InDegreeScorer,
+    "pagerank": PageRankScorer,
+}
+
+
+class UrlScorer(object):
+    ''' Weighted sum of the configured scorers, as a bucket number: the
+    frontier serves the lowest bucket first and a bucket in FIFO order, so
+    with no scorers every url shares bucket 0 and the order is FIFO. Scorers
+    that read files of the crawl are built from config when it is given. '''
+    def __init__(self, weights=None, config=None):
+        self.scorers = [
+            (SCORERS[name].from_config(config) if config else SCORERS[name](), weight)
+            for name, weight in (weights or dict()).items() if weight]
+        # Only a cost that depends on links found later can improve.
+        self.rescores = any(isinstance(scorer, InDegreeScorer) for scorer, _ in self.scorers)
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.priority, config)
+
+    def bucket(self, url, host, depth=0, sitemap=None):
+        cost = 0.0
+        for scorer, weight in self.scorers:
+            cost += weight * scorer.score(url, host, depth, sitemap)
+        return math.floor(cost / BUCKET_WIDTH)
+
+    def linked(self, url):
+        for scorer, _ in self.scorers:
+            scorer.linked(url)
+
+    def queued(self, url, host):
+        for scorer, _ in self.scorers:
+            scorer.queued(url, host)
+
+    def dequeued(self, url):
+        for scorer, _ in self.scorers:
+            scorer.dequeued(url)
+
+
+class HostQueue(object):
+    ''' The urls queued for one host, in a deque per bucket with the bucket
+    numbers in a heap: a url costs a deque slot whatever the number of
+    buckets, and push and pop are O(1) within a bucket. '''
+    __slots__ = ("buckets", "order")
+
+    def __init__(self):
+        self.buckets = dict()   # key: bucket, val: deque of urls
+        self.order = list()     # heap of the bucket numbers in buckets
+
+    def push(self, bucket, url):
+        queue = self.buckets.get(bucket)
+        if queue is None:
+            queue = self.buckets[bucket] = deque()
+            heapq.heappush(self.order, bucket)
+        queue.append(url)
+
+    def best(self):
+        return self.order[0]
+
+    def pop(self):
+        bucket = self.order[0]
+        queue = self.buckets[bucket]
+        url = queue.popleft()
+        if not queue:
+            heapq.heappop(self.order)
+            del self.buckets[bucket]
+        return url
+
+    def __bool__(self):
+        return bool(self.order)
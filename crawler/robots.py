@@ -0,0 +1,111 @@
+import time
+
+from threading import Lock, Event
+from urllib import robotparser
+from urllib.parse import urlparse
+
+from utils import get_logger
+from utils.download import download
+
+
+class RobotsCache(object):
+    ''' Parsed robots.txt rules per host, fetched through the cache server.
+
+    Rules are kept for config.robots_ttl seconds. A robots.txt that is
+    missing (4xx) allows everything. One that cannot be fetched (5xx or a
+    cache server error) disallows everything, and that answer is cached
+    for config.robots_negative_ttl seconds so the host is not asked again
+    for every url; check() tells it apart from a real disallow.
+
+    reserve_host and release_host, if given, are called around each fetch
+    with the netloc, so a fetch keeps the host's politeness delay.
+    reserve_host returns whether it reserved the host. '''
+    def __init__(self, config, reserve_host=None, release_host=None):
+        self.logger = get_logger("ROBOTS", "FRONTIER")
+        self.config = config
+        self.user_agent = config.user_agent
+        self.reserve_host = reserve_host
+        self.release_host = release_host
+        self.lock = Lock()
+        self.rules = dict()     # key: netloc, val: (expiry time, RobotFileParser, whether the fetch failed)
+        self.fetching = dict()  # key: netloc, val: Event set once its fetch is done
+
+    def allowed(self, url):
+        return self.check(url)[0]
+
+    def check(self, url):
+        ''' (allowed, retry_at): whether robots.txt allows the url and, if
+        the robots.txt could not be fetched, the time.monotonic() after
+        which it is fetched again, or None. '''
+        parsed = urlparse(url)
+        expiry, rules, failed = self._get(parsed.scheme, parsed.netloc)
+        return rules.can_fetch(self.user_agent, url), expiry if failed else None
+
+    def crawl_delay(self, netloc):
+        ''' Crawl-delay of the host, or None. Never fetches. '''
+        with self.lock:
+            entry = self.rules.get(netloc)
+        if entry is None:
+            return None
+        try:
+            delay = entry[1].crawl_delay(self.user_agent)
+            return float(delay) if delay is not None else None
+        except (TypeError, ValueError):
+            return None
+
+    def sitemaps(self, url):
+        ''' Sitemap urls listed in the robots.txt of the url's host. '''
+        parsed = urlparse(url)
+        return self._get(parsed.scheme, parsed.netloc)[1].site_maps() or list()
+
+    def _get(self, scheme, netloc):
+        while True:
+            with self.lock:
+                entry = self.rules.get(netloc)
+                if entry is not None and entry[0] > time.monotonic():
+                    return entry
+                done = self.fetching.get(netloc)
+                if done is None:
+                    # This thread fetches; others asking for the host wait.
+                    done = self.fetching[netloc] = Event()
+                    break
+            done.wait()
+        try:
+            reserved = self.reserve_host is not None and self.reserve_host(netloc)
+            try:
+                rules, ttl, failed = self._fetch(scheme, netloc)
+            finally:
+                if reserved:
+                    self.release_host(netloc)
+            entry = (time.monotonic() + ttl, rules, failed)
+            with self.lock:
+                self.rules[netloc] = entry
+            return entry
+        finally:
+            with self.lock:
+                del self.fetching[netloc]
+            done.set()
+
+    def _fetch(self, scheme, netloc):
+        robots_url = f"{scheme}://{netloc}/robots.txt"
+        rules = robotparser.RobotFileParser(robots_url)
+        try:
+            resp = download(robots_url, self.config, self.logger)
+        except Exception as e:
+            self.logger.error(f"Failed to fetch {robots_url}: {e!r}")
+            resp = None
+        if resp is not None and resp.status == 200 and resp.raw_response:
+            content = resp.raw_response.content or b""
+            rules.parse(content.decode("utf-8", errors="replace").splitlines())
+            return rules, self.config.robots_ttl, False
+        if resp is not None and 400 <= resp.status < 500:
+            # No robots.txt, everything is allowed.
+            rules.allow_all = True
+            rules.modified()
+            return rules, self.config.robots_ttl, False
+        self.logger.info(
+            f"Could not fetch {robots_url}, disallowing the host for "
+            f"{self.config.robots_negative_ttl}s.")
+        rules.disallow_all = True
+        rules.modified()
+        return rules, self.config.robots_negative_ttl, True
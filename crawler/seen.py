@@ -0,0 +1,171 @@
+import heapq
+import math
+import sys
+
+from array import array
+from bisect import bisect_left
+
+
+class HashSeenSet(object):
+    ''' Every url digest in a python set. Fast, about 80 bytes per url. '''
+    def __init__(self):
+        self.digests = set()
+
+    def __contains__(self, digest):
+        return digest in self.digests
+
+    def __len__(self):
+        return len(self.digests)
+
+    def add(self, digest):
+        self.digests.add(digest)
+
+    def load(self, digests):
+        self.digests.update(digests)
+
+    def memory_usage(self):
+        if not self.digests:
+            return sys.getsizeof(self.digests)
+        sample = next(iter(self.digests))
+        return (sys.getsizeof(self.digests)
+                + len(self.digests) * sys.getsizeof(sample))
+
+
+class CompactSeenSet(object):
+    ''' The first 8 bytes of every url digest, as integers in a sorted
+    array with a small set of recent additions in front of it. The set is
+    merged into the array once it grows past an eighth of the array, which
+    keeps memory near 8 bytes per url plus the pending set. '''
+    MIN_MERGE = 65536
+    LOAD_RUN = 1000000
+
+    def __init__(self):
+        self.sorted = array("Q")
+        self.recent = set()
+
+    @staticmethod
+    def _key(digest):
+        return int.from_bytes(digest[:8], "big")
+
+    def __contains__(self, digest):
+        return self._contains_key(self._key(digest))
+
+    def _contains_key(self, key):
+        if key in self.recent:
+            return True
+        index = bisect_left(self.sorted, key)
+        return index < len(self.sorted) and self.sorted[index] == key
+
+    def __len__(self):
+        return len(self.sorted) + len(self.recent)
+
+    def add(self, digest):
+        key = self._key(digest)
+        if self._contains_key(key):
+            return
+        self.recent.add(key)
+        if len(self.recent) >= max(self.MIN_MERGE, len(self.sorted) // 8):
+            self.sorted = self._merge([self.sorted, sorted(self.recent)])
+            self.recent.clear()
+
+    def load(self, digests):
+        # Sort the digests in bounded runs and merge the runs once, so loading
+        # never holds more than one run as python integers.
+        runs = [self.sorted]
+        run = list()
+        for digest in digests:
+            run.append(self._key(digest))
+            if len(run) >= self.LOAD_RUN:
+                runs.append(array("Q", sorted(run)))
+                run = list()
+        runs.append(array("Q", sorted(run)))
+        runs.append(array("Q", sorted(self.recent)))
+        self.recent.clear()
+        self.sorted = self._merge(runs)
+
+    @staticmethod
+    def _merge(runs):
+        merged = array("Q")
+        last = None
+        for key in heapq.merge(*runs):
+            if key != last:
+                merged.append(key)
+                last = key
+        return merged
+
+    def memory_usage(self):
+        recent = sys.getsizeof(self.recent) + len(self.recent) * sys.getsizeof(2 ** 63)
+        return self.sorted.buffer_info()[1] * self.sorted.itemsize + recent
+
+
+class BloomFilter(object):
+    ''' Bit array answering "definitely not seen" for most new urls without
+    touching the exact set behind it. '''
+    def __init__(self, capacity, error_rate=0.01):
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, digest):
+        # Double hashing over the two halves of a 16 byte digest.
+        first = int.from_bytes(digest[:8], "big")
+        second = int.from_bytes(digest[8:16], "big") | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def __contains__(self, digest):
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(digest))
+
+    def add(self, digest):
+        for position in self._positions(digest):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def memory_usage(self):
+        return sys.getsizeof(self.bits)
+
+
+class SeenSet(object):
+    ''' Membership of url digests for the frontier, loaded once from the save
+    file so duplicate checks never go to disk. '''
+    def __init__(self, exact, bloom=None):
+        self.exact = exact
+        self.bloom = bloom
+
+    @classmethod
+    def from_config(cls, config):
+        exact = CompactSeenSet() if config.seen_set == "compact" else HashSeenSet()
+        bloom = None
+        if config.seen_bloom_capacity:
+            bloom = BloomFilter(config.seen_bloom_capacity)
+        return cls(exact, bloom)
+
+    def __contains__(self, digest):
+        if self.bloom is not None and digest not in self.bloom:
+            return False
+        return digest in self.exact
+
+    def __len__(self):
+        return len(self.exact)
+
+    def add(self, digest):
+        if self.bloom is not None:
+            self.bloom.add(digest)
+        self.exact.add(digest)
+
+    def load(self, digests):
+        if self.bloom is not None:
+            digests = self._add_to_bloom(digests)
+        self.exact.load(digests)
+
+    def _add_to_bloom(self, digests):
+        for digest in digests:
+            self.bloom.add(digest)
+            yield digest
+
+    def memory_usage(self):
+        usage = self.exact.memory_usage()
+        if self.bloom is not None:
+            usage += self.bloom.memory_usage()
+        return usage
@@ -0,0 +1,241 @@
+import os
+import time
+import zlib
+
+from multiprocessing import get_context
+from queue import Empty
+from threading import Thread, Lock, Event
+from urllib.parse import urlparse
+
+from utils import get_logger
+from utils.link_graph import load_analytics
+from utils.stats import CrawlStats
+from crawler.frontier import Frontier
+import scraper
+
+FORWARD_BATCH = 256     # urls per message to another shard
+FORWARD_INTERVAL = 0.1  # seconds a url may wait in an outbox
+IDLE_POLL = 0.1     # seconds between termination checks of an idle shard
+
+# status holds three counters per shard: IDLE, SENT and RECEIVED batches.
+IDLE, SENT, RECEIVED = range(3)
+
+
+def shard_of(url, shard_count):
+    # crc32 rather than hash(): it must agree across processes.
+    return zlib.crc32(urlparse(url).netloc.lower().encode("utf-8")) % shard_count
+
+
+def finished(snapshot, previous):
+    ''' Whether the crawl is over, from two status snapshots taken in a row:
+    every shard idle, every batch sent received, and nothing changed in
+    between. '''
+    idle = all(snapshot[IDLE::3])
+    balanced = sum(snapshot[SENT::3]) == sum(snapshot[RECEIVED::3])
+    return idle and balanced and snapshot == previous
+
+
+def shard_path(path, shard_id):
+    return f"{path}.shard{shard_id}"
+
+
+class ShardFrontier(Frontier):
+    ''' The frontier of one shard of a sharded crawl. It owns the hosts that
+    hash to it, so politeness stays per host; urls of other hosts are
+    forwarded to their shard in batches over its inbox queue.
+
+    The shard reports in status whether it is idle, with nothing queued, in
+    flight or waiting to be forwarded, and how many batches it sent and
+    received. The crawl ends once done is set. '''
+    def __init__(self, config, restart, shard_id, inboxes, status, done):
+        self.shard_id = shard_id
+        self.inboxes = inboxes
+        self.status = status
+        self.done = done
+        self.outboxes = [dict() for _ in inboxes]   # key: url, val: (depth, sitemap entry)
+        self.outbox_lock = Lock()
+        self.receiving = 0  # batches being added right now
+        self.closed = Event()
+        # Seeds of other shards are forwarded from the base initializer.
+        super().__init__(config, restart)
+        self.receiver = Thread(target=self._receive, daemon=True, name=f"Shard-{shard_id}-receiver")
+        self.forwarder = Thread(target=self._forward_periodically, daemon=True, name=f"Shard-{shard_id}-forwarder")
+        self.receiver.start()
+        self.forwarder.start()
+
+    def _set_status(self, counter, value):
+        self.status[3 * self.shard_id + counter] = value
+
+    def _add_status(self, counter, value):
+        index = 3 * self.shard_id + counter
+        self.status[index] = self.status[index] + value
+
+    def add_url(self, url, depth=0, sitemap=None):
+        shard = shard_of(url, len(self.inboxes))
+        if shard == self.shard_id:
+            return super().add_url(url, depth, sitemap)
+        with self.outbox_lock:
+            outbox = self.outboxes[shard]
+            outbox[url] = (depth, sitemap)
+            if len(outbox) >= FORWARD_BATCH:
+                self._forward(shard)
+        # Whether the other shard queues it is not known here.
+        return True
+
+    def add_urls(self, entries):
+        local = list()
+        with self.outbox_lock:
+            for url, depth, sitemap in entries:
+                shard = shard_of(url, len(self.inboxes))
+                if shard == self.shard_id:
+                    local.append((url, depth, sitemap))
+                    continue
+                outbox = self.outboxes[shard]
+                outbox[url] = (depth, sitemap)
+                if len(outbox) >= FORWARD_BATCH:
+                    self._forward(shard)
+        # Only the urls of this shard are counted.
+        return super().add_urls(local)
+
+    def owns(self, url):
+        return shard_of(url, len(self.inboxes)) == self.shard_id
+
+    def _forward(self, shard):
+        # Called with outbox_lock held.
+        self.inboxes[shard].put(list(self.outboxes[shard].items()))
+        self.outboxes[shard] = dict()
+        self._add_status(SENT, 1)
+
+    def _forward_periodically(self):
+        while not self.closed.wait(FORWARD_INTERVAL):
+            with self.outbox_lock:
+                for shard, outbox in enumerate(self.outboxes):
+                    if outbox:
+                        self._forward(shard)
+
+    def _receive(self):
+        inbox = self.inboxes[self.shard_id]
+        while not self.closed.is_set():
+            try:
+                urls = inbox.get(timeout=IDLE_POLL)
+            except Empty:
+                continue
+            # Busy before the batch counts as received, so the coordinator
+            # never sees it received by a shard that still looks idle.
+            with self.lock:
+                self.receiving += 1
+                self._set_status(IDLE, 0)
+            super().add_urls((url, depth, sitemap) for url, (depth, sitemap) in urls)
+            self._add_status(RECEIVED, 1)
+            with self.lock:
+                self.receiving -= 1
+
+    def get_tbd_url(self, timeout=None):
+        ''' Like Frontier.get_tbd_url, but a drained shard waits for urls from
+        other shards until the whole crawl is done. '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            if self.done.is_set() or self.stopping:
+                return None
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+            with self.lock:
+                if self.is_drained():
+                    # Wait here: the base frontier would wake every other
+                    # waiting worker each time it finds itself drained.
+                    with self.outbox_lock:
+                        idle = not self.receiving and not any(self.outboxes)
+                    self._set_status(IDLE, int(idle))
+                    self.has_ready.wait(IDLE_POLL)
+                    continue
+            url = super().get_tbd_url(timeout=IDLE_POLL)
+            if url:
+                return url
+
+    def close(self):
+        self.closed.set()
+        self.forwarder.join()
+        self.receiver.join()
+        super().close()
+
+
+def run_shard(config, restart, shard_id, inboxes, status, done):
+    ''' Entry point of a shard process: a Crawler over a ShardFrontier with
+    its own save, stats and report files. '''
+    from crawler import Crawler
+    config.save_file = shard_path(config.save_file, shard_id)
+    config.stats_file = shard_path(config.stats_file, shard_id)
+    config.pages_file = shard_path(config.pages_file, shard_id)
+    if config.page_store:
+        config.page_store = shard_path(config.page_store, shard_id)
+    if config.link_graph:
+        config.link_graph = shard_path(config.link_graph, shard_id)
+    if config.metrics_port:
+        config.metrics_port += shard_id
+    scraper.report_file = shard_path(scraper.report_file, shard_id)
+
+    def frontier_factory(config, restart):
+        return ShardFrontier(config, restart, shard_id, inboxes, status, done)
+
+    Crawler(config, restart, frontier_factory=frontier_factory).start()
+
+
+class ShardedCrawler(object):
+    ''' Crawls with config.shards processes, each owning the hosts whose
+    name hashes to it, then merges their statistics into report.txt.
+
+    The crawl is over when every shard is idle and every batch sent was
+    received, in two status snapshots in a row that are equal. Keep SHARDS
+    the same when resuming a crawl, since the saved urls are split by it. '''
+    def __init__(self, config, restart):
+        self.config = config
+        self.restart = restart
+        self.logger = get_logger("CRAWLER")
+
+    def start(self):
+        shard_count = self.config.shards
+        # spawn, not fork: every shard starts its own threads.
+        context = get_context("spawn")
+        inboxes = [context.Queue() for _ in range(shard_count)]
+        status = context.Array("q", 3 * shard_count, lock=False)
+        done = context.Event()
+        processes = [
+            context.Process(
+                target=run_shard, name=f"Shard-{shard_id}",
+                args=(self.config, self.restart, shard_id, inboxes, status, done))
+            for shard_id in range(shard_count)]
+        for process in processes:
+            process.start()
+        self.logger.info(f"Started {shard_count} shards.")
+
+        previous = None
+        while not done.is_set():
+            time.sleep(IDLE_POLL)
+            failed = [process.name for process in processes
+                      if not process.is_alive() and process.exitcode != 0]
+            if failed:
+                self.logger.error(f"{', '.join(failed)} failed, stopping the crawl.")
+                done.set()
+                break
+            snapshot = list(status)
+            if finished(snapshot, previous):
+                done.set()
+            previous = snapshot
+        for process in processes:
+            process.join()
+        self.merge(shard_count)
+
+    def merge(self, shard_count):
+        config = self.config
+        stats = CrawlStats(config.near_duplicate_distance, config.top_words_capacity)
+        for shard_id in range(shard_count):
+            shard = CrawlStats(checkpoint_file=shard_path(config.stats_file, shard_id))
+            if os.path.exists(shard.checkpoint_file):
+                shard.load()
+                stats.merge(shard)
+        scraper.stats = stats
+        if config.link_graph:
+            # analyze_links.py saves the analytics of all the shards in each.
+            scraper.link_analytics = load_analytics(shard_path(config.link_graph, 0))
+        scraper.report()
+        self.logger.info(f"Merged the statistics of {shard_count} shards into {scraper.report_file}.")
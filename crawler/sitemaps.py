@@ -0,0 +1,150 @@
+import gzip
+import io
+import time
+import xml.etree.ElementTree as ET
+
+from collections import deque
+from urllib.parse import urlparse
+
+from utils import get_logger
+from utils.download import download
+from crawler.priority import parse_sitemap_entry
+import scraper
+
+GZIP_MAGIC = b"\x1f\x8b"
+MAX_INDEX_DEPTH = 3     # sitemap indexes followed below a top-level sitemap
+BATCH_URLS = 1000   # urls handed to the frontier at once
+
+
+def _local_name(tag):
+    # "{namespace}loc" -> "loc"; some sitemaps leave out the namespace.
+    return tag.rpartition("}")[2]
+
+
+def iter_sitemap(content):
+    ''' Yield ("url", loc, SitemapEntry) for each <url> of a urlset and
+    ("sitemap", loc, None) for each <sitemap> of a sitemap index.
+
+    The document is parsed incrementally and each entry is dropped once
+    read, so memory is bounded by one entry however long the sitemap is.
+    Gzipped content is decompressed as it is read. A malformed document
+    raises ET.ParseError after the entries before the error. '''
+    stream = io.BytesIO(content)
+    if content[:2] == GZIP_MAGIC:
+        stream = gzip.GzipFile(fileobj=stream)
+    depth = 0
+    root = None
+    for event, elem in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = elem
+            depth += 1
+            continue
+        depth -= 1
+        if depth != 1:
+            continue
+        # An entry right under the root; extensions such as image:image
+        # nest their own tags deeper and are ignored.
+        kind = _local_name(elem.tag)
+        if kind in ("url", "sitemap"):
+            fields = {_local_name(child.tag): (child.text or "").strip() for child in elem}
+            loc = fields.get("loc")
+            if loc:
+                entry = None
+                if kind == "url":
+                    entry = parse_sitemap_entry(fields.get("priority"), fields.get("lastmod"))
+                yield kind, loc, entry
+        root.clear()
+
+
+class SitemapReader(object):
+    ''' Reads the sitemaps of a crawl once, while its workers start on the
+    seeds: those of config.sitemaps and those listed in the robots.txt of
+    each seed host, following sitemap indexes up to MAX_INDEX_DEPTH deep and
+    reading at most config.max_sitemaps documents.
+
+    Sitemaps are fetched one at a time and only from the crawl's domains.
+    Each fetch reserves its host in the frontier, so it keeps the same
+    POLITENESS as the workers' fetches from that host. Their urls go to the
+    frontier in batches of BATCH_URLS through Frontier.add_urls, with the
+    priority and lastmod that feed the sitemap scorer. '''
+    def __init__(self, config, frontier):
+        self.logger = get_logger("SITEMAP", "FRONTIER")
+        self.config = config
+        self.frontier = frontier
+
+    def sources(self):
+        ''' The top-level sitemaps of this crawl, in order, without repeats.
+        A shard reads the sitemaps of its own hosts only; the urls they list
+        may belong to any shard. '''
+        urls = list(self.config.sitemaps)
+        hosts = set()
+        for seed in self.config.seed_urls:
+            seed = seed.strip()
+            host = urlparse(seed).netloc
+            if host and host not in hosts and self.frontier.owns(seed):
+                hosts.add(host)
+                urls.extend(self.frontier.robots.sitemaps(seed))
+        return [url for url in dict.fromkeys(url.strip() for url in urls if url.strip())
+                if self.frontier.owns(url)]
+
+    def _fetchable(self, url):
+        hostname = urlparse(url).hostname
+        return (hostname and scraper.url_filter.in_domain(hostname.lower())
+                and self.frontier.robots.allowed(url))
+
+    def _download(self, url):
+        # None if the frontier stopped while waiting for the host.
+        host = urlparse(url).netloc
+        if not self.frontier.reserve_host(host):
+            return None
+        try:
+            return download(url, self.config, self.logger)
+        finally:
+            self.frontier.release_host(host)
+
+    def run(self):
+        ''' Read the sitemaps and return how many urls they queued. '''
+        if self.config.max_sitemaps <= 0:
+            return 0
+        started = time.time()
+        pending = deque((url, 0) for url in self.sources())
+        fetched = set()
+        listed = queued = 0
+        while pending and len(fetched) < self.config.max_sitemaps:
+            url, depth = pending.popleft()
+            if url in fetched or not self._fetchable(url):
+                continue
+            fetched.add(url)
+            resp = self._download(url)
+            if resp is None:
+                break
+            if resp.status != 200 or not resp.raw_response:
+                self.logger.info(f"Could not fetch sitemap {url}, status <{resp.status}>.")
+                continue
+            batch = list()
+            try:
+                for kind, loc, entry in iter_sitemap(resp.raw_response.content or b""):
+                    if kind == "sitemap":
+                        if depth < MAX_INDEX_DEPTH:
+                            pending.append((loc, depth + 1))
+                        continue
+                    listed += 1
+                    if scraper.is_valid(loc):
+                        batch.append((loc, 0, entry))
+                    if len(batch) >= BATCH_URLS:
+                        queued += self.frontier.add_urls(batch)
+                        batch = list()
+            except (ET.ParseError, OSError, EOFError) as e:
+                self.logger.warning(f"Stopped reading malformed sitemap {url}: {e!r}")
+            if batch:
+                queued += self.frontier.add_urls(batch)
+            self.logger.debug("Read sitemap %s.", url)
+        if pending and len(fetched) >= self.config.max_sitemaps:
+            self.logger.info(
+                f"Stopped after {len(fetched)} sitemaps (MAX_SITEMAPS), "
+                f"{len(pending)} left unread.")
+        self.logger.info(
+            f"Read {len(fetched)} sitemaps listing {listed} urls, queued {queued} "
+            f"new urls in {time.time() - started:.2f}s.")
+        return queued
@@ -4,54 +4,52 @@ from inspect import getsource
 from urllib.parse import parse_qs, urlparse
 from utils.download import download
 from utils import get_logger
+from utils.metrics import metrics
 import scraper
-import time
-import xml.etree.ElementTree as ET
 
 
 class Worker(Thread):
-    def __init__(self, worker_id, config, frontier):
+    def __init__(self, worker_id, config, frontier, page_store=None):
         self.logger = get_logger(f"Worker-{worker_id}", "Worker")
         self.config = config
         self.frontier = frontier
+        self.page_store = page_store
         # basic check for requests in scraper
         assert {getsource(scraper).find(req) for req in {"from requests import", "import requests"}} == {-1}, "Do not use requests in scraper.py"
         assert {getsource(scraper).find(req) for req in {"from urllib.request import", "import urllib.request"}} == {-1}, "Do not use urllib.request in scraper.py"
-        super().__init__(daemon=True)
-        
-    def run(self):
-        sitemap_urls = ["https://ics.uci.edu/post-sitemap.xml", "https://cs.ics.uci.edu/page-sitemap.xml"]
-        for sitemap in sitemap_urls:
-            sitemap_resp = download(sitemap, self.config, self.logger)
-            try:
-                content = sitemap_resp.raw_response.content
-                text_content = content.decode('utf-8')
-                root = ET.fromstring(text_content)
-
-                print("sitemap found")
-                
-                urls = [url.text for url in root.findall('.//{http://www.sitemaps.org/schemas/sitemap/0.9}loc')]
-                for url in urls:
-                    self.frontier.add_url(url)
-            except:
-                continue
+        super().__init__(daemon=True, name=f"Worker-{worker_id}")
 
+    def run(self):
         while True:
-            tbd_url = self.frontier.get_tbd_url()
+            # Waiting here is the politeness sleep: no queued host is ready.
+            with metrics.stage("sleep"):
+                tbd_url = self.frontier.get_tbd_url()
             if not tbd_url:
                 self.logger.info("Frontier is empty. Stopping Crawler.")
                 break
-            resp = download(tbd_url, self.config, self.logger)
-            self.logger.info(
-                f"Downloaded {tbd_url}, status <{resp.status}>, "
-                f"using cache {self.config.cache_server}.")
+            try:
+                with metrics.stage("download") as timer:
+                    resp = download(tbd_url, self.config, self.logger)
+                metrics.record_host_fetch(urlparse(tbd_url).hostname, resp.status, timer.seconds)
+                self.logger.debug(
+                    "Downloaded %s, status <%s>, using cache %s.",
+                    tbd_url, resp.status, self.config.cache_server)
 
-            if resp.status == 200:
-                scraped_urls = scraper.scraper(tbd_url, resp)
-                for scraped_url in scraped_urls:
-                    self.frontier.add_url(scraped_url)
-            self.frontier.mark_url_complete(tbd_url)
-            time.sleep(self.config.time_delay)
+                if resp.status == 200:
+                    if self.page_store is not None and resp.raw_response:
+                        with metrics.stage("store"):
+                            self.page_store.append(tbd_url, resp.status, resp.raw_response.content)
+                    scraped_urls = scraper.scraper(tbd_url, resp)
+                    queued = 0
+                    depth = self.frontier.depth_of(tbd_url) + 1
+                    with metrics.stage("frontier_add"):
+                        for scraped_url in scraped_urls:
+                            queued += bool(self.frontier.add_url(scraped_url, depth))
+                    scraper.record_links(tbd_url, queued)
+            finally:
+                # Politeness is enforced by the frontier per host, so there is
+                # no sleep here; completing the url releases its host.
+                self.frontier.mark_url_complete(tbd_url)
         
         # create report.txt and record statistic
         scraper.report()
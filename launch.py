@@ -1,23 +1,53 @@
+import time
+
+STARTED = time.monotonic()  # before the imports, which count towards startup
+
 from configparser import ConfigParser
 from argparse import ArgumentParser
 
-from utils.server_registration import get_cache_server
 from utils.config import Config
 from crawler import Crawler
 
 
-def main(config_file, restart):
+def main(config_file, restart, cache_server=None, profile=None, profile_file=None):
     cparser = ConfigParser()
     cparser.read(config_file)
     config = Config(cparser)
-    config.cache_server = get_cache_server(config, restart)
-    crawler = Crawler(config, restart)
-    crawler.start()
+    if cache_server:
+        # A cache server given directly, e.g. the local stub in bench/, is
+        # used without registering with spacetime.
+        host, port = cache_server.rsplit(":", 1)
+        config.cache_server = (host, int(port))
+    else:
+        from utils.server_registration import get_cache_server
+        config.cache_server = get_cache_server(config, restart)
+    if config.shards > 1:
+        from crawler.shard import ShardedCrawler
+        crawler = ShardedCrawler(config, restart)
+    else:
+        crawler = Crawler(config, restart, started=STARTED)
+    if profile:
+        from utils.profiling import make_profiler
+        profiler = make_profiler(profile, profile_file)
+        profiler.start()
+        try:
+            crawler.start()
+        finally:
+            profiler.stop()
+    else:
+        crawler.start()
 
 
 if __name__ == "__main__":
     parser = ArgumentParser()
     parser.add_argument("--restart", action="store_true", default=False)
     parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--cache_server", type=str, default=None,
+                        help="host:port of a cache server to use without registering")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], default=None,
+                        help="profile every crawler thread with cProfile, or by sampling stacks")
+    parser.add_argument("--profile_file", type=str, default=None,
+                        help="defaults to crawl.pstats for cprofile, crawl.folded for sample")
     args = parser.parse_args()
-    main(args.config_file, args.restart)
+    profile_file = args.profile_file or {"cprofile": "crawl.pstats", "sample": "crawl.folded"}.get(args.profile)
+    main(args.config_file, args.restart, args.cache_server, args.profile, profile_file)
@@ -0,0 +1,85 @@
+import time
+
+from argparse import ArgumentParser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from configparser import ConfigParser
+
+from utils import get_logger, set_log_level
+from utils.config import Config
+from utils.link_graph import load_analytics
+from utils.response import Response
+from crawler.page_store import PageStore
+import scraper
+
+
+class StoredRawResponse(object):
+    ''' The raw_response of a page read back from the page store. '''
+    def __init__(self, url, content):
+        self.url = url
+        self.content = content
+
+
+def main(config_file, page_store=None, report_file="report.txt"):
+    ''' Parse every page of the page store again, through the scraper and
+    the report, without the cache server. The statistics start empty and are
+    kept in memory; the crawl's STATS_FILE, PAGES_FILE and LINK_GRAPH are not
+    touched, though the report shows the last analysis of the link graph. '''
+    cparser = ConfigParser()
+    cparser.read(config_file)
+    config = Config(cparser)
+    set_log_level(config.log_level)
+    logger = get_logger("REPROCESS")
+    config.stats_file = ""
+    config.pages_file = ""
+    link_graph, config.link_graph = config.link_graph, ""
+    scraper.configure(config)
+    scraper.link_analytics = load_analytics(link_graph)
+    scraper.report_file = report_file
+
+    store = PageStore(page_store or config.page_store)
+    store.load()
+    logger.info(f"Reprocessing {len(store)} pages of {store.path}.")
+
+    def process(page):
+        resp = Response({"url": page.url, "status": page.status})
+        resp.raw_response = StoredRawResponse(page.url, page.content)
+        scraper.scraper(page.url, resp)
+
+    started = time.monotonic()
+    count = 0
+    if config.parse_processes > 0:
+        # Keep every parse process busy while this thread reads the store,
+        # with at most two pages per process read ahead: pool.map would read
+        # and hold the whole store before parsing the first page.
+        with ThreadPoolExecutor(config.parse_processes) as pool:
+            pending = deque()
+            for page in store.scan():
+                if len(pending) >= 2 * config.parse_processes:
+                    pending.popleft().result()
+                    count += 1
+                pending.append(pool.submit(process, page))
+            for future in pending:
+                future.result()
+                count += 1
+    else:
+        for page in store.scan():
+            process(page)
+            count += 1
+    elapsed = time.monotonic() - started
+    store.close()
+    scraper.close()
+    scraper.report()
+    logger.info(
+        f"Reprocessed {count} pages in {elapsed:.2f}s "
+        f"({count / elapsed if elapsed else 0:.1f} pages/sec) into {report_file}.")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--config_file", type=str, default="config.ini")
+    parser.add_argument("--page_store", type=str, default=None,
+                        help="directory of the page store, defaults to PAGE_STORE of the config")
+    parser.add_argument("--report_file", type=str, default="report.txt")
+    args = parser.parse_args()
+    main(args.config_file, args.page_store, args.report_file)
@@ -1,55 +1,154 @@
-import re
-from urllib.parse import urlparse, urldefrag, urljoin, parse_qs
-from bs4 import BeautifulSoup
-from collections import defaultdict
-from urllib import robotparser
-
-stop_words = ['a', 'about', 'above', 'after', 'again', 'against', 'all', 'am', 'an', 'and', 'any', 'are', "aren't",
-              'as', 'at', 'be', 'because', 'been', 'before', 'being', 'below', 'between', 'both', 'but', 'by',
-              "can't", 'cannot', 'could', "couldn't", 'did', "didn't", 'do', 'does', "doesn't", 'doing', "don't",
-              'down', 'during', 'each', 'few', 'for', 'from', 'further', 'had', "hadn't", 'has', "hasn't", 'have',
-              "haven't", 'having', 'he', "he'd", "he'll", "he's", 'her', 'here', "here's", 'hers', 'herself', 'him',
-              'himself', 'his', 'how', "how's", 'i', "i'd", "i'll", "i'm", "i've", 'if', 'in', 'into', 'is', "isn't",
-              'it', "it's", 'its', 'itself', "let's", 'me', 'more', 'most', "mustn't", 'my', 'myself', 'no', 'nor',
-              'not', 'of', 'off', 'on', 'once', 'only', 'or', 'other', 'ought', 'our', 'ours', 'ourselves', 'out',
-              'over', 'own', 'same', "shan't", 'she', "she'd", "she'll", "she's", 'should', "shouldn't", 'so', 'some',
-              'such', 'than', 'that', "that's", 'the', 'their', 'theirs', 'them', 'themselves', 'then', 'there',
-              "there's", 'these', 'they', "they'd", "they'll", "they're", "they've", 'this', 'those', 'through', 'to',
-              'too', 'under', 'until', 'up', 'very', 'was', "wasn't", 'we', "we'd", "we'll", "we're", "we've", 'were',
-              "weren't", 'what', "what's", 'when', "when's", 'where', "where's", 'which', 'while', 'who', "who's",
-              'whom', 'why', "why's", 'with', "won't", 'would', "wouldn't", 'you', "you'd", "you'll", "you're",
-              "you've", 'your', 'yours', 'yourself', 'yourselves']
-
-visited_unique_pages = {} # key: hash of the content, val: url itself
-max_tokens = 0  # words that longest page contains
-longest_page_url = "" 
-word_freqs = defaultdict(int)  # key: the word, value: freqs
-links_in_domain = defaultdict(set)  # all the links in the ics.uci.edu domain / key: host name of url, val: url in under this host name (domain)
-
-robots_list = {}  # store robots rules that have been read; prevent reading robots.txt repeatly
+import time
+from urllib.parse import urlparse, urldefrag, urljoin
+from collections import namedtuple, Counter
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from utils import get_logger
+from utils.extract import extract, LINK
+from utils.metrics import metrics
+from utils.simhash import simhash
+from utils.recrawl import RecrawlStore, NEW, CHANGED, UNCHANGED
+from utils.stats import CrawlStats
+from utils.tokenizer import STOP_WORDS, get_stemmer
+from utils import tokenizer
+from utils.trap_detector import TrapDetector
+from utils.url_filter import UrlFilter
+from utils.link_graph import LinkGraphWriter, load_analytics
+
+stop_words = STOP_WORDS  # a frozenset, see utils/tokenizer.py
+
+logger = get_logger("SCRAPER", "Worker")
+
+stats = CrawlStats()  # unique pages, longest page, word freqencies and pages per ics.uci.edu subdomain
+
+url_filter = UrlFilter()  # decides which urls to crawl, see is_valid
+
+traps = TrapDetector()  # drops url templates that stopped producing new content and enforces per host budgets
+
+pages = RecrawlStore()  # fingerprint and revisit time of every page fetched, tells unchanged pages apart
+
+report_file = "report.txt"  # where report() writes; a shard of a sharded crawl writes its own
+
+parser_backend = "stream"  # "stream" extracts in one pass; otherwise the parser BeautifulSoup builds the page tree with
+max_page_bytes = 500000000  # avoiding crawing too large files : 500 MB limits
+parse_byte_budget = 0  # parse at most this many bytes of a page; 0 for no limit
+parse_token_budget = 0  # stop parsing a page after this many tokens; 0 for no limit
+stemmer = "none"  # how tokens are stemmed before they are counted, see utils/tokenizer.py
+parse_pool = None  # process pool that parses pages off the GIL; None parses in the calling thread
+link_graph = None  # links of every new page crawled, see utils/link_graph.py; None records none
+link_analytics = None  # in-degrees, PageRank and host link counts of the graph, from analyze_links.py
+
+# What parsing a page gives back: the absolute links, the filtered token counts,
+# the number of filtered tokens, the simhash of the token counts and the seconds
+# spent tokenizing, which the parse pool cannot add to the metrics itself.
+ParsedPage = namedtuple("ParsedPage", ["links", "token_counts", "token_count", "fingerprint", "tokenize_seconds"])
+
+
+def configure(config, restart=False):
+    global parser_backend, parse_pool, max_page_bytes, parse_byte_budget, parse_token_budget, stemmer
+    global stats, url_filter, traps, pages, link_graph, link_analytics
+    stats = CrawlStats.from_config(config, restart)
+    pages = RecrawlStore.from_config(config, restart)
+    url_filter = UrlFilter.from_config(config)
+    traps = TrapDetector.from_config(config)
+    parser_backend = config.parser
+    max_page_bytes = config.max_page_bytes
+    parse_byte_budget = config.parse_byte_budget
+    parse_token_budget = config.parse_token_budget
+    stemmer = config.stemmer
+    link_graph = LinkGraphWriter.from_config(config, restart)
+    link_analytics = load_analytics(config.link_graph)
+    if config.parse_processes > 0:
+        # spawn, not fork: the crawler already runs threads holding locks.
+        parse_pool = ProcessPoolExecutor(
+            config.parse_processes, mp_context=get_context("spawn"))
+
+def close():
+    if parse_pool is not None:
+        parse_pool.shutdown()
+    if link_graph is not None:
+        link_graph.close()
 
 
 def scraper(url, resp):
     links = extract_next_links(url, resp)
-    return [link for link in links if is_valid(link)]
+    with metrics.stage("filter"):
+        return url_filter.filter(links)
 
-def tokenize(html_text):
-    eng_tokens = re.findall(r'\b[a-zA-Z][a-zA-Z\']*[a-zA-Z]\b', html_text)  # tokenize 
-    filtered_tokens = []
-    for token in eng_tokens:
-        if token and token.lower() not in stop_words:  # filter out stop words and empty string
-            filtered_tokens.append(token.lower())
-    return filtered_tokens
+def tokenize(html_text, stem=None):
+    # Lowercase tokens without stop words; the compiled pattern and the
+    # stop word set are in utils/tokenizer.py.
+    return tokenizer.tokenize(html_text, stem)
 
-def is_similar_page(url, contents):
+def parse_page(url, content, parser="stream", max_bytes=0, max_tokens=0, stemmer="none"):
     '''
-    contents: list of tokens
+    Parse one page into a ParsedPage, reading at most max_bytes bytes and
+    max_tokens tokens when they are set. This runs in the parse pool, so it
+    must not touch the module statistics.
     '''
-    url_content_hash = hash(tuple(contents))  # hash the content
-    if url_content_hash not in visited_unique_pages:
-        visited_unique_pages[url_content_hash] = url
-        return False
-    return True
+    stem = get_stemmer(stemmer)
+    if parser == "stream":
+        return parse_page_stream(url, content, max_bytes, max_tokens, stem)
+    from bs4 import BeautifulSoup   # only the tree parsers need it, so startup skips it
+    soup = BeautifulSoup(content[:max_bytes] if max_bytes else content, parser)
+    started = time.perf_counter()
+    filtered_tokens = tokenize(soup.getText(), stem) # tokenize the page
+    tokenize_seconds = time.perf_counter() - started
+    if max_tokens:
+        filtered_tokens = filtered_tokens[:max_tokens]
+    links = set()
+    for link in soup.find_all('a'):  # get all the url tag in the page
+        obtained_link = link.get('href')   # get the url inside the tag
+        if obtained_link:  # check it's not empty url
+            try:
+                links.add(urljoin(url, urldefrag(obtained_link).url)) # compose absolute url by joinging base url and defrag. url
+            except ValueError:
+                continue
+    token_counts = Counter(filtered_tokens)
+    return ParsedPage(list(links), token_counts, len(filtered_tokens), simhash(token_counts), tokenize_seconds)
+
+def parse_page_stream(url, content, max_bytes=0, max_tokens=0, stem=None):
+    '''
+    Single pass over the page: text is tokenized chunk by chunk as it is
+    found, so neither a tree nor the whole text is held in memory.
+    '''
+    links = set()
+    token_counts = Counter()
+    token_count = 0
+    tokenize_seconds = 0.0
+    for kind, value in extract(url, content, max_bytes=max_bytes):
+        if kind == LINK:
+            links.add(value)
+            continue
+        started = time.perf_counter()
+        if not max_tokens:
+            # Without a budget the tokens go straight into the counts.
+            tokenizer.count_tokens(value, token_counts, stem)
+            tokenize_seconds += time.perf_counter() - started
+            continue
+        filtered_tokens = tokenize(value, stem)
+        tokenize_seconds += time.perf_counter() - started
+        if token_count + len(filtered_tokens) >= max_tokens:
+            filtered_tokens = filtered_tokens[:max_tokens - token_count]
+        token_counts.update(filtered_tokens)
+        token_count += len(filtered_tokens)
+        if token_count >= max_tokens:
+            break   # token budget spent, stop parsing the page
+    if not max_tokens:
+        token_count = sum(token_counts.values())
+    return ParsedPage(list(links), token_counts, token_count, simhash(token_counts), tokenize_seconds)
+
+def parse(url, content):
+    with metrics.stage("parse"):
+        if parse_pool is None:
+            page = parse_page(url, content, parser_backend, parse_byte_budget, parse_token_budget, stemmer)
+        else:
+            # The calling thread waits without holding the GIL while a process parses.
+            page = parse_pool.submit(
+                parse_page, url, content, parser_backend, parse_byte_budget, parse_token_budget, stemmer).result()
+    # Tokenizing is part of parsing; it is also reported on its own.
+    metrics.record_stage("tokenize", page.tokenize_seconds)
+    return page
 
 def extract_next_links(url, resp):
     # Implementation required.
@@ -61,9 +160,6 @@ def extract_next_links(url, resp):
     #         resp.raw_response.url: the url, again
     #         resp.raw_response.content: the content of the page!
     # Return a list with the hyperlinks (as strings) scrapped from resp.raw_response.content
-    global stop_words
-    global max_tokens, longest_page_url
-    
     unique_links = set()  # list of unique links
 
     # Handle redirections
@@ -73,41 +169,38 @@ def extract_next_links(url, resp):
             
         if resp.status == 200 and resp.raw_response and resp.raw_response.content not in [None, ""]:  # check the status code is ok and the content is not empty
 
-            if not is_allowed_by_robots(url):
+            if len(resp.raw_response.content) > max_page_bytes: # avoiding crawing too large files, before parsing them
+                return list(unique_links)
+
+            change = pages.record_fetch(url, resp.raw_response.content, getattr(resp.raw_response, "headers", None))
+            metrics.inc("page_fetches", change=change)
+            if change == UNCHANGED:  # a revisit of a page that did not change: it was parsed and its links followed before
                 return list(unique_links)
 
-            soup = BeautifulSoup(resp.raw_response.content, 'html.parser')
-            filtered_tokens = tokenize(soup.getText()) # tokenize the page
-            if len(filtered_tokens) > 200:  # crawl pages with high textual information content: must more than 200 words
+            page = parse(url, resp.raw_response.content)
+            if change == NEW and link_graph is not None:  # every link of the page, not only those followed
+                link_graph.record(url, [link for link in page.links if url_filter.rejection(link) is None])
+            if change == CHANGED:
+                # A changed page was counted when it was new: follow its links
+                # without counting it or its words again. Its fingerprint was
+                # updated by record_fetch.
+                unique_links.update(page.links)
+                return list(unique_links)
+            useful = False
+            if page.token_count > 200:  # crawl pages with high textual information content: must more than 200 words
                 if in_ics_domain(url):  # check if the url is in ics domain
-                    links_in_domain[urlparse(url).hostname].add(url)  # how many links in the domain
-                
-                if len(resp.raw_response.content) > 500000000: # avoiding crawing too large files : 500 MB limits
-                    return list(unique_links)
-                
-                if url in visited_unique_pages.values():  # Handle infinite traps
-                    return list(unique_links)
-                
-                if not is_similar_page(url, filtered_tokens): # check if the crawling the similar page with no information
-                    for token in filtered_tokens:  # update word freqencies
-                        word_freqs[token] += 1
-
-                    if len(filtered_tokens) > max_tokens: # find the longest page
-                        max_tokens = len(filtered_tokens)
-                        longest_page_url = url
-                    
-                    links = soup.find_all('a')  # get all the url tag in the page
-                    for link in links:
-                        obtained_link = link.get('href')   # get the url inside the tag
-                        if obtained_link:  # check it's not empty url
-                            abs_url = urljoin(url, urldefrag(obtained_link).url) # compose absolute url by joinging base url and defrag. url
-                            unique_links.add(abs_url)   # add the absolute the url
-                    print(f"URL crawled => {url}")
-                    print(links_in_domain)
+                    stats.record_subdomain_page(urlparse(url).hostname)  # how many pages in the domain
+
+                # The frontier hands out every url once, so only similar pages need checking.
+                if stats.record_page(url, page.token_counts, page.token_count, page.fingerprint): # check if the crawling the similar page with no information
+                    useful = True
+                    unique_links.update(page.links)   # add the absolute urls
+                    logger.debug("URL crawled => %s", url)
+            traps.record_page(url, useful)  # low content and similar pages count against the url's template
         else:
-            print(f"ERROR when crawling {url}: HTTP Status {resp.status} - {resp.error}")
+            logger.debug("ERROR when crawling %s: HTTP Status %s - %s", url, resp.status, resp.error)
     except Exception as e:
-        print(f"Unexpected Error: {e}")
+        logger.error(f"Unexpected Error: {e} when crawling {url}")
     return list(unique_links)
 
 def in_ics_domain(url):
@@ -115,124 +208,61 @@ def in_ics_domain(url):
     return subdomain and subdomain.endswith(".ics.uci.edu") and subdomain != "www.ics.uci.edu"
 
 
-def is_valid(url):
-    # Decide whether to crawl this url or not. 
-    # If you decide to crawl it, return True; otherwise return False.
-    # There are already some conditions that return False.
-    print(url)
-    try:
-        parsed = urlparse(url)
-        if parsed.scheme not in set(["http", "https"]):
-            return False
-        print("pass scheme")
-
-        # Check whether the URL is within the domains
-        if not is_within_domain(parsed):
-            return False
-        print("pass domain")
-
-        # Filter increment numbers in the path: e.g /page100 | /1 | /a
-        if re.search(r'(/page\d+)|(/\d+)|(/[a-z]$)', parsed.path):
-            return False
-        print("pass path")
-
-        # Filter urls that include date (lots of urls with date are "no real data")。
-        if contains_date_pattern:
-            return False
-        print("pass date")
-
-        # Filter urls with more than 3 query parameters
-        query_params = parse_qs(parsed.query, keep_blank_values=True)
-        if len(query_params) > 3:
-            return False
-        print("pass query")
-
-        return not re.match(
-            r".*\.(css|js|bmp|gif|jpe?g|ico"
-            + r"|png|tiff?|mid|mp2|mp3|mp4|mpg"
-            + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
-            + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
-            + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
-            + r"|epub|dll|cnf|tgz|sha1"
-            + r"|thmx|mso|arff|rtf|jar|csv"
-            + r"|rm|smil|wmv|swf|wma|zip|rar|gz"
-            + r"|json|xml|sql|yaml|ini|flv|3gp|aab|apk|webp|heic|bat|cmd|sh|txt)$", parsed.path.lower())
+def admit(url):
+    # Called by the frontier for a url it has not seen before. Rejects urls
+    # of templates found to be traps and urls over their host's budget.
+    return traps.admit(url)
 
-    except Exception as e:
-        print(f"Unexpected Error: {e} on {parsed}")
-
-# Check whether the URL is within the domains
-def is_within_domain(parsed_url):
-    allowed_domains = [
-        r'.*\.ics\.uci\.edu',
-        r'.*\.cs\.uci\.edu',
-        r'.*\.informatics\.uci\.edu',
-        r'.*\.stat\.uci\.edu'
-    ]
-
-    netloc = parsed_url.netloc
-    for domain in allowed_domains:
-        if re.match(domain, netloc):
-            return True
-    return False
-
-
-def contains_date_pattern(parsed_url):
-    # Matches common date formats
-    date_patterns = [
-        r'\d{4}-\d{2}-\d{2}',  # YYYY-MM-DD
-        r'\d{4}/\d{2}/\d{2}',  # YYYY/MM/DD
-        r'\d{4}\d{2}\d{2}',  # YYYYMMDD
-        r'/\d{2}-\d{2}-\d{4}/',  # DD-MM-YYYY
-        r'/\d{2}/\d{2}/\d{4}/'  # DD/MM/YYYY
-    ]
-    # Check whether a date pattern is included
-    for pattern in date_patterns:
-        if re.search(pattern, parsed_url.path):
-            return True
-    return False
-
-
-# Check if the url is disallowed to crawl.
-def is_allowed_by_robots(url, user_agent="*"):
-    rp = robotparser.RobotFileParser()
-    parsed_url = urlparse(url)
-    scheme = parsed_url.scheme
-    netloc = parsed_url.netloc
-
-    if netloc in robots_list:
-        return robots_list[netloc].can_fetch(user_agent, url)
-
-    robot_url = f"{scheme}://{netloc}/robots.txt"
-    rp.set_url(robot_url)
-    try:
-        print("try read robot")
-        rp.read()  # Get the rules from robots.txt
-        print("read successfully")
-        robots_list[netloc] = rp
+def record_links(url, new_links):
+    # The worker tells how many of the page's links the frontier queued.
+    traps.record_links(url, new_links)
 
-        print("---CAN FETCH---")
+def revisit_due(urldigest):
+    # Called by a resumed RECRAWL frontier for every completed url.
+    return pages.due(urldigest)
 
-        return rp.can_fetch(user_agent, url)
-    except:
-        return False
+
+def is_valid(url):
+    # Decide whether to crawl this url or not. 
+    # If you decide to crawl it, return True; otherwise return False.
+    # The rules are precompiled in utils/url_filter.py.
+    return url_filter.is_valid(url)
 
 
 def report():
-    sorted_word_freqs = sorted(word_freqs.items(), key = lambda item: item[1], reverse = True)
-    with open(f"report.txt", 'w') as f:
+    top_words = stats.top_words(50)
+    with open(report_file, 'w') as f:
         f.write("------------------------------R E P O R T------------------------------\n\n")
-        f.write("Unique Pages Found: " + str(len(visited_unique_pages)) + "\n")
+        f.write("Unique Pages Found: " + str(stats.unique_pages) + "\n")
         f.write("\n")
-        f.write(f"URL With the Largest Word Count: {longest_page_url} with {max_tokens} words \n")
+        f.write(f"URL With the Largest Word Count: {stats.longest_page_url} with {stats.max_tokens} words \n")
         f.write("\n")
         f.write("50 Most Common Words:\n")
-        for i in range(50):
-            f.write(f"\t{i+1}. {sorted_word_freqs[i][0]} : {sorted_word_freqs[i][1]} \n")
+        for i, (word, freq) in enumerate(top_words):
+            f.write(f"\t{i+1}. {word} : {freq} \n")
         f.write("\n")
-        f.write(f"Number of subdomains in the ics.uci.edu domain: {len(links_in_domain)} \n")
+        f.write(f"Number of subdomains in the ics.uci.edu domain: {len(stats.subdomain_pages)} \n")
         f.write("Subdomains List: \n")
         index = 1
-        for subdomain, pages in sorted(links_in_domain.items(), key=lambda x: x[0]):
-            f.write(f"\t{index}. {subdomain}, {len(pages)}\n")
-            index += 1
\ No newline at end of file
+        for subdomain, pages in sorted(stats.subdomain_pages.items(), key=lambda x: x[0]):
+            f.write(f"\t{index}. {subdomain}, {pages}\n")
+            index += 1
+        if link_analytics:
+            report_links(f, link_analytics)
+
+def report_links(f, analytics):
+    # The sections analyze_links.py computed from the link graph.
+    f.write("\n")
+    f.write(f"Link Graph: {analytics['nodes']} urls, {analytics['pages']} pages crawled, {analytics['edges']} links \n")
+    f.write("\n")
+    f.write(f"{len(analytics['top_indegree'])} Most Linked URLs:\n")
+    for i, (url, links) in enumerate(analytics["top_indegree"]):
+        f.write(f"\t{i+1}. {url} : {links} \n")
+    f.write("\n")
+    f.write(f"{len(analytics['top_pagerank'])} Highest PageRank URLs (times the mean):\n")
+    for i, (url, rank) in enumerate(analytics["top_pagerank"]):
+        f.write(f"\t{i+1}. {url} : {rank:.2f} \n")
+    f.write("\n")
+    f.write("Links per ics.uci.edu Subdomain (out, in from other hosts, within):\n")
+    for i, (subdomain, (out_links, in_links, internal)) in enumerate(sorted(analytics["subdomain_links"].items())):
+        f.write(f"\t{i+1}. {subdomain}, {out_links}, {in_links}, {internal}\n")
@@ -0,0 +1,33 @@
+import os
+
+from configparser import ConfigParser
+from unittest import mock
+
+from utils.config import Config
+from utils.response import Response
+
+CONFIG_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "config.ini")
+
+
+def make_config(directory, seeds, **options):
+    ''' The Config of config.ini with its save file in directory, the given
+    seeds and options, e.g. POLITENESS="0.2", set in their section. '''
+    parser = ConfigParser()
+    parser.read(CONFIG_FILE)
+    parser["CRAWLER"]["SEEDURL"] = ",".join(seeds)
+    parser["LOCAL PROPERTIES"]["SAVE"] = os.path.join(directory, "frontier.journal")
+    for key, value in options.items():
+        section = next((name for name in parser.sections() if key in parser[name]), "CRAWLER")
+        parser[section][key] = value
+    return Config(parser)
+
+
+def robots_download(status):
+    ''' A download that answers every robots.txt fetch with this status;
+    404 allows everything. '''
+    return lambda url, config, logger=None: Response({"url": url, "status": status})
+
+
+def robots_status(status):
+    ''' Patch the robots.txt fetches of the frontier to get this status. '''
+    return mock.patch("crawler.robots.download", side_effect=robots_download(status))
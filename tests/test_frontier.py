@@ -0,0 +1,124 @@
+import shutil
+import tempfile
+import time
+import unittest
+
+from threading import Thread
+from urllib.parse import urlsplit
+
+from crawler.frontier import Frontier
+from tests.support import make_config, robots_download, robots_status
+
+A = "a.ics.uci.edu"
+B = "b.ics.uci.edu"
+POLITENESS = 0.2
+SLACK = 0.02    # timer resolution
+
+
+def host(url):
+    return urlsplit(url).netloc
+
+
+class FrontierTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        robots = robots_status(404)
+        robots.start()
+        self.addCleanup(robots.stop)
+
+    def open_frontier(self, seeds, **options):
+        options.setdefault("POLITENESS", str(POLITENESS))
+        options.setdefault("PRIORITY", "")
+        frontier = Frontier(make_config(self.path, seeds, **options), True)
+        self.addCleanup(frontier.close)
+        return frontier
+
+    def drain(self, frontier):
+        ''' (time handed out, url) of every url until the frontier is drained. '''
+        handed = list()
+        while True:
+            url = frontier.get_tbd_url(timeout=5)
+            if url is None:
+                return handed
+            handed.append((time.monotonic(), url))
+            frontier.mark_url_complete(url)
+
+    def test_politeness_gap_per_host(self):
+        seeds = [f"https://{A}/about", f"https://{A}/people", f"https://{A}/research",
+                 f"https://{B}/about", f"https://{B}/people"]
+        handed = self.drain(self.open_frontier(seeds))
+        self.assertEqual(sorted(url for _, url in handed), sorted(seeds))
+        for name in (A, B):
+            times = [at for at, url in handed if host(url) == name]
+            for before, after in zip(times, times[1:]):
+                self.assertGreaterEqual(after - before, POLITENESS - SLACK)
+        # One host's delay does not hold up the other.
+        first = {name: min(at for at, url in handed if host(url) == name) for name in (A, B)}
+        self.assertLess(abs(first[A] - first[B]), POLITENESS / 2)
+
+    def test_busy_host_is_not_handed_out(self):
+        frontier = self.open_frontier([f"https://{A}/about", f"https://{A}/people", f"https://{B}/about"])
+        first = frontier.get_tbd_url(timeout=5)
+        second = frontier.get_tbd_url(timeout=5)
+        self.assertNotEqual(host(first), host(second))
+        # Both hosts have a url in flight.
+        self.assertIsNone(frontier.get_tbd_url(timeout=POLITENESS * 2))
+        frontier.mark_url_complete(second)
+        frontier.mark_url_complete(first)
+        self.assertEqual(len(self.drain(frontier)), 1)
+
+    def test_reserved_host(self):
+        seeds = [f"https://{A}/about", f"https://{A}/people"]
+        frontier = self.open_frontier(seeds)
+        self.assertTrue(frontier.reserve_host(A))
+        self.assertFalse(frontier.reserve_host(A, wait_busy=False))
+        self.assertIsNone(frontier.get_tbd_url(timeout=POLITENESS * 2))
+        released = time.monotonic()
+        frontier.release_host(A)
+        handed = self.drain(frontier)
+        # Each url once, the stale heap entries of the reservation skipped.
+        self.assertEqual(sorted(url for _, url in handed), seeds)
+        self.assertGreaterEqual(handed[0][0] - released, POLITENESS - SLACK)
+
+    def test_reserve_waits_for_the_url_in_flight(self):
+        frontier = self.open_frontier([f"https://{A}/about", f"https://{A}/people"])
+        url = frontier.get_tbd_url(timeout=5)
+        reserved = list()
+        reserver = Thread(target=lambda: reserved.append((frontier.reserve_host(A), time.monotonic())))
+        reserver.start()
+        time.sleep(POLITENESS)
+        self.assertEqual(reserved, [])
+        completed = time.monotonic()
+        frontier.mark_url_complete(url)
+        reserver.join(5)
+        self.assertTrue(reserved[0][0])
+        self.assertGreaterEqual(reserved[0][1] - completed, POLITENESS - SLACK)
+        released = time.monotonic()
+        frontier.release_host(A)
+        handed = self.drain(frontier)
+        self.assertEqual(len(handed), 1)
+        self.assertGreaterEqual(handed[0][0] - released, POLITENESS - SLACK)
+
+    def test_better_bucket_leaves_a_stale_copy(self):
+        about, people, research = (f"https://{A}/{path}" for path in ("about", "people", "research"))
+        frontier = self.open_frontier([about], PRIORITY="indegree")
+        self.assertTrue(frontier.add_url(people))
+        self.assertTrue(frontier.add_url(research))
+        # More links move research ahead; its copy in the old bucket stays.
+        self.assertFalse(frontier.add_url(research))
+        self.assertFalse(frontier.add_url(research))
+        handed = [url for _, url in self.drain(frontier)]
+        self.assertEqual(handed, [research, about, people])
+
+    def test_parked_seed_is_not_dropped(self):
+        with robots_status(503) as download:
+            frontier = self.open_frontier([f"https://{A}/about"], ROBOTS_NEGATIVE_TTL="0.1")
+            self.assertFalse(frontier.is_drained())
+            download.side_effect = robots_download(404)
+            handed = self.drain(frontier)
+        self.assertEqual([url for _, url in handed], [f"https://{A}/about"])
+
+
+if __name__ == "__main__":
+    unittest.main()
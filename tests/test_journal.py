@@ -0,0 +1,176 @@
+import os
+import shelve
+import shutil
+import tempfile
+import unittest
+
+from crawler.frontier import Frontier
+from crawler.journal import FrontierJournal
+from tests.support import make_config, robots_status
+from utils import get_urlhash
+
+
+def key(i):
+    return f"{i:032d}".encode("ascii")
+
+
+NAMES = ["alice", "bob", "carol", "dave", "erin", "frank",
+         "grace", "heidi", "ivan", "judy", "mallory", "oscar"]
+
+
+def url(i):
+    return f"https://www.ics.uci.edu/people/{NAMES[i]}"
+
+
+class FrontierJournalTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        self.save = os.path.join(self.path, "frontier.journal")
+
+    def open_journal(self, **options):
+        journal = FrontierJournal(self.save, **options)
+        self.addCleanup(journal.close)
+        return journal
+
+    def replayed(self, **options):
+        journal = FrontierJournal(self.save, **options)
+        return list(journal.replay())
+
+    def write(self, records, **options):
+        journal = self.open_journal(**options)
+        list(journal.replay())
+        journal.open()
+        for record in records:
+            journal.append(*record)
+            journal.commit()
+        journal.close()
+        return journal
+
+    def test_replay_in_order(self):
+        records = [(key(i), url(i), i % 3 == 0) for i in range(12)]
+        self.write(records[:5])
+        # Appends after a resume go after the records already there.
+        self.write(records[5:])
+        self.assertEqual(self.replayed(), records)
+
+    def test_torn_tail(self):
+        records = [(key(i), url(i), False) for i in range(5)]
+        self.write(records)
+        size = os.path.getsize(self.save)
+        torn = FrontierJournal(self.save)._encode(key(5), url(5), True)
+        with open(self.save, "ab") as f:
+            f.write(torn[:-3])
+        with self.assertLogs("JOURNAL", "WARNING"):
+            self.assertEqual(self.replayed(), records)
+        self.assertEqual(os.path.getsize(self.save), size)
+        # Appending goes on from the last whole record.
+        self.write([(key(5), url(5), True)])
+        self.assertEqual(self.replayed(), records + [(key(5), url(5), True)])
+
+    def test_not_a_journal(self):
+        with open(self.save, "wb") as f:
+            f.write(b"not a frontier journal")
+        journal = FrontierJournal(self.save)
+        self.assertRaises(ValueError, journal.check)
+        self.assertRaises(ValueError, list, journal.replay())
+        # Another key size is not the same journal either.
+        os.remove(self.save)
+        self.write([(key(0), url(0), False)])
+        self.assertRaises(ValueError, FrontierJournal(self.save, key_size=16).check)
+
+    def test_compaction(self):
+        # Every url is queued, then completed; a few are queued again.
+        records = [(key(i), url(i), False) for i in range(12)]
+        records += [(key(i), url(i), True) for i in range(12)]
+        records += [(key(i), url(i), False) for i in range(3)]
+        self.write(records, compact_records=5)
+        self.assertTrue(os.path.exists(f"{self.save}.snapshot"))
+        self.assertFalse(os.path.exists(f"{self.save}.old"))
+        final = {k: (u, completed) for k, u, completed in records}
+        replayed = self.replayed()
+        self.assertEqual({k: (u, completed) for k, u, completed in replayed}, final)
+        # The snapshot holds each url once.
+        snapshot = list(FrontierJournal(self.save)._read(f"{self.save}.snapshot"))
+        self.assertEqual(len(snapshot), len({k for k, _, _ in snapshot}))
+        self.assertLess(len(replayed), len(records))
+
+    def test_interrupted_compaction(self):
+        records = [(key(i), url(i), i < 3) for i in range(10)]
+        FrontierJournal(self.save).create(records)
+        os.replace(self.save, f"{self.save}.old")
+        self.assertEqual(self.replayed(), records)
+        # Opening finishes the compaction.
+        self.write([(key(10), url(10), False)])
+        self.assertFalse(os.path.exists(f"{self.save}.old"))
+        self.assertEqual(self.replayed(), records + [(key(10), url(10), False)])
+
+    def test_pending(self):
+        journal = self.write([(key(i), url(i), False) for i in range(3)])
+        entries = [(url(0), 0), (url(1), 2), (url(2), 70000)]
+        journal.save_pending(entries)
+        loaded = FrontierJournal(self.save).load_pending()
+        self.assertEqual(loaded, [(url(0), 0), (url(1), 2), (url(2), 0xFFFF)])
+        # Once the journal changes, the pending urls may be stale.
+        self.write([(key(0), url(0), True)])
+        self.assertIsNone(FrontierJournal(self.save).load_pending())
+
+    def test_pending_without_journal_change(self):
+        journal = self.write([(key(0), url(0), False)])
+        journal.save_pending([(url(0), 1)])
+        with open(f"{self.save}.pending", "r+b") as f:
+            f.write(b"XXXX")
+        self.assertIsNone(FrontierJournal(self.save).load_pending())
+
+
+class FrontierResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        robots = robots_status(404)
+        robots.start()
+        self.addCleanup(robots.stop)
+
+    def open_frontier(self, seeds, restart):
+        frontier = Frontier(make_config(self.path, seeds, POLITENESS="0", PRIORITY=""), restart)
+        self.addCleanup(frontier.close)
+        return frontier
+
+    def drain(self, frontier, count=None):
+        handed = list()
+        while count is None or len(handed) < count:
+            url = frontier.get_tbd_url(timeout=5)
+            if url is None:
+                break
+            handed.append(url)
+            frontier.mark_url_complete(url)
+        return handed
+
+    def test_resume(self):
+        seeds = [url(i) for i in range(6)]
+        frontier = self.open_frontier(seeds, True)
+        crawled = self.drain(frontier, 2)
+        frontier.close()
+        resumed = self.open_frontier(seeds, False)
+        self.assertEqual(sorted(self.drain(resumed)), sorted(set(seeds) - set(crawled)))
+
+    def test_import_shelve(self):
+        save = os.path.join(self.path, "frontier.journal")
+        with shelve.open(save) as db:
+            for i in range(5):
+                db[get_urlhash(url(i))] = (url(i), i < 2)
+        frontier = self.open_frontier([url(0)], False)
+        self.assertEqual(sorted(self.drain(frontier)), [url(i) for i in range(2, 5)])
+        self.assertTrue(any(name.startswith("frontier.journal.imported")
+                            for name in os.listdir(self.path)))
+
+    def test_shelve_and_journal(self):
+        save = os.path.join(self.path, "frontier.journal")
+        with shelve.open(save) as db:
+            db[get_urlhash(url(1))] = (url(1), False)
+        FrontierJournal(save, key_size=16).create([(key(0)[:16], url(0), False)])
+        self.assertRaises(ValueError, self.open_frontier, [url(0)], False)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from crawler.page_store import PageStore
+
+
+def page(i, size=1000):
+    return (f"page {i} " * size).encode("utf-8")[:size]
+
+
+class PageStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+
+    def open_store(self, codec="zlib"):
+        store = PageStore(self.path, codec, segment_bytes=4096)
+        store.open()
+        self.addCleanup(store.close)
+        return store
+
+    def test_rollover(self):
+        store = self.open_store("none")
+        for i in range(10):
+            store.append(f"https://www.ics.uci.edu/{i}", 200, page(i))
+            # Reads the live segment as it grows, mapping it again.
+            self.assertEqual(store.get(f"https://www.ics.uci.edu/{i}").content, page(i))
+        self.assertGreater(len(store.segments), 1)
+        store.close()
+
+        store = self.open_store("none")
+        self.assertEqual(len(store), 10)
+        for i in range(10):
+            stored = store.get(f"https://www.ics.uci.edu/{i}")
+            self.assertEqual((stored.url, stored.status, stored.content),
+                             (f"https://www.ics.uci.edu/{i}", 200, page(i)))
+        self.assertEqual([stored.url for stored in store.scan()],
+                         [f"https://www.ics.uci.edu/{i}" for i in range(10)])
+
+    def test_url_stored_twice(self):
+        store = self.open_store("none")
+        url = "https://www.ics.uci.edu/twice"
+        store.append(url, 200, b"first")
+        for i in range(5):
+            store.append(f"https://www.ics.uci.edu/{i}", 200, page(i))
+        store.append(url, 404, b"second")
+        self.assertGreater(len(store.segments), 1)
+        self.assertEqual(store.get(url), (url, 404, b"second"))
+        store.close()
+
+        store = self.open_store("none")
+        self.assertEqual(len(store), 6)
+        self.assertEqual(store.get(url), (url, 404, b"second"))
+        self.assertEqual([stored for stored in store.scan() if stored.url == url],
+                         [(url, 404, b"second")])
+
+    def test_torn_tail(self):
+        store = self.open_store()
+        store.append("https://www.ics.uci.edu/a", 200, page("a"))
+        store.append("https://www.ics.uci.edu/b", 200, page("b"))
+        segment_path = store._segment_path(store.segments[-1])
+        size = os.path.getsize(segment_path)
+        store.append("https://www.ics.uci.edu/c", 200, page("c"))
+        # A crash: no index saved and the last record half written.
+        store.live.close()
+        store.live = None
+        with open(segment_path, "r+b") as f:
+            f.truncate(size + (os.path.getsize(segment_path) - size) // 2)
+
+        store = self.open_store()
+        self.assertEqual(os.path.getsize(segment_path), size)
+        self.assertEqual(len(store), 2)
+        self.assertIsNone(store.get("https://www.ics.uci.edu/c"))
+        self.assertEqual(store.get("https://www.ics.uci.edu/b").content, page("b"))
+        store.append("https://www.ics.uci.edu/c", 200, page("c"))
+        self.assertEqual(store.get("https://www.ics.uci.edu/c").content, page("c"))
+
+
+if __name__ == "__main__":
+    unittest.main()
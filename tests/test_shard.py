@@ -0,0 +1,105 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from queue import Queue
+from threading import Thread, Lock, Event
+
+from crawler.shard import ShardFrontier, IDLE_POLL, finished, shard_of
+from tests.support import make_config, robots_status
+
+SHARDS = 2
+HOSTS = ["www.ics.uci.edu", "www.cs.uci.edu", "www.stat.uci.edu", "vision.ics.uci.edu",
+         "www.informatics.uci.edu", "sdcl.ics.uci.edu", "ngs.ics.uci.edu"]
+
+
+def host_of_shard(shard_id):
+    return [host for host in HOSTS if shard_of(f"https://{host}/", SHARDS) == shard_id][0]
+
+
+class FinishedTest(unittest.TestCase):
+    # (IDLE, SENT, RECEIVED) of each of two shards.
+    def test_finished(self):
+        self.assertTrue(finished([1, 2, 1, 1, 1, 2], [1, 2, 1, 1, 1, 2]))
+
+    def test_busy_shard(self):
+        self.assertFalse(finished([1, 2, 1, 0, 1, 2], [1, 2, 1, 0, 1, 2]))
+
+    def test_batch_on_the_way(self):
+        self.assertFalse(finished([1, 3, 1, 1, 1, 2], [1, 3, 1, 1, 1, 2]))
+
+    def test_changed_since_last_snapshot(self):
+        # Both shards may have worked and gone idle again in between.
+        self.assertFalse(finished([1, 3, 1, 1, 1, 3], [1, 2, 1, 1, 1, 2]))
+        self.assertFalse(finished([1, 2, 1, 1, 1, 2], None))
+
+
+class ShardTerminationTest(unittest.TestCase):
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.path)
+        robots = robots_status(404)
+        robots.start()
+        self.addCleanup(robots.stop)
+
+    def test_crawl_ends_after_every_url(self):
+        a, b = host_of_shard(0), host_of_shard(1)
+        # Each page links to the next, alternating between the shards.
+        chain = [f"https://{a}/about", f"https://{b}/about",
+                 f"https://{a}/people", f"https://{b}/people", f"https://{b}/research"]
+        links = dict(zip(chain, chain[1:]))
+        inboxes = [Queue() for _ in range(SHARDS)]
+        status = [0] * 3 * SHARDS
+        done = Event()
+        frontiers = list()
+        for shard_id in range(SHARDS):
+            directory = os.path.join(self.path, str(shard_id))
+            os.mkdir(directory)
+            config = make_config(directory, chain[:1], POLITENESS="0", PRIORITY="")
+            frontier = ShardFrontier(config, True, shard_id, inboxes, status, done)
+            self.addCleanup(frontier.close)
+            frontiers.append(frontier)
+
+        lock = Lock()
+        completed = list()
+        at_done = list()
+
+        def work(frontier):
+            while True:
+                url = frontier.get_tbd_url()
+                if url is None:
+                    return
+                self.assertTrue(frontier.owns(url))
+                # Slow enough for the coordinator to look in between.
+                time.sleep(IDLE_POLL * 3)
+                if url in links:
+                    frontier.add_url(links[url])
+                with lock:
+                    completed.append(url)
+                frontier.mark_url_complete(url)
+
+        def coordinate():
+            previous = None
+            while not done.is_set():
+                time.sleep(IDLE_POLL)
+                snapshot = list(status)
+                if finished(snapshot, previous):
+                    with lock:
+                        at_done.extend(completed)
+                    done.set()
+                previous = snapshot
+
+        threads = [Thread(target=work, args=(frontier,), daemon=True) for frontier in frontiers]
+        threads.append(Thread(target=coordinate, daemon=True))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(30)
+            self.assertFalse(thread.is_alive())
+        self.assertEqual(at_done, chain)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+import contextlib
+import io
+import unittest
+
+from bench.url_filter_throughput import legacy_is_valid, report_corpus
+from utils.url_filter import UrlFilter
+
+# Urls the rules of the old is_valid decide on, one or two per rule.
+CRAFTED = [
+    "https://www.ics.uci.edu/about",
+    "http://www.cs.uci.edu/people/faculty",
+    "https://vision.ics.uci.edu/research/",
+    "https://www.informatics.uci.edu/",
+    "https://www.stat.uci.edu/seminars",
+    "https://www.ics.uci.edu",
+    "ftp://www.ics.uci.edu/about",
+    "HTTPS://www.ics.uci.edu/about",
+    "//www.ics.uci.edu/about",
+    "about/people",
+    "https://www.uci.edu/about",
+    "https://www.eecs.uci.edu/about",
+    "https://ics.uci.edu.example.com/about",
+    "https://user@www.ics.uci.edu/about",
+    "https://www.ics.uci.edu/page2",
+    "https://www.ics.uci.edu/events/12",
+    "https://www.ics.uci.edu/people/a",
+    "https://www.ics.uci.edu/pages/about",
+    "https://www.ics.uci.edu/events/2019-10-04/",
+    "https://www.ics.uci.edu/events/2019/10/04/",
+    "https://www.ics.uci.edu/events/20191004",
+    "https://www.ics.uci.edu/events/04-10-2019/",
+    "https://www.ics.uci.edu/events/04/10/2019/",
+    "https://www.ics.uci.edu/search?a=1&b=2&c=3",
+    "https://www.ics.uci.edu/search?a=1&b=2&c=3&d=4",
+    "https://www.ics.uci.edu/search?a=1&a=2&a=3&a=4",
+    "https://www.ics.uci.edu/search?a=1&&&&b=2",
+    "https://www.ics.uci.edu/files/report.pdf",
+    "https://www.ics.uci.edu/files/REPORT.PDF",
+    "https://www.ics.uci.edu/files/report.pdf?download=1",
+    "https://www.ics.uci.edu/static/style.css#top",
+    "https://www.ics.uci.edu/about#people",
+]
+
+# Intentional changes from the old rules: (url, old decision, new decision).
+CHANGES = [
+    # A bare allowed domain is in the domain.
+    ("https://ics.uci.edu/about", False, True),
+    ("https://informatics.uci.edu/", False, True),
+    # The host has to end in an allowed domain, not just start with one.
+    ("https://x.ics.uci.edu.example.com/about", True, False),
+    ("https://www.ics.uci.edu@example.com/about", True, False),
+    # Host names are not case sensitive.
+    ("https://WWW.ICS.UCI.EDU/about", False, True),
+]
+
+
+def legacy(url):
+    # The old is_valid prints every rule it passes.
+    with contextlib.redirect_stdout(io.StringIO()):
+        return bool(legacy_is_valid(url))
+
+
+class UrlFilterTest(unittest.TestCase):
+    def setUp(self):
+        self.url_filter = UrlFilter()
+
+    def test_same_as_legacy(self):
+        corpus = report_corpus(2000, report_file="") + CRAFTED
+        for url in corpus:
+            with self.subTest(url=url):
+                self.assertEqual(self.url_filter.is_valid(url), legacy(url))
+
+    def test_changes(self):
+        for url, old, new in CHANGES:
+            with self.subTest(url=url):
+                self.assertEqual(legacy(url), old)
+                self.assertEqual(self.url_filter.is_valid(url), new)
+
+    def test_port(self):
+        # The port is not part of the host, for either.
+        for url in ("https://www.ics.uci.edu:8080/about", "https://ics.uci.edu.com:443/about"):
+            with self.subTest(url=url):
+                self.assertEqual(self.url_filter.is_valid(url), legacy(url))
+        self.assertTrue(self.url_filter.is_valid("https://www.ics.uci.edu:8080/about"))
+        self.assertTrue(self.url_filter.is_valid("https://ics.uci.edu:8080/about"))
+
+    def test_filter(self):
+        corpus = report_corpus(500, report_file="") + CRAFTED
+        kept = self.url_filter.filter(corpus)
+        self.assertEqual(kept, [url for url in corpus if UrlFilter().is_valid(url)])
+        # Every rejection is counted once, under the first rule rejecting it.
+        counts = self.url_filter.counts()
+        self.assertEqual(sum(counts.values()), len(corpus) - len(kept))
+        for rule in ("scheme", "domain", "numbered path", "query", "extension"):
+            self.assertIn(rule, counts)
+
+    def test_options(self):
+        url_filter = UrlFilter(domains=["ics.uci.edu."], path_rules=())
+        self.assertTrue(url_filter.is_valid("https://vision.ics.uci.edu/page2"))
+        self.assertTrue(url_filter.is_valid("https://www.ics.uci.edu/events/2019-10-04/"))
+        self.assertFalse(url_filter.is_valid("https://www.cs.uci.edu/about"))
+        self.assertFalse(url_filter.is_valid("https://www.ics.uci.edu/files/report.pdf"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,11 +1,17 @@
 import os
 import logging
-from hashlib import sha256
+from hashlib import sha256, blake2b
 from urllib.parse import urlparse
 
+# Level of every logger made by get_logger; debug lines are skipped before
+# their message is formatted unless it is lowered, see set_log_level.
+log_level = logging.INFO
+_logger_names = set()
+
 def get_logger(name, filename=None):
     logger = logging.getLogger(name)
-    logger.setLevel(logging.INFO)
+    logger.setLevel(log_level)
+    _logger_names.add(name)
     if not os.path.exists("Logs"):
         os.makedirs("Logs")
     fh = logging.FileHandler(f"Logs/{filename if filename else name}.log")
@@ -21,6 +27,12 @@ def get_logger(name, filename=None):
     logger.addHandler(ch)
     return logger
 
+def set_log_level(level):
+    global log_level
+    log_level = logging.getLevelName(level.upper()) if isinstance(level, str) else level
+    for name in _logger_names:
+        logging.getLogger(name).setLevel(log_level)
+
 
 def get_urlhash(url):
     parsed = urlparse(url)
@@ -29,6 +41,15 @@ def get_urlhash(url):
         f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
         f"{parsed.query}/{parsed.fragment}".encode("utf-8")).hexdigest()
 
+def get_urldigest(url, size=16):
+    # A fixed width binary digest of the same url parts as get_urlhash, for
+    # in-memory sets and on-disk indexes.
+    parsed = urlparse(url)
+    return blake2b(
+        f"{parsed.netloc}/{parsed.path}/{parsed.params}/"
+        f"{parsed.query}/{parsed.fragment}".encode("utf-8"),
+        digest_size=size).digest()
+
 def normalize(url):
     if url.endswith("/"):
         return url.rstrip("/")
@@ -0,0 +1,71 @@
+import asyncio
+
+import aiohttp
+import cbor
+
+from utils.response import Response, RESPONSE_OVERHEAD, too_large
+
+
+class AsyncDownloader(object):
+    ''' Downloads through the cache server on one pooled keep-alive client.
+
+    At most config.async_concurrency requests are in flight, each bounded by
+    config.download_timeout seconds. Use as an async context manager. '''
+    def __init__(self, config, logger):
+        self.config = config
+        self.logger = logger
+        host, port = config.cache_server
+        self.cache_url = f"http://{host}:{port}/"
+        self.slots = asyncio.Semaphore(config.async_concurrency)
+        self.session = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(
+            limit=self.config.async_concurrency, keepalive_timeout=60)
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.config.download_timeout))
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def download(self, url):
+        async with self.slots:
+            try:
+                # Redirects are followed automatically, up to a maximum of 5.
+                async with self.session.get(
+                        self.cache_url,
+                        params=[("q", f"{url}"), ("u", f"{self.config.user_agent}")],
+                        max_redirects=5) as resp:
+                    status = resp.status
+                    max_bytes = self.config.max_page_bytes
+                    if max_bytes and (resp.content_length or 0) > max_bytes + RESPONSE_OVERHEAD:
+                        # Dropped before its body is read.
+                        return too_large(url, status, max_bytes)
+                    content = await resp.read()
+            except aiohttp.TooManyRedirects:
+                self.logger.error(
+                    f"Exceeded the maximum number of allowed redirects with url {url}.")
+                return Response({
+                    "error": f"Exceeded the maximum number of allowed redirects with url {url}.",
+                    "status": 300,
+                    "url": url})
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # The cache server did not answer in time or could not be reached.
+                self.logger.error(f"Cache server request failed: {e!r} with url {url}.")
+                return Response({
+                    "error": f"Cache server request failed: {e!r} with url {url}.",
+                    "status": 600,
+                    "url": url})
+
+        try:
+            if content:
+                return Response(cbor.loads(content), self.config.max_page_bytes)
+        except:
+            pass
+        self.logger.error(f"Spacetime Response error {status} with url {url}.")
+        return Response({
+            "error": f"Spacetime Response error {status} with url {url}.",
+            "status": status,
+            "url": url})
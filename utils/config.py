@@ -8,12 +8,66 @@ class Config(object):
         assert self.user_agent != "DEFAULT AGENT", "Set useragent in config.ini"
         assert re.match(r"^[a-zA-Z0-9_ ,]+$", self.user_agent), "User agent should not have any special characters outside '_', ',' and 'space'"
         self.threads_count = int(config["LOCAL PROPERTIES"]["THREADCOUNT"])
+        self.shards = int(config["LOCAL PROPERTIES"].get("SHARDS", "1"))
+        self.worker_mode = config["LOCAL PROPERTIES"].get("WORKER_MODE", "thread").strip().lower()
+        assert self.worker_mode in {"thread", "async"}, "WORKER_MODE should be thread or async"
+        self.async_concurrency = int(config["LOCAL PROPERTIES"].get("ASYNC_CONCURRENCY", "100"))
+        self.parse_processes = int(config["LOCAL PROPERTIES"].get("PARSE_PROCESSES", "0"))
+        self.parser = config["LOCAL PROPERTIES"].get("PARSER", "stream").strip()
+        self.max_page_bytes = int(config["CRAWLER"].get("MAX_PAGE_BYTES", "500000000"))
+        self.parse_byte_budget = int(config["CRAWLER"].get("PARSE_BYTE_BUDGET", "0"))
+        self.parse_token_budget = int(config["CRAWLER"].get("PARSE_TOKEN_BUDGET", "0"))
+        self.stemmer = config["CRAWLER"].get("STEMMER", "none").strip().lower()
+        assert self.stemmer in {"none", "plural", "porter"}, "STEMMER should be none, plural or porter"
+        self.robots_ttl = float(config["CRAWLER"].get("ROBOTS_TTL", "86400"))
+        self.robots_negative_ttl = float(config["CRAWLER"].get("ROBOTS_NEGATIVE_TTL", "600"))
+        self.near_duplicate_distance = int(config["CRAWLER"].get("NEAR_DUPLICATE_DISTANCE", "3"))
+        self.path_rules = [rule.strip().lower() for rule in config["CRAWLER"].get("PATH_RULES", "numbered,date").split(",") if rule.strip()]
+        assert set(self.path_rules) <= {"numbered", "date"}, "PATH_RULES should list numbered and/or date"
+        self.trap_min_samples = int(config["CRAWLER"].get("TRAP_MIN_SAMPLES", "20"))
+        self.trap_min_yield = float(config["CRAWLER"].get("TRAP_MIN_YIELD", "0.1"))
+        self.host_page_budget = int(config["CRAWLER"].get("HOST_PAGE_BUDGET", "0"))
+        self.priority = dict()  # key: scorer, val: its weight
+        for scorer in config["CRAWLER"].get("PRIORITY", "depth,sitemap,hosts:0.5,indegree").split(","):
+            name, _, weight = scorer.strip().lower().partition(":")
+            if name:
+                self.priority[name] = float(weight or "1")
+        assert set(self.priority) <= {"depth", "sitemap", "hosts", "indegree", "pagerank"}, "PRIORITY should list depth, sitemap, hosts, indegree and/or pagerank"
+        self.sitemaps = [url.strip() for url in config["CRAWLER"].get(
+            "SITEMAPS", "https://ics.uci.edu/post-sitemap.xml,https://cs.ics.uci.edu/page-sitemap.xml").split(",") if url.strip()]
+        self.max_sitemaps = int(config["CRAWLER"].get("MAX_SITEMAPS", "100"))
+        self.top_words_capacity = int(config["CRAWLER"].get("TOP_WORDS_SKETCH", "0"))
+        self.recrawl = config["CRAWLER"].getboolean("RECRAWL", False)
+        self.recrawl_min_interval = float(config["CRAWLER"].get("RECRAWL_MIN_SECONDS", "86400"))
+        self.recrawl_max_interval = float(config["CRAWLER"].get("RECRAWL_MAX_SECONDS", "2592000"))
+        self.stats_file = config["LOCAL PROPERTIES"].get("STATS_FILE", "stats.pickle")
+        self.stats_checkpoint_interval = float(config["LOCAL PROPERTIES"].get("STATS_CHECKPOINT_SECONDS", "60"))
+        self.pages_file = config["LOCAL PROPERTIES"].get("PAGES_FILE", "pages.pickle")
+        self.page_store = config["LOCAL PROPERTIES"].get("PAGE_STORE", "").strip()
+        self.page_store_codec = config["LOCAL PROPERTIES"].get("PAGE_STORE_CODEC", "zlib").strip().lower()
+        assert self.page_store_codec in {"none", "zlib", "zstd"}, "PAGE_STORE_CODEC should be none, zlib or zstd"
+        self.page_store_segment_mb = int(config["LOCAL PROPERTIES"].get("PAGE_STORE_SEGMENT_MB", "256"))
+        self.link_graph = config["LOCAL PROPERTIES"].get("LINK_GRAPH", "").strip()
         self.save_file = config["LOCAL PROPERTIES"]["SAVE"]
+        self.journal_commit_records = int(config["LOCAL PROPERTIES"].get("JOURNAL_COMMIT_RECORDS", "1000"))
+        self.journal_commit_interval = int(config["LOCAL PROPERTIES"].get("JOURNAL_COMMIT_MS", "200")) / 1000
+        self.journal_compact_records = int(config["LOCAL PROPERTIES"].get("JOURNAL_COMPACT_RECORDS", "1000000"))
+        self.seen_set = config["LOCAL PROPERTIES"].get("SEEN_SET", "hash").strip().lower()
+        assert self.seen_set in {"hash", "compact"}, "SEEN_SET should be hash or compact"
+        self.seen_bloom_capacity = int(config["LOCAL PROPERTIES"].get("SEEN_BLOOM_CAPACITY", "0"))
+        self.log_level = config["LOCAL PROPERTIES"].get("LOG_LEVEL", "INFO").strip().upper()
+        assert self.log_level in {"DEBUG", "INFO", "WARNING", "ERROR"}, "LOG_LEVEL should be DEBUG, INFO, WARNING or ERROR"
+        self.metrics_interval = float(config["LOCAL PROPERTIES"].get("METRICS_LOG_SECONDS", "60"))
+        self.metrics_port = int(config["LOCAL PROPERTIES"].get("METRICS_PORT", "0"))
 
         self.host = config["CONNECTION"]["HOST"]
         self.port = int(config["CONNECTION"]["PORT"])
+        self.download_timeout = float(config["CONNECTION"].get("TIMEOUT", "30"))
+        self.download_stream = config["CONNECTION"].getboolean("STREAM", False)
 
         self.seed_urls = config["CRAWLER"]["SEEDURL"].split(",")
+        self.domains = config["CRAWLER"].get(
+            "DOMAINS", "ics.uci.edu,cs.uci.edu,informatics.uci.edu,stat.uci.edu").split(",")
         self.time_delay = float(config["CRAWLER"]["POLITENESS"])
 
         self.cache_server = None
\ No newline at end of file
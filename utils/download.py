@@ -1,29 +1,89 @@
+import io
 import requests
 import cbor
 import time
 
-from utils.response import Response
+from threading import local
+
+from utils.response import Response, ResponseTooLarge, RESPONSE_OVERHEAD, too_large
+
+STREAM_BUFFER = 1 << 16     # bytes read from the socket at a time when streaming
+
+# One keep-alive session per thread, so every worker reuses its connection
+# to the cache server instead of opening one per url.
+_sessions = local()
+
+def _session():
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = requests.Session()
+    return session
+
+class _BoundedReader(io.RawIOBase):
+    ''' Reads the body of a streamed reply, raising ResponseTooLarge once
+    more than limit bytes came in. '''
+    def __init__(self, raw, limit):
+        self.raw = raw
+        self.limit = limit
+        self.count = 0
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.raw.readinto(buffer)
+        self.count += count or 0
+        if self.limit and self.count > self.limit:
+            raise ResponseTooLarge(self.count)
+        return count
+
+
+def _read_stream(resp, url, max_bytes):
+    # Decode the cbor reply while it comes in, so the whole reply is never
+    # held next to the pickled response decoded from it.
+    try:
+        limit = max_bytes + RESPONSE_OVERHEAD if max_bytes else 0
+        length = resp.headers.get("Content-Length")
+        if limit and length and int(length) > limit:
+            return too_large(url, resp.status_code, max_bytes)
+        resp.raw.decode_content = True
+        reader = io.BufferedReader(_BoundedReader(resp.raw, limit), STREAM_BUFFER)
+        try:
+            return Response(cbor.load(reader), max_bytes)
+        except ResponseTooLarge:
+            return too_large(url, resp.status_code, max_bytes)
+    finally:
+        resp.close()
 
 def download(url, config, logger=None):
     host, port = config.cache_server
+    session = _session()
     try:
-        resp = requests.get(
+        resp = session.get(
             f"http://{host}:{port}/",
-            params=[("q", f"{url}"), ("u", f"{config.user_agent}")])
-    except:
-        pass
+            params=[("q", f"{url}"), ("u", f"{config.user_agent}")],
+            timeout=config.download_timeout, stream=config.download_stream)
+    except requests.RequestException as e:
+        # The cache server did not answer in time or could not be reached.
+        logger.error(f"Cache server request failed: {e} with url {url}.")
+        return Response({
+            "error": f"Cache server request failed: {e} with url {url}.",
+            "status": 600,
+            "url": url})
 
     # Handle redirects and index the url
     if 300 <= resp.status_code < 400:
+        # Gives the connection back when streaming; the redirect is not read.
+        resp.close()
         try:
             # allow redirects automatically, up to a maximum of 5.
-            session = requests.Session()
             session.max_redirects = 5 # set redirect depth
-            
+
             # would stop if non-redirect response is received, or exceeded the redirect limit
             new_resp = session.get(f"http://{host}:{port}/",
                                     params=[("q", f"{resp.url}"), ("u", f"{config.user_agent}")], 
-                                    allow_redirects=True)  
+                                    allow_redirects=True, timeout=config.download_timeout,
+                                    stream=config.download_stream)
             resp = new_resp  # set the new valid response become the response function return
         except requests.TooManyRedirects:   # if exceeded the redirect limit, directly return with error msg
             logger.error(f"Exceeded the maximum number of allowed redirects: {resp} with url {url}.")
@@ -31,12 +91,26 @@ def download(url, config, logger=None):
                 "error": f"Exceeded the maximum number of allowed redirects: {resp} with url {url}.",
                 "status": resp.status_code,
                 "url": url})
+        except requests.RequestException as e:
+            # The redirect target timed out or its connection failed.
+            logger.error(f"Cache server request failed: {e} following redirect of url {url}.")
+            return Response({
+                "error": f"Cache server request failed: {e} following redirect of url {url}.",
+                "status": 600,
+                "url": url})
+        finally:
+            session.max_redirects = requests.models.DEFAULT_REDIRECT_LIMIT
 
     try:
-        if resp and resp.content:
-            return Response(cbor.loads(resp.content))
+        if config.download_stream:
+            if resp:
+                return _read_stream(resp, url, config.max_page_bytes)
+        elif resp and resp.content:
+            return Response(cbor.loads(resp.content), config.max_page_bytes)
     except:
         pass
+    # Gives the connection back when streaming; the body was not read.
+    resp.close()
     logger.error(f"Spacetime Response error {resp} with url {url}.")
     return Response({
         "error": f"Spacetime Response error {resp} with url {url}.",
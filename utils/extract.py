@@ -0,0 +1,81 @@
+import codecs
+
+from html.parser import HTMLParser
+from urllib.parse import urldefrag, urljoin
+
+TEXT = 0
+LINK = 1
+
+# Characters a token can end with, see scraper.tokenize; text is only cut
+# after other characters so no token is split between two chunks.
+WORD_CHARS = "abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'"
+# Elements whose text is not visible on the page.
+HIDDEN_TAGS = {"script", "style", "noscript", "template"}
+
+
+class StreamingExtractor(HTMLParser):
+    ''' Collects visible text and absolute links while a page is fed to it,
+    without building a tree. Events are taken out with drain(). '''
+    def __init__(self, url):
+        super().__init__(convert_charrefs=True)
+        self.url = url
+        self.events = list()
+        self.text = list()
+        self.hidden_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in HIDDEN_TAGS:
+            self.hidden_depth += 1
+        elif tag == "a":
+            for name, value in attrs:
+                if name == "href" and value:
+                    try:
+                        # compose absolute url by joining base url and defrag. url
+                        self.events.append((LINK, urljoin(self.url, urldefrag(value).url)))
+                    except ValueError:
+                        pass
+                    break
+
+    def handle_endtag(self, tag):
+        if tag in HIDDEN_TAGS and self.hidden_depth:
+            self.hidden_depth -= 1
+
+    def handle_data(self, data):
+        if not self.hidden_depth:
+            self.text.append(data)
+
+    def drain(self, final=False):
+        ''' Return the events collected so far. Text ends on a word boundary
+        unless final is set; the rest is kept for the next drain. '''
+        if self.text:
+            text = "".join(self.text)
+            self.text.clear()
+            if not final:
+                head = text.rstrip(WORD_CHARS)
+                if len(head) < len(text):
+                    self.text.append(text[len(head):])
+                text = head
+            if text:
+                self.events.append((TEXT, text))
+        events = self.events
+        self.events = list()
+        return events
+
+
+def extract(url, content, chunk_size=65536, max_bytes=0):
+    ''' Yield (TEXT, visible text) and (LINK, absolute url) events of a page in
+    document order, feeding it chunk_size bytes at a time. Only the first
+    max_bytes bytes are read when max_bytes is set. Stop iterating to stop
+    parsing. '''
+    if isinstance(content, str):
+        content = content.encode("utf-8")
+    extractor = StreamingExtractor(url)
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    end = len(content) if not max_bytes else min(len(content), max_bytes)
+    view = memoryview(content)
+    for start in range(0, end, chunk_size):
+        extractor.feed(decoder.decode(view[start:min(start + chunk_size, end)]))
+        yield from extractor.drain()
+    extractor.feed(decoder.decode(b"", final=True))
+    extractor.close()
+    yield from extractor.drain(final=True)
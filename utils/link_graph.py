@@ -0,0 +1,191 @@
+import os
+import pickle
+import struct
+
+from array import array
+from threading import Lock
+
+from utils import get_logger, get_urlhash, normalize
+
+# A link graph directory holds the nodes, the edges in numbered chunk files
+# and what analyze_links.py computed from them. Node n is the n-th key of
+# NODE_KEYS (8 bytes of the get_urlhash of its url) and the n-th line of
+# NODE_URLS. A chunk is CHUNK_HEAD (magic, source count, edge count) then,
+# in native byte order, the CSR arrays: offsets (uint64, sources + 1),
+# sources (uint32) and targets (uint32); the links of sources[i] are
+# targets[offsets[i]:offsets[i + 1]].
+NODE_KEYS = "nodes.keys"
+NODE_URLS = "nodes.urls"
+CHUNK_MAGIC = b"LCSR\x01"
+CHUNK_HEAD = struct.Struct("<5s3xQQ")
+CHUNK_EDGES = 1 << 20   # edges buffered before a chunk is written
+RANK_KEYS = "pagerank.keys"
+RANK_VALUES = "pagerank.values"
+ANALYTICS = "analytics.pickle"
+
+
+def node_key(url):
+    return int(get_urlhash(url)[:16], 16)
+
+
+def chunk_paths(path):
+    return sorted(
+        os.path.join(path, name) for name in os.listdir(path) if name.endswith(".csr"))
+
+
+def load_analytics(path):
+    ''' What analyze_links.py saved for report.txt, or None. '''
+    analytics_file = os.path.join(path, ANALYTICS)
+    if not path or not os.path.exists(analytics_file):
+        return None
+    with open(analytics_file, "rb") as f:
+        return pickle.load(f)
+
+
+def load_ranks(path):
+    ''' (sorted node keys, PageRank relative to the mean) saved by
+    analyze_links.py, as arrays, or None. '''
+    keys_file = os.path.join(path, RANK_KEYS)
+    values_file = os.path.join(path, RANK_VALUES)
+    if not path or not os.path.exists(keys_file) or not os.path.exists(values_file):
+        return None
+    keys, values = array("Q"), array("f")
+    with open(keys_file, "rb") as f:
+        keys.frombytes(f.read())
+    with open(values_file, "rb") as f:
+        values.frombytes(f.read())
+    return keys, values
+
+
+class LinkGraphWriter(object):
+    ''' Records the links of every page crawled as edges between integer
+    node ids, interned from the url hashes, and streams them to disk as CSR
+    chunks of about chunk_edges edges, so memory holds only the node index
+    and one chunk.
+
+    Nodes are appended before the chunk that first uses them, and a chunk
+    is written to a temporary file and renamed, so after a crash the graph
+    on disk is whole up to its last chunk; a torn node at the end is cut
+    off on open. '''
+    def __init__(self, path, chunk_edges=CHUNK_EDGES):
+        self.logger = get_logger("LINK_GRAPH", "Worker")
+        self.path = path
+        self.chunk_edges = chunk_edges
+        self.lock = Lock()
+        self.ids = dict()   # key: node key, val: node id
+        self.new_keys = array("Q")  # nodes not written yet
+        self.new_urls = list()
+        self.offsets = array("Q", [0])  # the chunk being buffered
+        self.sources = array("I")
+        self.targets = array("I")
+        self.chunks = 0
+        self.edges = 0  # edges written to the chunks
+
+    @classmethod
+    def from_config(cls, config, restart):
+        ''' The graph of config.link_graph, open for appending, or None if
+        links are not recorded. A restart drops the nodes and edges but keeps
+        the PageRank of the last analysis, for the PRIORITY scorer. '''
+        if not config.link_graph:
+            return None
+        graph = cls(config.link_graph)
+        graph.open(restart)
+        return graph
+
+    def open(self, restart=False):
+        os.makedirs(self.path, exist_ok=True)
+        keys_file = os.path.join(self.path, NODE_KEYS)
+        urls_file = os.path.join(self.path, NODE_URLS)
+        if restart:
+            for path in chunk_paths(self.path) + [keys_file, urls_file]:
+                if os.path.exists(path):
+                    os.remove(path)
+        keys = array("Q")
+        urls = b""
+        if os.path.exists(keys_file) and os.path.exists(urls_file):
+            with open(keys_file, "rb") as f:
+                data = f.read()
+            keys.frombytes(data[:len(data) - len(data) % keys.itemsize])
+            with open(urls_file, "rb") as f:
+                urls = f.read()
+        count = min(len(keys), urls.count(b"\n"))
+        if count < len(keys) or count < urls.count(b"\n") or len(urls) and not urls.endswith(b"\n"):
+            self.logger.warning(f"Dropping torn nodes at the end of {self.path}.")
+            del keys[count:]
+            end = 0
+            for _ in range(count):
+                end = urls.index(b"\n", end) + 1
+            with open(keys_file, "wb") as f:
+                keys.tofile(f)
+            with open(urls_file, "r+b") as f:
+                f.truncate(end)
+        self.ids = dict(zip(keys, range(count)))
+        chunks = chunk_paths(self.path)
+        self.chunks = len(chunks)
+        for chunk in chunks:
+            with open(chunk, "rb") as f:
+                self.edges += CHUNK_HEAD.unpack(f.read(CHUNK_HEAD.size))[2]
+
+    def _intern(self, key, url):
+        # Called with the lock held.
+        node = self.ids.get(key)
+        if node is None:
+            node = self.ids[key] = len(self.ids)
+            self.new_keys.append(key)
+            self.new_urls.append(url)
+        return node
+
+    def record(self, url, links):
+        ''' Record the links of the page at url, as the frontier would queue
+        them. Links to the page itself are left out. '''
+        source_key = node_key(url)
+        targets = dict()    # key: node key, val: url
+        for link in links:
+            link = normalize(link)
+            if "\n" in link or "\r" in link:
+                continue
+            key = node_key(link)
+            if key != source_key:
+                targets[key] = link
+        with self.lock:
+            self.sources.append(self._intern(source_key, url))
+            for key, link in targets.items():
+                self.targets.append(self._intern(key, link))
+            self.offsets.append(len(self.targets))
+            if len(self.targets) >= self.chunk_edges:
+                self._flush()
+
+    def _flush(self):
+        # Called with the lock held.
+        if self.new_keys:
+            with open(os.path.join(self.path, NODE_KEYS), "ab") as f:
+                self.new_keys.tofile(f)
+            with open(os.path.join(self.path, NODE_URLS), "ab") as f:
+                f.write("".join(url + "\n" for url in self.new_urls).encode("utf-8"))
+            self.new_keys = array("Q")
+            self.new_urls = list()
+        if not self.sources:
+            return
+        chunk_file = os.path.join(self.path, f"{self.chunks:06d}.csr")
+        tmp_file = f"{chunk_file}.tmp"
+        with open(tmp_file, "wb") as f:
+            f.write(CHUNK_HEAD.pack(CHUNK_MAGIC, len(self.sources), len(self.targets)))
+            self.offsets.tofile(f)
+            self.sources.tofile(f)
+            self.targets.tofile(f)
+        os.replace(tmp_file, chunk_file)
+        self.chunks += 1
+        self.edges += len(self.targets)
+        self.offsets = array("Q", [0])
+        self.sources = array("I")
+        self.targets = array("I")
+
+    def __len__(self):
+        return len(self.ids)
+
+    def close(self):
+        with self.lock:
+            self._flush()
+        self.logger.info(
+            f"Link graph {self.path} holds {len(self.ids)} nodes and {self.edges} "
+            f"edges in {self.chunks} chunks.")
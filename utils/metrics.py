@@ -0,0 +1,214 @@
+import time
+
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread, Lock, Event, current_thread, get_ident
+
+# Upper bounds in seconds of the latency histogram buckets; a last bucket
+# takes everything slower.
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram(object):
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def merge(self, other):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.sum += other.sum
+
+    def quantile(self, fraction):
+        ''' Upper bound of the bucket holding the fraction quantile. '''
+        rank = fraction * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics(object):
+    ''' Counters and latency histograms of the crawl, keyed by a name and
+    labels such as stage, worker and host. Rendered as a summary log line
+    or in the Prometheus text format. '''
+    def __init__(self, prefix="crawler"):
+        self.prefix = prefix
+        self.lock = Lock()
+        self.counters = dict()      # key: (name, labels), val: total
+        self.histograms = dict()    # key: (name, labels), val: Histogram
+        self.stages = dict()        # key: thread ident, val: stage it is timing now
+        self.started = time.monotonic()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def stage(self, stage, worker=None):
+        ''' Time a with block into the stage_seconds histogram of the stage
+        and worker, the current thread's name by default. '''
+        return StageTimer(self, stage, worker)
+
+    def record_stage(self, stage, seconds, worker=None):
+        self.observe("stage_seconds", seconds, stage=stage,
+                     worker=worker or current_thread().name)
+
+    def record_host_fetch(self, host, status, seconds):
+        self.inc("host_fetches_total", host=host, status=str(status))
+        self.inc("host_fetch_seconds_total", seconds, host=host)
+
+    def summary(self):
+        ''' One line: fetch rate, then calls, mean and p50 and p99 buckets
+        per stage over all workers. '''
+        with self.lock:
+            stages = dict()
+            for (name, labels), histogram in self.histograms.items():
+                if name == "stage_seconds":
+                    stage = dict(labels)["stage"]
+                    stages.setdefault(stage, Histogram()).merge(histogram)
+        elapsed = time.monotonic() - self.started
+        downloads = stages["download"].count if "download" in stages else 0
+        parts = [f"{downloads / elapsed:.1f} fetches/sec"]
+        for stage, histogram in sorted(stages.items()):
+            count = histogram.count
+            parts.append(
+                f"{stage} {count} x {histogram.sum / count * 1000:.1f}ms "
+                f"(p50 <= {histogram.quantile(0.5) * 1000:g}ms, "
+                f"p99 <= {histogram.quantile(0.99) * 1000:g}ms)")
+        return " | ".join(parts)
+
+    def render(self):
+        ''' All metrics in the Prometheus text exposition format. '''
+        with self.lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(
+                (key, list(histogram.counts), histogram.sum)
+                for key, histogram in self.histograms.items())
+        lines = list()
+        typed = set()
+        for (name, labels), value in counters:
+            name = f"{self.prefix}_{name}"
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} counter")
+            lines.append(f"{name}{_labels(labels)} {value:g}")
+        for (name, labels), counts, total in histograms:
+            name = f"{self.prefix}_{name}"
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', str(bound)),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {total:g}")
+            lines.append(f"{name}_count{_labels(labels)} {cumulative}")
+        return "\n".join(lines) + "\n"
+
+
+class StageTimer(object):
+    ''' Times one with block; the seconds it took are kept afterwards. While
+    it runs, metrics.stages tells which stage the thread is in. '''
+    __slots__ = ("metrics", "stage", "worker", "outer", "started", "seconds")
+
+    def __init__(self, metrics, stage, worker):
+        self.metrics = metrics
+        self.stage = stage
+        self.worker = worker
+        self.seconds = 0.0
+
+    def __enter__(self):
+        stages = self.metrics.stages
+        ident = get_ident()
+        self.outer = stages.get(ident)
+        stages[ident] = self.stage
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.seconds = time.perf_counter() - self.started
+        self.metrics.record_stage(self.stage, self.seconds, self.worker)
+        if self.outer is None:
+            del self.metrics.stages[get_ident()]
+        else:
+            self.metrics.stages[get_ident()] = self.outer
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (key, str(value).replace("\\", "\\\\").replace('"', '\\"'))
+        for key, value in labels)
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+
+metrics = Metrics()  # the crawl's metrics, shared by every module of the process
+
+
+class MetricsReporter(Thread):
+    ''' Logs the metrics summary every interval seconds until stopped. '''
+    def __init__(self, metrics, logger, interval):
+        self.metrics = metrics
+        self.logger = logger
+        self.interval = interval
+        self.done = Event()
+        super().__init__(daemon=True, name="MetricsReporter")
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            self.logger.info(self.metrics.summary())
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+
+class MetricsServer(ThreadingHTTPServer):
+    ''' Serves the metrics in the Prometheus text format on GET /metrics. '''
+    daemon_threads = True
+
+    def __init__(self, metrics, port, host="127.0.0.1"):
+        self.metrics = metrics
+        super().__init__((host, port), MetricsRequestHandler)
+
+    def start(self):
+        Thread(target=self.serve_forever, daemon=True, name="MetricsServer").start()
+        return self.server_address
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/", "/metrics"):
+            self.send_error(404)
+            return
+        body = self.server.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
@@ -0,0 +1,82 @@
+import cProfile
+import os
+import pstats
+import sys
+import threading
+
+from collections import Counter
+
+from utils.metrics import metrics
+
+
+class ThreadProfiler(object):
+    ''' cProfile over every thread started while it runs, merged into one
+    pstats file. Parse pool processes are not included. '''
+    def __init__(self, path):
+        self.path = path
+        self.profiles = list()
+        self.lock = threading.Lock()
+
+    def _profile_thread(self, frame, event, arg):
+        # Called once at the start of each new thread; cProfile then takes
+        # over the thread's profile hook.
+        profile = cProfile.Profile()
+        with self.lock:
+            self.profiles.append(profile)
+        profile.enable()
+
+    def start(self):
+        main = cProfile.Profile()
+        self.profiles.append(main)
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._profile_thread)
+        # From 3.12 on cProfile is process wide, so main sees every thread.
+        main.enable()
+
+    def stop(self):
+        self.profiles[0].disable()
+        threading.setprofile(None)
+        with self.lock:
+            stats = pstats.Stats(*self.profiles)
+        stats.dump_stats(self.path)
+
+
+class SamplingProfiler(threading.Thread):
+    ''' Samples the stack of every thread each interval seconds and writes
+    the samples as folded stacks (flamegraph.pl, speedscope), rooted at the
+    metrics stage the thread was timing, or "other". '''
+    def __init__(self, path, interval=0.005):
+        self.path = path
+        self.interval = interval
+        self.stacks = Counter()     # key: (stage, frames...), val: samples
+        self.done = threading.Event()
+        super().__init__(daemon=True, name="SamplingProfiler")
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            for ident, frame in sys._current_frames().items():
+                if ident == self.ident:
+                    continue
+                frames = list()
+                while frame is not None:
+                    code = frame.f_code
+                    frames.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                frames.append(metrics.stages.get(ident, "other"))
+                self.stacks[tuple(reversed(frames))] += 1
+
+    def stop(self):
+        self.done.set()
+        self.join()
+        with open(self.path, "w") as f:
+            for stack, samples in self.stacks.most_common():
+                f.write(f"{';'.join(stack)} {samples}\n")
+
+
+def make_profiler(kind, path):
+    if kind == "cprofile":
+        return ThreadProfiler(path)
+    if kind == "sample":
+        return SamplingProfiler(path)
+    raise ValueError(f"Unknown profiler {kind}")
@@ -0,0 +1,175 @@
+import os
+import pickle
+import time
+
+from collections import Counter
+from hashlib import blake2b
+from threading import Lock
+
+from utils import get_urldigest
+
+# What a fetch of a page was, compared to the fetch before.
+NEW = "new"
+CHANGED = "changed"
+UNCHANGED = "unchanged"
+
+
+def content_fingerprint(content):
+    return int.from_bytes(blake2b(content, digest_size=8).digest(), "big")
+
+
+class PageRecord(object):
+    ''' The last fetch of one page and how often the page changed. '''
+    __slots__ = ("fingerprint", "etag", "last_modified", "first_fetched",
+                 "fetched", "interval", "visits", "changes")
+
+    def __init__(self, fingerprint, etag, last_modified, fetched, interval):
+        self.fingerprint = fingerprint
+        self.etag = etag
+        self.last_modified = last_modified
+        self.first_fetched = fetched
+        self.fetched = fetched
+        self.interval = interval    # seconds to wait before the next visit
+        self.visits = 1
+        self.changes = 0
+
+    def __getstate__(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __setstate__(self, state):
+        for name, value in zip(self.__slots__, state):
+            setattr(self, name, value)
+
+    def copy(self):
+        record = PageRecord.__new__(PageRecord)
+        record.__setstate__(self.__getstate__())
+        return record
+
+    @property
+    def change_rate(self):
+        ''' Changes seen per day since the first fetch. '''
+        days = (self.fetched - self.first_fetched) / 86400
+        return self.changes / days if days > 0 else 0.0
+
+
+class RecrawlStore(object):
+    ''' A PageRecord per url digest: a fingerprint of the content, the ETag
+    and Last-Modified headers if the cache server passed them through, when
+    the page was fetched and when it is due again. It is checkpointed to a
+    file every checkpoint_interval seconds.
+
+    The revisit interval starts at min_interval, doubles each time the page
+    is found unchanged and halves each time it changed, within
+    [min_interval, max_interval].
+
+    Unless keep_records is set, as it is with RECRAWL, no record is kept
+    and every fetch is NEW. '''
+    def __init__(self, min_interval=86400, max_interval=30 * 86400,
+                 checkpoint_file=None, checkpoint_interval=60, keep_records=True):
+        self.keep_records = keep_records
+        self.lock = Lock()
+        self.checkpoint_lock = Lock()   # one checkpoint writes the file at a time
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.pages = dict()     # key: url digest, val: PageRecord
+        self.fetches = Counter()    # key: NEW, CHANGED or UNCHANGED, val: fetches this run
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint = time.monotonic()
+
+    @classmethod
+    def from_config(cls, config, restart):
+        store = cls(config.recrawl_min_interval, config.recrawl_max_interval,
+                    config.pages_file, config.stats_checkpoint_interval, config.recrawl)
+        if os.path.exists(config.pages_file):
+            if restart:
+                os.remove(config.pages_file)
+            elif config.recrawl:
+                store.load()
+        return store
+
+    def record_fetch(self, url, content, headers=None):
+        ''' Record a fetch of the url and return whether the page is NEW,
+        CHANGED or UNCHANGED since its last fetch. Matching ETag or
+        Last-Modified headers mean unchanged without hashing the content. '''
+        if not self.keep_records:
+            with self.lock:
+                self.fetches[NEW] += 1
+            return NEW
+        headers = headers or dict()
+        etag = headers.get("ETag")
+        last_modified = headers.get("Last-Modified")
+        key = get_urldigest(url)
+        now = time.time()
+        with self.lock:
+            record = self.pages.get(key)
+        if record is None:
+            result = NEW
+            record = PageRecord(
+                content_fingerprint(content), etag, last_modified, now, self.min_interval)
+        elif (etag and etag == record.etag) or (last_modified and last_modified == record.last_modified):
+            result = UNCHANGED
+        else:
+            fingerprint = content_fingerprint(content)
+            result = UNCHANGED if fingerprint == record.fingerprint else CHANGED
+        if result != NEW:
+            # A stored record is replaced, never changed, so a checkpoint
+            # can pickle its copy of the records outside the lock.
+            record = record.copy()
+            record.etag = etag
+            record.last_modified = last_modified
+            record.fetched = now
+            record.visits += 1
+            if result == CHANGED:
+                record.fingerprint = fingerprint
+                record.changes += 1
+                record.interval = max(record.interval / 2, self.min_interval)
+            else:
+                record.interval = min(record.interval * 2, self.max_interval)
+        with self.lock:
+            self.pages[key] = record
+            self.fetches[result] += 1
+            now = time.monotonic()
+            due = self.checkpoint_file and now - self.last_checkpoint >= self.checkpoint_interval
+            if due:
+                self.last_checkpoint = now
+        if due:
+            self.checkpoint()
+        return result
+
+    def due(self, urldigest, now=None):
+        ''' Whether the page was fetched before and is due for a revisit. '''
+        with self.lock:
+            record = self.pages.get(urldigest)
+        if record is None:
+            return False
+        # Intervals were set under the bounds of an earlier run; apply today's.
+        interval = min(max(record.interval, self.min_interval), self.max_interval)
+        return record.fetched + interval <= (time.time() if now is None else now)
+
+    def counts(self):
+        with self.lock:
+            return dict(self.fetches)
+
+    def __getstate__(self):
+        # Only the records are saved; the intervals come from the config.
+        return {"pages": self.pages}
+
+    def checkpoint(self):
+        if not self.keep_records or not self.checkpoint_file:
+            return
+        with self.checkpoint_lock:
+            with self.lock:
+                store = RecrawlStore.__new__(RecrawlStore)
+                store.pages = self.pages.copy()
+            data = pickle.dumps(store, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_file = f"{self.checkpoint_file}.tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, self.checkpoint_file)
+
+    def load(self):
+        with open(self.checkpoint_file, "rb") as f:
+            saved = pickle.load(f)
+        with self.lock:
+            self.pages = saved.pages
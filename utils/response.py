@@ -1,14 +1,59 @@
 import pickle
 
+# Bytes of a pickled raw response besides the page: its url, headers and
+# the other fields of a requests.Response.
+RESPONSE_OVERHEAD = 1 << 16
+
+
+class ResponseTooLarge(Exception):
+    pass
+
+
 class Response(object):
-    def __init__(self, resp_dict):
+    ''' A cache server reply. The pickled raw response is kept as received
+    and unpickled on the first access of raw_response, which then drops
+    the pickle so the page is held once; a Response that is never looked
+    into is never unpickled.
+
+    With max_bytes, a pickled response more than RESPONSE_OVERHEAD bytes
+    larger than that is dropped before unpickling: raw_response is None and
+    error says why. '''
+    def __init__(self, resp_dict, max_bytes=0):
         self.url = resp_dict["url"]
         self.status = resp_dict["status"]
         self.error = resp_dict["error"] if "error" in resp_dict else None
-        try:
-            self.raw_response = (
-                pickle.loads(resp_dict["response"])
-                if "response" in resp_dict else
-                None)
-        except TypeError:
-            self.raw_response = None
+        self._pickled = resp_dict.get("response")
+        self._raw_response = None
+        if (max_bytes and self._pickled is not None
+                and len(self._pickled) > max_bytes + RESPONSE_OVERHEAD):
+            self.error = f"Response of {len(self._pickled)} bytes is larger than {max_bytes} bytes."
+            self._pickled = None
+
+    @property
+    def raw_response(self):
+        if self._pickled is not None:
+            pickled, self._pickled = self._pickled, None
+            try:
+                self._raw_response = pickle.loads(pickled)
+            except TypeError:
+                self._raw_response = None
+        return self._raw_response
+
+    @raw_response.setter
+    def raw_response(self, raw_response):
+        self._pickled = None
+        self._raw_response = raw_response
+
+    @property
+    def content(self):
+        ''' The page as bytes, the very object of raw_response, or None. '''
+        raw_response = self.raw_response
+        return raw_response.content if raw_response else None
+
+
+def too_large(url, status, max_bytes):
+    ''' The Response of a reply dropped before it was read. '''
+    return Response({
+        "error": f"Response of {url} is larger than {max_bytes} bytes.",
+        "status": status,
+        "url": url})
@@ -0,0 +1,114 @@
+from functools import lru_cache
+from hashlib import blake2b
+from threading import Lock
+
+BITS = 64
+
+
+@lru_cache(maxsize=1 << 16)
+def token_hash(token):
+    return int.from_bytes(blake2b(token.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def simhash(token_counts):
+    ''' 64 bit SimHash of a page, weighting every token by its count.
+
+    Weights are summed per byte value of each of the 8 hash bytes, so a
+    token costs 8 additions instead of 64; the per bit sums are read off
+    those tables once at the end. '''
+    tables = [[0] * 256 for _ in range(8)]
+    total = 0
+    for token, weight in token_counts.items():
+        h = token_hash(token)
+        total += weight
+        for table in tables:
+            table[h & 0xff] += weight
+            h >>= 8
+    fingerprint = 0
+    for byte, table in enumerate(tables):
+        for bit in range(8):
+            mask = 1 << bit
+            weight = sum(table[value] for value in range(256) if value & mask)
+            # The bit is set when more weight has it set than not.
+            if 2 * weight > total:
+                fingerprint |= 1 << (byte * 8 + bit)
+    return fingerprint
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count("1")
+
+
+class SimHashIndex(object):
+    ''' Finds a stored fingerprint within max_distance bits of a new one.
+
+    Fingerprints are cut into max_distance + 1 bands. Two fingerprints that
+    differ in at most max_distance bits agree exactly on at least one band,
+    so only the fingerprints sharing a band value are compared. '''
+    def __init__(self, max_distance=3):
+        self.max_distance = max_distance
+        band_count = max_distance + 1
+        width = BITS // band_count
+        self.bands = [
+            (i * width, (1 << (width if i < band_count - 1 else BITS - i * width)) - 1)
+            for i in range(band_count)]
+        self.tables = [dict() for _ in self.bands]
+        self.urls = dict()  # key: fingerprint, val: url of the first page with it
+        self.lock = Lock()
+
+    def __len__(self):
+        return len(self.urls)
+
+    def __getstate__(self):
+        # The band tables are rebuilt from the fingerprints on load.
+        return {"max_distance": self.max_distance, "urls": self.urls}
+
+    def __setstate__(self, state):
+        self.__init__(state["max_distance"])
+        self.urls = state["urls"]
+        for table, (shift, mask) in zip(self.tables, self.bands):
+            for fingerprint in self.urls:
+                key = (fingerprint >> shift) & mask
+                band = table.get(key)
+                if band is None:
+                    table[key] = [fingerprint]
+                else:
+                    band.append(fingerprint)
+
+    def copy(self):
+        ''' A copy to pickle, without the band tables; the caller holds
+        the lock. '''
+        index = SimHashIndex.__new__(SimHashIndex)
+        index.max_distance = self.max_distance
+        index.urls = self.urls.copy()
+        return index
+
+    def _keys(self, fingerprint):
+        return [(fingerprint >> shift) & mask for shift, mask in self.bands]
+
+    def find(self, fingerprint):
+        ''' Return the url of a near duplicate page, or None. '''
+        with self.lock:
+            return self._find(fingerprint, self._keys(fingerprint))
+
+    def _find(self, fingerprint, keys):
+        if fingerprint in self.urls:
+            return self.urls[fingerprint]
+        for table, key in zip(self.tables, keys):
+            for candidate in table.get(key, ()):
+                if hamming_distance(fingerprint, candidate) <= self.max_distance:
+                    return self.urls[candidate]
+        return None
+
+    def add_if_new(self, fingerprint, url):
+        ''' Store the fingerprint unless a near duplicate is stored already.
+        Return the url of that near duplicate, or None if it was stored. '''
+        keys = self._keys(fingerprint)
+        with self.lock:
+            duplicate = self._find(fingerprint, keys)
+            if duplicate is not None:
+                return duplicate
+            self.urls[fingerprint] = url
+            for table, key in zip(self.tables, keys):
+                table.setdefault(key, list()).append(fingerprint)
+            return None
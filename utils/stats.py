@@ -0,0 +1,201 @@
+import heapq
+import os
+import pickle
+import time
+import zlib
+
+from collections import Counter
+from threading import Lock
+
+from utils.simhash import SimHashIndex
+
+
+class CountMinSketch(object):
+    ''' Approximate counts in depth rows of width counters; a count is never
+    underestimated. Rows are hashed with crc32 from different seeds, which
+    is stable across processes so a checkpoint stays valid. '''
+    def __init__(self, width=1 << 18, depth=4):
+        self.width = width
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def add(self, key, count=1):
+        ''' Add count to key and return its new estimate. '''
+        data = key.encode("utf-8")
+        estimate = None
+        for seed, row in enumerate(self.rows):
+            index = zlib.crc32(data, seed) % self.width
+            row[index] += count
+            if estimate is None or row[index] < estimate:
+                estimate = row[index]
+        return estimate
+
+    def estimate(self, key):
+        data = key.encode("utf-8")
+        return min(row[zlib.crc32(data, seed) % self.width] for seed, row in enumerate(self.rows))
+
+    def copy(self):
+        sketch = CountMinSketch.__new__(CountMinSketch)
+        sketch.width = self.width
+        sketch.rows = [row.copy() for row in self.rows]
+        return sketch
+
+    def merge(self, other):
+        for row, other_row in zip(self.rows, other.rows):
+            for i, count in enumerate(other_row):
+                if count:
+                    row[i] += count
+
+
+class HeavyHitters(object):
+    ''' The most frequent words in bounded memory: a Count-Min sketch counts
+    every word and at most 3 * capacity candidates keep their estimates. '''
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.sketch = CountMinSketch()
+        self.candidates = dict()    # key: word, val: estimated count
+
+    def update(self, counts):
+        candidates = self.candidates
+        for word, count in counts.items():
+            candidates[word] = self.sketch.add(word, count)
+        if len(candidates) >= 3 * self.capacity:
+            # Keep the strongest candidates; pruning in batches keeps each
+            # update cheap.
+            self.candidates = dict(heapq.nlargest(
+                2 * self.capacity, candidates.items(), key=lambda item: item[1]))
+
+    def copy(self):
+        heavy_hitters = HeavyHitters.__new__(HeavyHitters)
+        heavy_hitters.capacity = self.capacity
+        heavy_hitters.sketch = self.sketch.copy()
+        heavy_hitters.candidates = self.candidates.copy()
+        return heavy_hitters
+
+    def merge(self, other):
+        self.sketch.merge(other.sketch)
+        words = set(self.candidates) | set(other.candidates)
+        self.candidates = {word: self.sketch.estimate(word) for word in words}
+        if len(self.candidates) >= 3 * self.capacity:
+            self.candidates = dict(heapq.nlargest(
+                2 * self.capacity, self.candidates.items(), key=lambda item: item[1]))
+
+    def most_common(self, n):
+        return heapq.nlargest(n, self.candidates.items(), key=lambda item: item[1])
+
+    def __len__(self):
+        return len(self.candidates)
+
+
+class CrawlStats(object):
+    ''' Statistics for report.txt, merged one page at a time under a lock and
+    checkpointed to a file every checkpoint_interval seconds. '''
+    def __init__(self, near_duplicate_distance=3, top_words_capacity=0,
+                 checkpoint_file=None, checkpoint_interval=60):
+        self.lock = Lock()
+        self.checkpoint_lock = Lock()   # one checkpoint writes the file at a time
+        self.pages = SimHashIndex(near_duplicate_distance)  # unique pages, finds near duplicates
+        self.max_tokens = 0  # words that longest page contains
+        self.longest_page_url = ""
+        # key: the word, value: freqs; approximate when a capacity is set
+        self.word_freqs = HeavyHitters(top_words_capacity) if top_words_capacity else Counter()
+        self.subdomain_pages = Counter()  # key: ics.uci.edu subdomain, val: pages crawled in it
+        self.checkpoint_file = checkpoint_file
+        self.checkpoint_interval = checkpoint_interval
+        self.last_checkpoint = time.monotonic()
+
+    @classmethod
+    def from_config(cls, config, restart):
+        stats = cls(config.near_duplicate_distance, config.top_words_capacity,
+                    config.stats_file, config.stats_checkpoint_interval)
+        if os.path.exists(config.stats_file):
+            if restart:
+                os.remove(config.stats_file)
+            else:
+                stats.load()
+        return stats
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop("lock", None)
+        state.pop("checkpoint_lock", None)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = Lock()
+        self.checkpoint_lock = Lock()
+
+    @property
+    def unique_pages(self):
+        return len(self.pages)
+
+    def record_subdomain_page(self, hostname):
+        with self.lock:
+            self.subdomain_pages[hostname] += 1
+
+    def record_page(self, url, token_counts, token_count, fingerprint):
+        ''' Merge one page. Returns False, recording nothing, when a near
+        duplicate of the page was recorded before. '''
+        if self.pages.add_if_new(fingerprint, url) is not None:
+            return False
+        with self.lock:
+            self.word_freqs.update(token_counts)
+            if token_count > self.max_tokens: # find the longest page
+                self.max_tokens = token_count
+                self.longest_page_url = url
+            now = time.monotonic()
+            due = self.checkpoint_file and now - self.last_checkpoint >= self.checkpoint_interval
+            if due:
+                self.last_checkpoint = now
+        if due:
+            self.checkpoint()
+        return True
+
+    def merge(self, other):
+        ''' Add the statistics of another crawl, e.g. of another shard. Its
+        pages that are near duplicates of ours stay in the word counts but
+        are not counted as unique. '''
+        with self.lock:
+            for fingerprint, url in other.pages.urls.items():
+                self.pages.add_if_new(fingerprint, url)
+            # Shards share one config, so both count words the same way.
+            if isinstance(self.word_freqs, Counter):
+                self.word_freqs.update(other.word_freqs)
+            else:
+                self.word_freqs.merge(other.word_freqs)
+            if other.max_tokens > self.max_tokens:
+                self.max_tokens = other.max_tokens
+                self.longest_page_url = other.longest_page_url
+            self.subdomain_pages.update(other.subdomain_pages)
+
+    def top_words(self, n):
+        with self.lock:
+            return self.word_freqs.most_common(n)
+
+    def snapshot(self):
+        ''' A copy of the statistics to pickle. Only the containers are
+        copied while the locks are held, so workers merging pages wait for
+        a few dict copies rather than for the whole pickle. '''
+        with self.lock, self.pages.lock:
+            stats = CrawlStats.__new__(CrawlStats)
+            stats.__dict__.update(self.__getstate__())
+            stats.pages = self.pages.copy()
+            stats.word_freqs = self.word_freqs.copy()
+            stats.subdomain_pages = self.subdomain_pages.copy()
+        return stats
+
+    def checkpoint(self):
+        with self.checkpoint_lock:
+            data = pickle.dumps(self.snapshot(), protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_file = f"{self.checkpoint_file}.tmp"
+            with open(tmp_file, "wb") as f:
+                f.write(data)
+            os.replace(tmp_file, self.checkpoint_file)
+
+    def load(self):
+        with open(self.checkpoint_file, "rb") as f:
+            saved = pickle.load(f)
+        with self.lock:
+            for name, value in saved.__dict__.items():
+                if name not in ("checkpoint_file", "checkpoint_interval", "last_checkpoint"):
+                    setattr(self, name, value)
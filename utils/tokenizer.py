@@ -0,0 +1,82 @@
+import re
+
+from collections import Counter
+from functools import lru_cache
+from itertools import filterfalse
+from operator import methodcaller
+
+# A token is a run of ascii letters and apostrophes that starts and ends with
+# a letter, e.g. don't.
+TOKEN_PATTERN = re.compile(r"\b[a-zA-Z][a-zA-Z']*[a-zA-Z]\b")
+
+STOP_WORDS = frozenset([
+    'a', 'about', 'above', 'after', 'again', 'against', 'all', 'am', 'an', 'and', 'any', 'are', "aren't",
+    'as', 'at', 'be', 'because', 'been', 'before', 'being', 'below', 'between', 'both', 'but', 'by',
+    "can't", 'cannot', 'could', "couldn't", 'did', "didn't", 'do', 'does', "doesn't", 'doing', "don't",
+    'down', 'during', 'each', 'few', 'for', 'from', 'further', 'had', "hadn't", 'has', "hasn't", 'have',
+    "haven't", 'having', 'he', "he'd", "he'll", "he's", 'her', 'here', "here's", 'hers', 'herself', 'him',
+    'himself', 'his', 'how', "how's", 'i', "i'd", "i'll", "i'm", "i've", 'if', 'in', 'into', 'is', "isn't",
+    'it', "it's", 'its', 'itself', "let's", 'me', 'more', 'most', "mustn't", 'my', 'myself', 'no', 'nor',
+    'not', 'of', 'off', 'on', 'once', 'only', 'or', 'other', 'ought', 'our', 'ours', 'ourselves', 'out',
+    'over', 'own', 'same', "shan't", 'she', "she'd", "she'll", "she's", 'should', "shouldn't", 'so', 'some',
+    'such', 'than', 'that', "that's", 'the', 'their', 'theirs', 'them', 'themselves', 'then', 'there',
+    "there's", 'these', 'they', "they'd", "they'll", "they're", "they've", 'this', 'those', 'through', 'to',
+    'too', 'under', 'until', 'up', 'very', 'was', "wasn't", 'we', "we'd", "we'll", "we're", "we've", 'were',
+    "weren't", 'what', "what's", 'when', "when's", 'where', "where's", 'which', 'while', 'who', "who's",
+    'whom', 'why', "why's", 'with', "won't", 'would', "wouldn't", 'you', "you'd", "you'll", "you're",
+    "you've", 'your', 'yours', 'yourself', 'yourselves'])
+
+STEMMERS = ("none", "plural", "porter")
+STEM_CACHE = 1 << 16    # distinct words whose stem is remembered
+
+_is_stop_word = STOP_WORDS.__contains__
+_group = methodcaller("group")
+
+
+def _plural_stem(word):
+    # The S stemmer: folds regular plurals onto their singular.
+    if len(word) > 3 and word.endswith("ies") and word[-4] not in "ae":
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("es") and word[-3] not in "aeo":
+        return word[:-1]
+    if len(word) > 2 and word.endswith("s") and word[-2] not in "us":
+        return word[:-1]
+    return word
+
+
+@lru_cache(maxsize=None)
+def get_stemmer(name):
+    ''' A function from a lowercase token to its stem, memoized for the
+    STEM_CACHE most recent words, or None for "none". It is made once per
+    name, so every page parsed in the process shares the memo. "porter"
+    needs nltk installed. '''
+    assert name in STEMMERS, f"stemmer should be one of {STEMMERS}"
+    if name == "none":
+        return None
+    if name == "plural":
+        return lru_cache(maxsize=STEM_CACHE)(_plural_stem)
+    from nltk.stem.porter import PorterStemmer
+    return lru_cache(maxsize=STEM_CACHE)(PorterStemmer().stem)
+
+
+def iter_tokens(text, stem=None):
+    ''' An iterator over the lowercase tokens of text that are not stop
+    words, stemmed by stem if given, that builds no list of them. '''
+    tokens = filterfalse(_is_stop_word, map(str.lower, map(_group, TOKEN_PATTERN.finditer(text))))
+    return tokens if stem is None else map(stem, tokens)
+
+
+def tokenize(text, stem=None):
+    ''' The list of tokens iter_tokens yields, found in one pass. '''
+    tokens = filterfalse(_is_stop_word, map(str.lower, TOKEN_PATTERN.findall(text)))
+    return list(tokens if stem is None else map(stem, tokens))
+
+
+def count_tokens(text, counts=None, stem=None):
+    ''' Add the tokens of text to the Counter counts, a new one if None,
+    and return it. '''
+    if counts is None:
+        counts = Counter()
+    tokens = filterfalse(_is_stop_word, map(str.lower, TOKEN_PATTERN.findall(text)))
+    counts.update(tokens if stem is None else map(stem, tokens))
+    return counts
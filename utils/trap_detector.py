@@ -0,0 +1,125 @@
+import re
+import zlib
+
+from collections import Counter
+from threading import Lock
+
+from utils.url_filter import URL_PARTS
+
+# Runs of digits, and long hex ids, vary between pages of one template.
+VARIABLE_PART = re.compile(r"[0-9a-f]{12,}|\d+")
+
+ALPHA = 0.2     # weight of the newest fetch in a template's moving yields
+LINK_TARGET = 10    # new links for a fetch to count as fully productive
+
+# Per template stats list: fetched, useful pages, content yield, link yield.
+FETCHED, USEFUL, CONTENT_YIELD, LINK_YIELD = range(4)
+
+
+def url_template(url):
+    ''' host/path?keys of the url with its numbers replaced by {n} and the
+    query values dropped, e.g. a.ics.uci.edu/events/{n}?day&month. '''
+    match = URL_PARTS.match(url)
+    if match is None:
+        return url
+    _, host, path, query = match.groups()
+    template = host.lower() + VARIABLE_PART.sub("{n}", path)
+    if query:
+        keys = sorted({pair.split("=", 1)[0] for pair in query.split("&") if pair})
+        template += "?" + "&".join(keys)
+    return template
+
+
+class TrapDetector(object):
+    ''' Spends fetches where they produce new content.
+
+    Tracks per url template how many pages were fetched, how many of them
+    were useful (new content, not a near duplicate or a low content page)
+    and moving averages of that content yield and of the new links per
+    fetch. A template with at least min_samples fetches whose yield falls
+    below min_yield is a trap and its urls are dropped; below twice
+    min_yield only a matching share of its urls is queued. Every host may
+    also have at most host_budget urls queued, 0 for no limit. Counts start
+    over with every run of the crawler. '''
+    def __init__(self, min_samples=20, min_yield=0.1, host_budget=0):
+        self.min_samples = min_samples
+        self.min_yield = min_yield
+        self.host_budget = host_budget
+        self.lock = Lock()
+        self.templates = dict()     # key: url template, val: stats list, see FETCHED
+        self.host_pages = Counter()     # key: hostname, val: urls queued
+        self.rejections = Counter()     # key: reason, val: urls rejected for it
+        self.traps = set()  # templates found to be traps
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.trap_min_samples, config.trap_min_yield, config.host_page_budget)
+
+    def _stats(self, template):
+        stats = self.templates.get(template)
+        if stats is None:
+            # The yields start at the first value seen.
+            stats = self.templates[template] = [0, 0, None, None]
+        return stats
+
+    def _update(self, stats, index, value):
+        average = stats[index]
+        stats[index] = value if average is None else average + ALPHA * (value - average)
+
+    def _yield(self, stats):
+        # A fetch without new content still pays off if it finds new links,
+        # e.g. on an index page.
+        return max(stats[CONTENT_YIELD] or 0.0, stats[LINK_YIELD] or 0.0)
+
+    def record_page(self, url, useful):
+        ''' A page of the url was fetched; useful if it had new content. '''
+        with self.lock:
+            stats = self._stats(url_template(url))
+            stats[FETCHED] += 1
+            stats[USEFUL] += useful
+            self._update(stats, CONTENT_YIELD, float(useful))
+
+    def record_links(self, url, new_links):
+        ''' The page of the url added new_links urls to the frontier. '''
+        with self.lock:
+            stats = self._stats(url_template(url))
+            self._update(stats, LINK_YIELD, min(new_links / LINK_TARGET, 1.0))
+
+    def rejection(self, url):
+        ''' Why the url should not be queued, or None to queue it. '''
+        template = url_template(url)
+        stats = self.templates.get(template)
+        if stats is not None and stats[FETCHED] >= self.min_samples:
+            marginal = self._yield(stats)
+            if marginal < self.min_yield:
+                self.traps.add(template)
+                return "trap"
+            if marginal < 2 * self.min_yield:
+                # Keep sampling the template in proportion to its yield.
+                share = (marginal - self.min_yield) / self.min_yield
+                if zlib.crc32(url.encode("utf-8")) % 1000 >= share * 1000:
+                    return "throttled"
+        return None
+
+    def admit(self, url):
+        ''' Whether to queue a url the frontier has not seen; counts it
+        against its host's budget if so. '''
+        host = URL_PARTS.match(url)
+        host = host.group(2).lower() if host else ""
+        with self.lock:
+            reason = self.rejection(url)
+            if reason is None and self.host_budget and self.host_pages[host] >= self.host_budget:
+                reason = "budget"
+            if reason is not None:
+                self.rejections[reason] += 1
+                return False
+            self.host_pages[host] += 1
+            return True
+
+    def counts(self):
+        with self.lock:
+            return dict(self.rejections)
+
+    def trap_templates(self):
+        with self.lock:
+            return sorted(self.traps)
@@ -0,0 +1,111 @@
+import re
+
+from collections import Counter
+from threading import Lock
+
+DEFAULT_DOMAINS = ["ics.uci.edu", "cs.uci.edu", "informatics.uci.edu", "stat.uci.edu"]
+
+# Increment numbers in the path: e.g /page100 | /1 | /a
+NUMBERED_PATH = re.compile(r'(/page\d+)|(/\d+)|(/[a-z]$)')
+
+# Common date formats: YYYY-MM-DD, YYYY/MM/DD, YYYYMMDD, DD-MM-YYYY, DD/MM/YYYY
+DATE_PATH = re.compile(
+    r'\d{4}-\d{2}-\d{2}|\d{4}/\d{2}/\d{2}|\d{8}|/\d{2}-\d{2}-\d{4}/|/\d{2}/\d{2}/\d{4}/')
+
+EXTENSIONS = re.compile(
+    r"\.(css|js|bmp|gif|jpe?g|ico"
+    + r"|png|tiff?|mid|mp2|mp3|mp4|mpg"
+    + r"|wav|avi|mov|mpeg|ram|m4v|mkv|ogg|ogv|pdf"
+    + r"|ps|eps|tex|ppt|pptx|doc|docx|xls|xlsx|names"
+    + r"|data|dat|exe|bz2|tar|msi|bin|7z|psd|dmg|iso"
+    + r"|epub|dll|cnf|tgz|sha1"
+    + r"|thmx|mso|arff|rtf|jar|csv"
+    + r"|rm|smil|wmv|swf|wma|zip|rar|gz"
+    + r"|json|xml|sql|yaml|ini|flv|3gp|aab|apk|webp|heic|bat|cmd|sh|txt)$")
+
+MAX_QUERY_PARAMS = 3
+
+# The fixed trap rules on the path; both on by default.
+PATH_RULES = ("numbered", "date")
+
+# Scheme, host, path and query of an absolute url in one match; cheaper than
+# urlparse, and urls it does not match are rejected anyway.
+URL_PARTS = re.compile(r"^([a-zA-Z][a-zA-Z0-9+.-]*)://(?:[^@/?#]*@)?(\[[^\]]*\]|[^:/?#]*)[^/?#]*([^?#]*)(?:\?([^#]*))?")
+
+
+class UrlFilter(object):
+    ''' Decides which urls to crawl. Built once; every rule is precompiled
+    and counts the urls it rejects. '''
+    def __init__(self, domains=DEFAULT_DOMAINS, path_rules=PATH_RULES):
+        self.domains = frozenset(domain.strip().lower().strip(".") for domain in domains)
+        self.numbered_paths = "numbered" in path_rules
+        self.date_paths = "date" in path_rules
+        self.hosts = dict()     # key: hostname, val: whether it is in the domains
+        self.rejections = Counter()     # key: rule, val: urls rejected by it
+        self.lock = Lock()
+
+    @classmethod
+    def from_config(cls, config):
+        return cls(config.domains, config.path_rules)
+
+    def in_domain(self, hostname):
+        # The host or one of its parent domains must be an allowed domain.
+        allowed = self.hosts.get(hostname)
+        if allowed is None:
+            labels = hostname.split(".")
+            allowed = any(".".join(labels[i:]) in self.domains for i in range(len(labels) - 1))
+            if len(self.hosts) < 100000:
+                self.hosts[hostname] = allowed
+        return allowed
+
+    def rejection(self, url):
+        ''' Name of the first rule rejecting the url, or None to crawl it. '''
+        match = URL_PARTS.match(url)
+        if match is None:
+            return "scheme"
+        scheme, hostname, path, query = match.groups()
+        if scheme.lower() not in ("http", "https"):
+            return "scheme"
+        # Check whether the URL is within the domains
+        if not hostname or not self.in_domain(hostname.lower()):
+            return "domain"
+        if self.numbered_paths and NUMBERED_PATH.search(path):
+            return "numbered path"
+        # Filter urls that include date (lots of urls with date are "no real data")
+        if self.date_paths and DATE_PATH.search(path):
+            return "date"
+        # Filter urls with more than 3 distinct query parameters
+        if query and query.count("&") >= MAX_QUERY_PARAMS:
+            if len({pair.split("=", 1)[0] for pair in query.split("&") if pair}) > MAX_QUERY_PARAMS:
+                return "query"
+        if EXTENSIONS.search(path.lower()):
+            return "extension"
+        return None
+
+    def is_valid(self, url):
+        rule = self.rejection(url)
+        if rule is None:
+            return True
+        with self.lock:
+            self.rejections[rule] += 1
+        return False
+
+    def filter(self, urls):
+        ''' The urls worth crawling, in order; counters are updated once. '''
+        valid = list()
+        rejections = Counter()
+        rejection = self.rejection
+        for url in urls:
+            rule = rejection(url)
+            if rule is None:
+                valid.append(url)
+            else:
+                rejections[rule] += 1
+        if rejections:
+            with self.lock:
+                self.rejections.update(rejections)
+        return valid
+
+    def counts(self):
+        with self.lock:
+            return dict(self.rejections)